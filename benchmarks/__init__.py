@@ -0,0 +1,22 @@
+"""
+Benchmarks for forgi.
+
+The benchmark classes follow the conventions of airspeed velocity (asv):
+Methods starting with `time_` are timed for every value in `params`,
+after calling `setup` with this value. `track_` methods return the value
+to report. If `setup` raises a NotImplementedError, the benchmark is skipped.
+
+Every benchmark module can be run directly, e.g.::
+
+    python -m benchmarks.bench_graph_construction
+
+The whole suite (or some modules of it) is run with::
+
+    python -m benchmarks [modules] [-b REGEX] [-o results.json]
+                         [--compare old_results.json]
+
+The results are stored as JSON together with the commit, forgi version
+and machine, so the results of two releases can be compared with
+`--compare`. The benchmarks use files from the test directory and
+have to be run from the root of the repository.
+"""
@@ -0,0 +1,104 @@
+"""
+Run the benchmark suite.
+
+Examples::
+
+    # Run all benchmarks and store the results
+    python -m benchmarks -o results-2.0.3.json
+
+    # Only the graph benchmarks, compared to an earlier run
+    python -m benchmarks bench_graph --compare results-2.0.3.json
+
+The script exits with status 1 if a benchmark became slower by more
+than the given factor (default 1.5) or failed, compared to the results
+given with --compare.
+"""
+from __future__ import print_function
+
+import argparse
+import importlib
+import os.path
+import pkgutil
+import sys
+
+from .common import (run_benchmarks, is_benchmark_class, save_results,
+                     load_results, compare_results)
+
+
+def benchmark_modules():
+    """
+    The names of all benchmark modules (bench_*) in this package.
+    """
+    path = os.path.dirname(os.path.abspath(__file__))
+    return sorted(name for _, name, _ in pkgutil.iter_modules([path])
+                  if name.startswith("bench_"))
+
+
+def benchmark_classes(module_name):
+    """
+    All benchmark classes defined in the given module.
+    """
+    module = importlib.import_module("." + module_name, __package__)
+    classes = [obj for obj in vars(module).values()
+               if is_benchmark_class(obj) and obj.__module__ == module.__name__]
+    return sorted(classes, key=lambda cls: cls.__name__)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Run the forgi benchmarks.")
+    parser.add_argument("modules", nargs="*",
+                        help="Benchmark modules to run (e.g. bench_graph). "
+                             "Default: all modules")
+    parser.add_argument("-b", "--bench", metavar="REGEX",
+                        help="Only run benchmarks ('Class.method') "
+                             "matching this regular expression")
+    parser.add_argument("-o", "--output", metavar="JSON_FILE",
+                        help="Store the results in this file")
+    parser.add_argument("--compare", metavar="JSON_FILE",
+                        help="Compare the results with an earlier run")
+    parser.add_argument("--factor", type=float, default=1.5,
+                        help="Benchmarks slower by more than this factor "
+                             "are reported as regressions. Default: 1.5")
+    parser.add_argument("--list", action="store_true",
+                        help="Only list the benchmark modules")
+    return parser
+
+
+def main(args):
+    modules = args.modules or benchmark_modules()
+    if args.list:
+        for module_name in modules:
+            print(module_name)
+        return 0
+
+    results = {}
+    for module_name in modules:
+        for cls in benchmark_classes(module_name):
+            results.update(run_benchmarks(cls, pattern=args.bench))
+    if args.output:
+        save_results(results, args.output)
+
+    if args.compare:
+        environment, old_results = load_results(args.compare)
+        print("\nCompared to commit {} ({}):".format(environment["commit"],
+                                                    environment["date"]))
+        regressions = compare_results(old_results, results, args.factor)
+        for name, old, new, ratio in regressions:
+            print("SLOWER {}: {:.6f} s -> {:.6f} s ({:.2f}x)".format(
+                name, old, new, ratio))
+        failed = [name for name in sorted(set(old_results) & set(results))
+                  if old_results[name]["value"] is not None
+                  and results[name]["value"] is None]
+        for name in failed:
+            print("FAILED {}: {}".format(name, results[name]["error"]))
+        if not regressions and not failed:
+            print("No regressions")
+            return 0
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(get_parser().parse_args()))
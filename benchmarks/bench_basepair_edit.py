@@ -0,0 +1,59 @@
+"""
+Benchmarks for changing single base pairs of a BulgeGraph.
+
+Compares add_basepair/remove_basepair with creating a new BulgeGraph
+from the changed dotbracket string. For a CoarseGrainRNA, the edits
+also discard the 3D information of the changed elements.
+"""
+from __future__ import print_function
+
+import forgi.graph.bulge_graph as fgb
+import forgi.threedee.model.coarse_grain as ftmc
+
+from .common import random_dotbracket, run_benchmarks
+
+
+class BasepairEdit(object):
+    params = [100, 1000]
+    param_names = ["length"]
+
+    def setup(self, length):
+        self.db = random_dotbracket(length)
+        self.bg = fgb.BulgeGraph.from_dotbracket(self.db)
+        pt = self.bg.to_pair_table()
+        # 20 base pairs spread over the structure
+        self.pairs = [(i, pt[i]) for i in range(1, length + 1) if pt[i] > i]
+        self.pairs = self.pairs[::max(1, len(self.pairs) // 20)]
+
+    def time_remove_and_add_basepair(self, length):
+        for i, j in self.pairs:
+            self.bg.remove_basepair(i, j)
+            self.bg.add_basepair(i, j)
+
+    def time_rebuild_from_dotbracket(self, length):
+        for i, j in self.pairs:
+            db = self.db[:i - 1] + "." + self.db[i:j - 1] + "." + self.db[j:]
+            fgb.BulgeGraph.from_dotbracket(db)
+            fgb.BulgeGraph.from_dotbracket(self.db)
+
+
+class CoarseGrainBasepairEdit(object):
+    params = ["1GID_A", "1S72_0"]
+    param_names = ["structure"]
+
+    def setup(self, structure):
+        self.cg = ftmc.CoarseGrainRNA.from_bg_file(
+            "test/forgi/threedee/data/{}.cg".format(structure))
+        self.cg.add_all_virtual_residues()
+        pt = self.cg.to_pair_table()
+        self.pairs = [(i, pt[i]) for i in range(1, len(pt)) if pt[i] > i]
+        self.pairs = self.pairs[::max(1, len(self.pairs) // 20)]
+
+    def time_remove_and_add_basepair(self, structure):
+        for i, j in self.pairs:
+            self.cg.remove_basepair(i, j)
+            self.cg.add_basepair(i, j)
+
+
+if __name__ == "__main__":
+    run_benchmarks(BasepairEdit, CoarseGrainBasepairEdit)
@@ -0,0 +1,36 @@
+"""
+Benchmarks for base-pair distances between elements.
+"""
+from __future__ import print_function
+
+import forgi.graph.bulge_graph as fgb
+
+from .common import random_dotbracket, run_benchmarks
+
+
+class BpDistances(object):
+    params = [100, 1000, 3000]
+    param_names = ["length"]
+
+    def setup(self, length):
+        self.bg = fgb.BulgeGraph.from_dotbracket(random_dotbracket(length))
+        self.elements = list(self.bg.defines.keys())
+
+    def time_min_max_bp_distance_first_call(self, length):
+        # Invalidate all caches, so the distance calculation is included.
+        self.bg._on_defines_change(None)
+        self.bg.min_max_bp_distance(self.elements[0], self.elements[-1])
+
+    def time_min_max_bp_distance_all_pairs(self, length):
+        self.bg._on_defines_change(None)
+        for e1 in self.elements:
+            for e2 in self.elements:
+                self.bg.min_max_bp_distance(e1, e2)
+
+    def time_min_max_bp_distance_matrix(self, length):
+        self.bg._on_defines_change(None)
+        self.bg.min_max_bp_distance_matrix(self.elements)
+
+
+if __name__ == "__main__":
+    run_benchmarks(BpDistances)
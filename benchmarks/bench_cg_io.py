@@ -0,0 +1,40 @@
+"""
+Benchmarks for loading coarse grained structures from the text format
+and from the binary format (forgi.threedee.model.cg_binary).
+"""
+from __future__ import print_function
+
+import os.path
+import shutil
+import tempfile
+
+import forgi.threedee.model.coarse_grain as ftmc
+
+from .common import run_benchmarks
+
+
+class LoadCg(object):
+    params = ["1GID_A.cg", "1S72_0.cg"]
+    param_names = ["filename"]
+
+    def setup(self, filename):
+        self.directory = tempfile.mkdtemp()
+        self.text_file = os.path.join("test/forgi/threedee/data", filename)
+        self.binary_file = os.path.join(self.directory, filename + "b")
+        ftmc.CoarseGrainRNA.from_bg_file(self.text_file).to_binary_file(self.binary_file)
+
+    def teardown(self, filename):
+        shutil.rmtree(self.directory)
+
+    def time_from_bg_file(self, filename):
+        ftmc.CoarseGrainRNA.from_bg_file(self.text_file)
+
+    def time_from_binary_file(self, filename):
+        ftmc.CoarseGrainRNA.from_binary_file(self.binary_file)
+
+    def time_from_binary_file_no_mmap(self, filename):
+        ftmc.CoarseGrainRNA.from_binary_file(self.binary_file, mmap_mode=None)
+
+
+if __name__ == "__main__":
+    run_benchmarks(LoadCg)
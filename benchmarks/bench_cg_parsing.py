@@ -0,0 +1,35 @@
+"""
+Benchmarks for parsing the text format of coarse grained structures.
+"""
+from __future__ import print_function
+
+import glob
+
+import forgi.threedee.model.coarse_grain as ftmc
+
+from .common import run_benchmarks
+
+
+class ParseCgFiles(object):
+    def setup(self):
+        self.cg_strings = []
+        for filename in sorted(glob.glob("test/forgi/threedee/data/*.cg")):
+            with open(filename) as f:
+                self.cg_strings.append(f.read())
+
+    def time_from_bg_string_all_test_files(self):
+        for cg_string in self.cg_strings:
+            ftmc.CoarseGrainRNA.from_bg_string(cg_string)
+
+
+class ParseLargeCgFile(object):
+    def setup(self):
+        with open("test/forgi/threedee/data/1S72_0.cg") as f:
+            self.cg_string = f.read()
+
+    def time_from_bg_string(self):
+        ftmc.CoarseGrainRNA.from_bg_string(self.cg_string)
+
+
+if __name__ == "__main__":
+    run_benchmarks(ParseCgFiles, ParseLargeCgFile)
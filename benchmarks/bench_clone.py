@@ -0,0 +1,39 @@
+"""
+Benchmarks for copying coarse grained RNAs, e.g. during sampling.
+
+Compares copy.deepcopy with CoarseGrainRNA.clone, which shares the topology
+and only copies the coordinate arrays.
+"""
+from __future__ import print_function
+
+import copy
+
+import forgi.threedee.model.coarse_grain as ftmc
+
+from .common import run_benchmarks
+
+
+class Clone(object):
+    params = ["1GID_A", "1S72_0"]
+    param_names = ["structure"]
+
+    def setup(self, structure):
+        self.cg = ftmc.CoarseGrainRNA.from_bg_file(
+            "test/forgi/threedee/data/{}.cg".format(structure))
+        self.cg.add_all_virtual_residues()
+
+    def time_deepcopy(self, structure):
+        copy.deepcopy(self.cg)
+
+    def time_clone(self, structure):
+        self.cg.clone()
+
+    def time_clone_and_modify_stem(self, structure):
+        clone = self.cg.clone()
+        start, end = clone.coords["s0"]
+        clone.coords["s0"] = (start + 1., end + 1.)
+        clone.add_all_virtual_residues()
+
+
+if __name__ == "__main__":
+    run_benchmarks(Clone)
@@ -0,0 +1,66 @@
+"""
+Benchmarks for BulgeGraphs with many strands, which have to be split
+at the cofold cutpoints.
+"""
+from __future__ import print_function
+
+import random
+
+import forgi.graph.bulge_graph as fgb
+
+from .common import random_dotbracket, run_benchmarks
+
+
+def multi_strand_dotbracket(length, num_strands, seed=0):
+    """
+    Split a random structure into strands, which are connected by base pairs.
+
+    The cutpoints are placed inside stems, hairpins and interior loops, at most
+    one per element. The nucleotides on both sides of every cutpoint are then
+    connected via the base pairs of the stem (or loop-closing stems).
+
+    :param length: The number of nucleotides.
+    :param num_strands: The number of strands.
+    :returns: A dotbracket string with '&' between the strands.
+    """
+    rng = random.Random(seed)
+    db = random_dotbracket(length, seed=seed)
+    bg = fgb.BulgeGraph.from_dotbracket(db)
+    candidates = [i for i in range(1, length)
+                  if bg.get_elem(i) == bg.get_elem(i + 1)
+                  and bg.get_elem(i)[0] in "shi"]
+    rng.shuffle(candidates)
+    cut_elements = set()
+    cutpoints = []
+    for i in candidates:
+        if len(cutpoints) == num_strands - 1:
+            break
+        if bg.get_elem(i) not in cut_elements:
+            cut_elements.add(bg.get_elem(i))
+            cutpoints.append(i)
+    if len(cutpoints) < num_strands - 1:
+        raise ValueError("Cannot split a structure of length {} into {} "
+                         "strands".format(length, num_strands))
+    cutpoints.sort()
+    return "&".join(db[start:end] for start, end
+                    in zip([0] + cutpoints, cutpoints + [length]))
+
+
+class CofoldSplitting(object):
+    # At most 52 strands are possible with one-letter chain ids.
+    params = [1000, 10000, 100000]
+    param_names = ["length"]
+
+    def setup(self, length):
+        self.db = multi_strand_dotbracket(length, 50)
+
+    def time_from_dotbracket_50_strands(self, length):
+        fgb.BulgeGraph.from_dotbracket(self.db)
+
+    def time_from_dotbracket_1_strand(self, length):
+        # For comparison: The same structure without cutpoints
+        fgb.BulgeGraph.from_dotbracket(self.db.replace("&", ""))
+
+
+if __name__ == "__main__":
+    run_benchmarks(CofoldSplitting)
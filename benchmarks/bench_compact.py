@@ -0,0 +1,70 @@
+"""
+Memory usage of many 3D structures of the same RNA.
+
+Compares a list of CoarseGrainRNA objects with a list of
+CompactCoarseGrainRNA objects sharing a single GraphTopology.
+Requires python 3 (tracemalloc).
+"""
+from __future__ import print_function
+
+import copy
+import gc
+import tracemalloc
+
+import numpy as np
+
+import forgi.threedee.model.coarse_grain as ftmc
+from forgi.graph.topology import GraphTopology
+from forgi.threedee.model.compact import CompactCoarseGrainRNA
+
+from .common import run_benchmarks
+
+
+def _allocated_bytes(create):
+    """
+    The number of bytes still allocated by the object returned by create().
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        obj = create()
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del obj
+    return after - before
+
+
+class ManyStructures(object):
+    params = [10, 100]
+    param_names = ["num_structures"]
+
+    def setup(self, num_structures):
+        self.cg = ftmc.CoarseGrainRNA.from_bg_file("test/forgi/threedee/data/1GID_A.cg")
+        self.topology = GraphTopology.from_bg(self.cg)
+        self.compact = CompactCoarseGrainRNA.from_cg(self.cg, self.topology)
+
+    def track_bytes_coarse_grain_rna(self, num_structures):
+        return _allocated_bytes(
+            lambda: [copy.deepcopy(self.cg) for _ in range(num_structures)])
+    track_bytes_coarse_grain_rna.unit = "bytes"
+
+    def track_bytes_compact(self, num_structures):
+        return _allocated_bytes(
+            lambda: [CompactCoarseGrainRNA(self.topology,
+                                           self.compact.coords.copy(),
+                                           self.compact.twists.copy())
+                     for _ in range(num_structures)])
+    track_bytes_compact.unit = "bytes"
+
+    def time_from_cg(self, num_structures):
+        CompactCoarseGrainRNA.from_cg(self.cg, self.topology)
+
+    def time_to_cg(self, num_structures):
+        self.compact.to_cg()
+
+
+if __name__ == "__main__":
+    run_benchmarks(ManyStructures)
@@ -0,0 +1,33 @@
+"""
+Benchmarks for the lookup of the element containing a nucleotide.
+"""
+from __future__ import print_function
+
+import numpy as np
+
+import forgi.graph.bulge_graph as fgb
+
+from .common import random_dotbracket, run_benchmarks
+
+
+class ElementLookup(object):
+    params = [100, 1000, 10000]
+    param_names = ["length"]
+
+    def setup(self, length):
+        self.bg = fgb.BulgeGraph.from_dotbracket(random_dotbracket(length))
+        self.positions = np.arange(1, length + 1)
+
+    def time_get_elem_all_positions(self, length):
+        # Invalidate the lookup table, so the build time is included.
+        self.bg._reset_element_lookup()
+        for i in range(1, length + 1):
+            self.bg.get_elem(i)
+
+    def time_elements_of(self, length):
+        self.bg._reset_element_lookup()
+        self.bg.elements_of(self.positions)
+
+
+if __name__ == "__main__":
+    run_benchmarks(ElementLookup)
@@ -0,0 +1,47 @@
+"""
+Benchmarks for basepair distances within an ensemble of structures
+of the same sequence.
+"""
+from __future__ import print_function
+
+import random
+
+import forgi.graph.bulge_graph as fgb
+import forgi.threedee.model.similarity as ftme
+import forgi.utilities.stuff as fus
+
+from .common import random_dotbracket, run_benchmarks
+
+
+class BasepairDistanceMatrix(object):
+    params = [100, 1000]
+    param_names = ["num_structures"]
+
+    def setup(self, num_structures):
+        # Like suboptimal structures, the ensemble shares most base pairs.
+        rng = random.Random(0)
+        pt = fus.dotbracket_to_pairtable(random_dotbracket(200))
+        self.dotbrackets = []
+        for _ in range(num_structures):
+            new_pt = list(pt)
+            for i in range(1, len(pt)):
+                if new_pt[i] > i and rng.random() < 0.2:
+                    new_pt[new_pt[i]] = new_pt[i] = 0
+            self.dotbrackets.append(fus.pairtable_to_dotbracket(new_pt))
+        self.bgs = [fgb.BulgeGraph.from_dotbracket(db) for db in self.dotbrackets[:10]]
+
+    def time_basepair_distance_10x10(self, num_structures):
+        # The old way, one pair of structures at a time.
+        for bg1 in self.bgs:
+            for bg2 in self.bgs:
+                ftme.basepair_distance(bg1, bg2)
+
+    def time_basepair_distance_matrix(self, num_structures):
+        ftme.basepair_distance_matrix(self.dotbrackets)
+
+    def time_basepair_distance_matrix_2_jobs(self, num_structures):
+        ftme.basepair_distance_matrix(self.dotbrackets, chunk_size=num_structures // 4, jobs=2)
+
+
+if __name__ == "__main__":
+    run_benchmarks(BasepairDistanceMatrix)
@@ -0,0 +1,100 @@
+"""
+Benchmarks for the hot paths of forgi.graph on synthetic structures
+of 100 to 100k nucleotides.
+"""
+from __future__ import print_function
+
+import forgi.graph.bulge_graph as fgb
+import forgi.utilities.stuff as fus
+
+from .common import random_dotbracket, run_benchmarks
+
+
+def _bpseq_string(dotbracket):
+    """
+    A bpseq string for the dotbracket string.
+
+    BulgeGraph.to_bpseq_string is too slow for the larger structures.
+    """
+    pt = fus.dotbracket_to_pairtable(dotbracket)
+    return "".join("{} N {}\n".format(i, pt[i]) for i in range(1, pt[0] + 1))
+
+
+class GraphIO(object):
+    params = [100, 1000, 10000, 100000]
+    param_names = ["length"]
+
+    def setup(self, length):
+        self.db = random_dotbracket(length)
+        self.bpseq = _bpseq_string(self.db)
+        self.bg = fgb.BulgeGraph.from_dotbracket(self.db)
+        self.bg_string = self.bg.to_bg_string()
+
+    def time_from_dotbracket(self, length):
+        fgb.BulgeGraph.from_dotbracket(self.db)
+
+    def time_from_bpseq_str(self, length):
+        fgb.BulgeGraph.from_bpseq_str(self.bpseq)
+
+    def time_from_bg_string(self, length):
+        fgb.BulgeGraph.from_bg_string(self.bg_string)
+
+    def time_to_bg_string(self, length):
+        self.bg.to_bg_string()
+
+
+class GraphQueries(object):
+    params = [100, 1000, 10000, 100000]
+    param_names = ["length"]
+
+    def setup(self, length):
+        self.bg = fgb.BulgeGraph.from_dotbracket(random_dotbracket(length))
+
+    def time_get_elem_all_positions(self, length):
+        # Invalidate all caches, so building the lookup table is included.
+        self.bg._on_defines_change(None)
+        for i in range(1, length + 1):
+            self.bg.get_elem(i)
+
+    def time_find_mlonly_multiloops(self, length):
+        self.bg._on_defines_change(None)
+        self.bg.find_mlonly_multiloops()
+
+    def time_traverse_graph(self, length):
+        self.bg._on_defines_change(None)
+        self.bg.traverse_graph()
+
+    def time_to_networkx(self, length):
+        self.bg.to_networkx()
+
+    def time_to_sparse_graph(self, length):
+        self.bg._on_defines_change(None)
+        self.bg.to_sparse_graph()
+
+
+class GraphDistances(object):
+    # Both distances use a matrix of distances between all element
+    # corners, which does not fit into memory for 100k nucleotides.
+    params = [100, 1000, 10000]
+    param_names = ["length"]
+
+    def setup(self, length):
+        self.bg = fgb.BulgeGraph.from_dotbracket(random_dotbracket(length))
+        self.elements = sorted(self.bg.defines)
+
+    def time_min_max_bp_distance(self, length):
+        self.bg._on_defines_change(None)
+        self.bg.min_max_bp_distance(self.elements[0], self.elements[-1])
+
+    def time_ss_distance(self, length):
+        self.bg._on_defines_change(None)
+        self.bg.ss_distance(self.elements[0], self.elements[-1])
+
+    def time_ss_distance_nucleotides(self, length):
+        # Nucleotides inside elements need a search on the nucleotide graph.
+        for i in range(2, length, max(1, length // 50)):
+            self.bg.ss_distance(i, length - i)
+
+
+if __name__ == "__main__":
+    run_benchmarks(GraphIO, GraphQueries, GraphDistances)
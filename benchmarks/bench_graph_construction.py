@@ -0,0 +1,30 @@
+"""
+Benchmarks for the construction of BulgeGraphs from secondary structures.
+"""
+from __future__ import print_function
+
+import forgi.graph.bulge_graph as fgb
+import forgi.utilities.stuff as fus
+from forgi.graph._graph_construction import _BulgeGraphConstruction
+
+from .common import random_dotbracket, run_benchmarks
+
+
+class GraphConstruction(object):
+    params = [100, 1000, 10000, 100000]
+    param_names = ["length"]
+
+    def setup(self, length):
+        self.db = random_dotbracket(length)
+        self.tuples = fus.pairtable_to_tuples(
+            fus.dotbracket_to_pairtable(self.db))
+
+    def time_graph_construction(self, length):
+        _BulgeGraphConstruction(self.tuples)
+
+    def time_from_dotbracket(self, length):
+        fgb.BulgeGraph.from_dotbracket(self.db)
+
+
+if __name__ == "__main__":
+    run_benchmarks(GraphConstruction)
@@ -0,0 +1,49 @@
+"""
+Benchmarks for the multiloop (junction) queries on a large rRNA.
+"""
+from __future__ import print_function
+
+import forgi.threedee.model.coarse_grain as ftmc
+
+from .common import run_benchmarks
+
+
+class JunctionQueries(object):
+    params = ["1GID_A", "1S72_0"]
+    param_names = ["structure"]
+
+    def setup(self, structure):
+        self.cg = ftmc.CoarseGrainRNA.from_bg_file(
+            "test/forgi/threedee/data/{}.cg".format(structure))
+        self.segments = [elem for elem in self.cg.defines if elem[0] in "mft"]
+        self.mls = [elem for elem in self.cg.defines
+                    if elem[0] == "m" and len(self.cg.edges[elem]) == 2]
+
+    def time_find_mlonly_multiloops(self, structure):
+        # Invalidate all caches
+        self.cg._on_defines_change(None)
+        self.cg.find_mlonly_multiloops()
+
+    def time_describe_all_multiloops(self, structure):
+        self.cg._on_defines_change(None)
+        for ml in self.cg.find_mlonly_multiloops():
+            self.cg.describe_multiloop(ml)
+
+    def time_shortest_mlonly_multiloop_all_segments(self, structure):
+        self.cg._on_defines_change(None)
+        for segment in self.segments:
+            self.cg.shortest_mlonly_multiloop(segment)
+
+    def time_get_next_ml_segment_all_segments(self, structure):
+        self.cg._on_defines_change(None)
+        for segment in self.segments:
+            self.cg.get_next_ml_segment(segment)
+
+    def time_get_bulge_angle_stats_multiloops(self, structure):
+        self.cg._on_defines_change(None)
+        for ml in self.mls:
+            self.cg.get_bulge_angle_stats(ml)
+
+
+if __name__ == "__main__":
+    run_benchmarks(JunctionQueries)
@@ -0,0 +1,85 @@
+"""
+Benchmarks for pseudoknot removal with the methods of the k2n package,
+on the bpseq files in the test data and on synthetic structures with
+many conflicting paired regions.
+"""
+from __future__ import print_function
+
+import glob
+import random
+
+import forgi._k2n_standalone.knots as fakk
+from forgi._k2n_standalone.bpseq import BpseqParser
+from forgi._k2n_standalone.rna2d import Pairs
+
+from .common import run_benchmarks
+
+
+def random_knotted_pairs(num_regions, seed=0, max_stem=6):
+    """
+    Generate randomly placed paired regions, which are mostly conflicting.
+
+    :param num_regions: The number of paired regions.
+    :returns: A Pairs object
+    """
+    rng = random.Random(seed)
+    length = num_regions * 4 * max_stem + 8
+    free = [True] * (length + 1)
+    pairs = []
+    while num_regions:
+        stem = rng.randint(1, max_stem)
+        i = rng.randint(1, length - 2 * stem - 3)
+        j = rng.randint(i + 2 * stem + 3, length)
+        positions = list(range(i, i + stem)) + list(range(j - stem + 1, j + 1))
+        if not all(free[p] for p in positions):
+            continue
+        for p in positions:
+            free[p] = False
+        pairs.extend((i + k, j - k) for k in range(stem))
+        num_regions -= 1
+    return Pairs(sorted(pairs))
+
+
+class BpseqFiles(object):
+    params = sorted(glob.glob("test/forgi/data/*.bpseq"))
+    param_names = ["filename"]
+
+    def setup(self, filename):
+        with open(filename) as f:
+            header, seq, self.pairs = BpseqParser(f)
+
+    def time_eg(self, filename):
+        fakk.eg(self.pairs, return_removed=True)
+
+    def time_ec(self, filename):
+        fakk.ec(self.pairs, return_removed=True)
+
+    def time_osp(self, filename):
+        fakk.opt_single_property(self.pairs, return_removed=True)
+
+
+class DensePseudoknots(object):
+    params = [25, 100, 200]
+    param_names = ["num_regions"]
+
+    def setup(self, num_regions):
+        self.pairs = random_knotted_pairs(num_regions)
+
+    def time_conflict_matrix(self, num_regions):
+        fakk.ConflictMatrix(self.pairs)
+
+    def time_eg(self, num_regions):
+        fakk.eg(self.pairs, return_removed=True)
+
+    def time_ec(self, num_regions):
+        fakk.ec(self.pairs, return_removed=True)
+
+    def time_osp(self, num_regions):
+        fakk.opt_single_property(self.pairs, return_removed=True)
+
+    def track_removed_base_pairs_eg(self, num_regions):
+        return len(fakk.eg(self.pairs, return_removed=True)[1])
+
+
+if __name__ == "__main__":
+    run_benchmarks(BpseqFiles, DensePseudoknots)
@@ -0,0 +1,60 @@
+"""
+Benchmarks for the search of close line segments (used by the ACC)
+with 50 to 2000 elements.
+"""
+from __future__ import print_function
+
+import numpy as np
+
+import forgi.threedee.model.coarse_grain as ftmc
+from forgi.threedee.model.linecloud import LineSegmentStorage
+
+from .common import run_benchmarks
+
+
+def random_segments(num_elements, seed=0):
+    """
+    A LineSegmentStorage with segments of 3 to 30 Angstrom,
+    packed with a density similar to that of coarse grained RNAs.
+    """
+    rng = np.random.RandomState(seed)
+    # About one element per 1500 cubic Angstrom
+    radius = (num_elements * 1500. * 3 / (4 * np.pi))**(1 / 3.)
+    starts = rng.uniform(-radius, radius, (num_elements, 3))
+    directions = rng.normal(size=(num_elements, 3))
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    ends = starts + directions * rng.uniform(3, 30, (num_elements, 1))
+    names = ["s{}".format(i) for i in range(num_elements)]
+    storage = LineSegmentStorage(names)
+    storage.set_array(names, np.stack([starts, ends], axis=1).reshape(-1, 3))
+    return storage
+
+
+class ElementsCloserThan(object):
+    params = [50, 200, 500, 1000, 2000]
+    param_names = ["num_elements"]
+
+    def setup(self, num_elements):
+        self.coords = random_segments(num_elements)
+
+    def time_elements_closer_than(self, num_elements):
+        self.coords.elements_closer_than(25.)
+
+    def track_num_hits(self, num_elements):
+        return len(self.coords.elements_closer_than(25.))
+
+
+class ElementsCloserThanRNA(object):
+    params = ["1GID_A", "1S72_0"]
+    param_names = ["structure"]
+
+    def setup(self, structure):
+        self.cg = ftmc.CoarseGrainRNA.from_bg_file(
+            "test/forgi/threedee/data/{}.cg".format(structure))
+
+    def time_elements_closer_than(self, structure):
+        self.cg.coords.elements_closer_than(25.)
+
+
+if __name__ == "__main__":
+    run_benchmarks(ElementsCloserThan, ElementsCloserThanRNA)
@@ -0,0 +1,50 @@
+"""
+Benchmarks for the conversion between dotbracket strings, pair tables
+and secondary structure elements.
+"""
+from __future__ import print_function
+
+import forgi.utilities.stuff as fus
+
+from .common import random_dotbracket, run_benchmarks
+
+
+class PairTable(object):
+    params = [1000, 100000, 1000000]
+    param_names = ["length"]
+
+    def setup(self, length):
+        self.db = random_dotbracket(length)
+        self.pt = fus.dotbracket_to_pairtable(self.db)
+
+    def time_dotbracket_to_pairtable(self, length):
+        fus.dotbracket_to_pairtable(self.db)
+
+    def time_pairtable_to_dotbracket(self, length):
+        fus.pairtable_to_dotbracket(self.pt)
+
+    def time_pairtable_to_tuples(self, length):
+        fus.pairtable_to_tuples(self.pt)
+
+    def time_pairtable_to_elements(self, length):
+        fus.pairtable_to_elements(self.pt, 0, 1, self.pt[0])
+
+
+class PairTableBatch(object):
+    params = [100, 1000]
+    param_names = ["num_structures"]
+
+    def setup(self, num_structures):
+        self.dbs = [random_dotbracket(200, seed=seed)
+                    for seed in range(num_structures)]
+
+    def time_dotbracket_to_pairtable_loop(self, num_structures):
+        for db in self.dbs:
+            fus.dotbracket_to_pairtable(db)
+
+    def time_dotbrackets_to_pairtable_array(self, num_structures):
+        fus.dotbrackets_to_pairtable_array(self.dbs)
+
+
+if __name__ == "__main__":
+    run_benchmarks(PairTable, PairTableBatch)
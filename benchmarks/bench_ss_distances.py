@@ -0,0 +1,36 @@
+"""
+Benchmarks for distances along the secondary structure.
+"""
+from __future__ import print_function
+
+import forgi.graph.bulge_graph as fgb
+
+from .common import random_dotbracket, run_benchmarks
+
+
+class SsDistances(object):
+    params = [100, 1000]
+    param_names = ["length"]
+
+    def setup(self, length):
+        self.bg = fgb.BulgeGraph.from_dotbracket(random_dotbracket(length))
+        self.elements = list(self.bg.defines.keys())
+
+    def time_ss_distance_all_pairs(self, length):
+        self.bg._on_defines_change(None)
+        for e1 in self.elements:
+            for e2 in self.elements:
+                self.bg.ss_distance(e1, e2)
+
+    def time_ss_distance_matrix(self, length):
+        self.bg._on_defines_change(None)
+        self.bg.ss_distance_matrix(self.elements)
+
+    def time_ss_distance_nucleotides(self, length):
+        self.bg._on_defines_change(None)
+        for i in range(1, length + 1, length // 20):
+            self.bg.ss_distance(i, length)
+
+
+if __name__ == "__main__":
+    run_benchmarks(SsDistances)
@@ -0,0 +1,39 @@
+"""
+Benchmarks for code that repeatedly queries the topology of a large rRNA
+(define_a, connections, get_sides, connection_type, get_link_direction).
+"""
+from __future__ import print_function
+
+import forgi.threedee.model.coarse_grain as ftmc
+
+from .common import run_benchmarks
+
+
+class TopologyQueries(object):
+    params = ["1GID_A", "1S72_0"]
+    param_names = ["structure"]
+
+    def setup(self, structure):
+        self.cg = ftmc.CoarseGrainRNA.from_bg_file(
+            "test/forgi/threedee/data/{}.cg".format(structure))
+        self.directions = self.cg.coords_to_directions()
+        self.loops = [elem for elem in self.cg.defines
+                      if elem[0] in "mi" and len(self.cg.edges[elem]) == 2]
+
+    def time_add_bulge_coords_from_stems(self, structure):
+        self.cg.add_bulge_coords_from_stems()
+
+    def time_get_bulge_angle_stats(self, structure):
+        for loop in self.loops:
+            self.cg.get_bulge_angle_stats(loop)
+
+    def time_coords_from_directions(self, structure):
+        self.cg.coords_from_directions(self.directions)
+
+    def time_define_a_all_elements(self, structure):
+        for elem in self.cg.defines:
+            self.cg.define_a(elem)
+
+
+if __name__ == "__main__":
+    run_benchmarks(TopologyQueries)
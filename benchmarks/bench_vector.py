@@ -0,0 +1,59 @@
+"""
+Benchmarks for the segment-segment distances of forgi.threedee.utilities.vector.
+"""
+from __future__ import print_function
+
+import numpy as np
+
+import forgi.threedee.utilities.vector as ftuv
+
+from .common import run_benchmarks
+
+
+def random_segment_arrays(num_segments, seed=0):
+    """
+    Starts and ends of num_segments random segments.
+    """
+    rng = np.random.RandomState(seed)
+    starts = rng.uniform(-100, 100, (num_segments, 3))
+    ends = starts + rng.normal(0, 10, (num_segments, 3))
+    return starts, ends
+
+
+class SegmentDistances(object):
+    params = [100, 10000, 1000000]
+    param_names = ["num_pairs"]
+
+    def setup(self, num_pairs):
+        self.a0, self.a1 = random_segment_arrays(num_pairs, seed=0)
+        self.b0, self.b1 = random_segment_arrays(num_pairs, seed=1)
+
+    def time_segment_distances(self, num_pairs):
+        ftuv.segment_distances(self.a0, self.a1, self.b0, self.b1)
+
+
+class LineSegmentDistanceLoop(SegmentDistances):
+    # The reference: One pair at a time
+    params = [100, 10000]
+
+    def time_segment_distances(self, num_pairs):
+        for i in range(num_pairs):
+            ftuv.line_segment_distance(self.a0[i], self.a1[i],
+                                       self.b0[i], self.b1[i])
+
+
+class SegmentDistanceMatrix(object):
+    params = [100, 1000, 3000]
+    param_names = ["num_segments"]
+
+    def setup(self, num_segments):
+        self.starts, self.ends = random_segment_arrays(num_segments)
+
+    def time_segment_distance_matrix(self, num_segments):
+        ftuv.segment_distance_matrix(self.starts, self.ends,
+                                     self.starts, self.ends)
+
+
+if __name__ == "__main__":
+    run_benchmarks(SegmentDistances, LineSegmentDistanceLoop,
+                   SegmentDistanceMatrix)
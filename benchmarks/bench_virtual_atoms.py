@@ -0,0 +1,107 @@
+"""
+Benchmarks for the calculation of all virtual atoms of a coarse grained RNA,
+e.g. for the steric value.
+
+The average atom positions of loops (threedee/data/average_atom_positions.json)
+have to be installed.
+"""
+from __future__ import print_function
+
+import json
+import os.path
+import shutil
+import tempfile
+
+import numpy as np
+
+import forgi.threedee.model.coarse_grain as ftmc
+import forgi.threedee.utilities.average_atom_positions as ftua
+import forgi.threedee.utilities.graph_pdb as ftug
+import forgi.threedee.utilities.pdb as ftup
+
+from .common import run_benchmarks
+
+
+class AllVirtualAtoms(object):
+    params = ["1GID_A", "1S72_0"]
+    param_names = ["structure"]
+
+    def setup(self, structure):
+        self.cg = ftmc.CoarseGrainRNA.from_bg_file(
+            "test/forgi/threedee/data/{}.cg".format(structure))
+        try:
+            self.cg.virtual_atom_array()
+        except IOError:
+            raise NotImplementedError("The average atom positions are missing")
+
+    def time_virtual_atom_array(self, structure):
+        self.cg.after_coordinates_changed()
+        self.cg.virtual_atom_array()
+
+    def time_virtual_atoms_lookup(self, structure):
+        # The reference: One dict per residue
+        self.cg.after_coordinates_changed()
+        lookup = ftug.virtual_atoms(self.cg)
+        for pos in range(1, self.cg.seq_length + 1):
+            lookup[pos]
+
+    def time_steric_value(self, structure):
+        self.cg.after_coordinates_changed()
+        self.cg.steric_value(["s0"])
+
+
+def random_average_atom_positions(num_elements, seed=0):
+    """
+    A dictionary like average_atom_positions.json, for hairpins
+    of length 3 to num_elements+2.
+    """
+    rng = np.random.RandomState(seed)
+    atom_names = list(ftup.nonsidechain_atoms) + [
+        "A." + aname for aname in ftup.side_chain_atoms["A"]]
+    avg_atom_poss = {}
+    for length in range(3, num_elements + 3):
+        for i in range(length):
+            for aname in atom_names:
+                key = "h {} -1 0 {} {}".format(length, i, aname)
+                avg_atom_poss[key] = list(rng.uniform(-10, 10, 3))
+    return avg_atom_poss
+
+
+class LoopAtomLookup(object):
+    # The average atom positions of all nucleotides of a hairpin
+    params = [10, 100]
+    param_names = ["num_elements"]
+
+    def setup(self, num_elements):
+        self.avg_atom_poss = random_average_atom_positions(num_elements)
+        self.tmpdir = tempfile.mkdtemp()
+        self.json_file = os.path.join(self.tmpdir, "average_atom_positions.json")
+        with open(self.json_file, "w") as f:
+            json.dump(self.avg_atom_poss, f)
+        self.npz_file = os.path.join(self.tmpdir, "average_atom_positions.npz")
+        ftua.save_table(self.avg_atom_poss, self.npz_file)
+        self.table = ftua.AverageAtomTable.from_npz(self.npz_file)
+        self.atom_names = list(ftup.nonsidechain_atoms) + [
+            "A." + aname for aname in ftup.side_chain_atoms["A"]]
+
+    def teardown(self, num_elements):
+        shutil.rmtree(self.tmpdir)
+
+    def time_load_json(self, num_elements):
+        with open(self.json_file) as f:
+            json.load(f)
+
+    def time_load_npz(self, num_elements):
+        ftua.AverageAtomTable.from_npz(self.npz_file)
+
+    def time_string_keys(self, num_elements):
+        for i in range(9):
+            for aname in self.atom_names:
+                self.avg_atom_poss["%s %s %d %d %s" % ("h", "9 -1", 0, i, aname)]
+
+    def time_element_atoms(self, num_elements):
+        self.table.element_atoms("h", (9, -1), 0)
+
+
+if __name__ == "__main__":
+    run_benchmarks(AllVirtualAtoms, LoopAtomLookup)
@@ -0,0 +1,40 @@
+"""
+Benchmarks for the generation of virtual residues, which is repeated
+after every change of the coordinates, e.g. during sampling.
+"""
+from __future__ import print_function
+
+import forgi.threedee.model.coarse_grain as ftmc
+import forgi.threedee.utilities.graph_pdb as ftug
+
+from .common import run_benchmarks
+
+
+class AddAllVirtualResidues(object):
+    params = ["1GID_A", "1S72_0"]
+    param_names = ["structure"]
+
+    def setup(self, structure):
+        self.cg = ftmc.CoarseGrainRNA.from_bg_file(
+            "test/forgi/threedee/data/{}.cg".format(structure))
+
+    def time_add_all_virtual_residues(self, structure):
+        self.cg.after_coordinates_changed()
+        self.cg.add_all_virtual_residues()
+
+    def time_add_virtual_residues_per_stem(self, structure):
+        # The reference: One stem and one base pair at a time
+        self.cg.after_coordinates_changed()
+        for stem in self.cg.stem_iterator():
+            ftug.add_virtual_residues(self.cg, stem)
+
+    def time_after_stem_moved(self, structure):
+        # The stem basis has to be recalculated for the moved stem only.
+        start, end = self.cg.coords["s0"]
+        self.cg.coords["s0"] = (start + 1., end + 1.)
+        self.cg.after_coordinates_changed()
+        self.cg.add_all_virtual_residues()
+
+
+if __name__ == "__main__":
+    run_benchmarks(AddAllVirtualResidues)
@@ -0,0 +1,217 @@
+"""
+Helper functions shared by the benchmarks.
+"""
+from __future__ import print_function, division
+
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import timeit
+
+import numpy as np
+
+
+def random_dotbracket(length, seed=0, min_stem=3, max_stem=10):
+    """
+    Generate a random, pseudoknot-free secondary structure.
+
+    :param length: The number of nucleotides.
+    :param seed: The seed for the random number generator.
+    :param min_stem, max_stem: The range of stem lengths
+    :returns: A dotbracket string of the given length.
+    """
+    rng = random.Random(seed)
+    db = ["."] * length
+    to_fill = [(0, length)]  # half-open intervals
+    while to_fill:
+        start, end = to_fill.pop()
+        stem = rng.randint(min_stem, max_stem)
+        # Space for the stem and a hairpin of at least 3 nucleotides
+        free = end - start - 2 * stem - 3
+        if free < 0:
+            continue
+        left = rng.randint(0, min(free, 5))
+        span = rng.randint(2 * stem + 3, end - start - left)
+        i = start + left
+        j = i + span - 1
+        for k in range(stem):
+            db[i + k] = "("
+            db[j - k] = ")"
+        to_fill.append((i + stem, j - stem + 1))
+        to_fill.append((j + 1, end))
+    return "".join(db)
+
+
+def _time_call(func, args, min_time=0.2):
+    """
+    Time a function call, repeating it until at least min_time seconds passed.
+
+    :returns: The best time for a single call in seconds.
+    """
+    timer = timeit.Timer(lambda: func(*args))
+    number = 1
+    while True:
+        duration = timer.timeit(number)
+        if duration >= min_time or number >= 1000:
+            break
+        number *= 10
+    return min([duration] + timer.repeat(2, number)) / number
+
+
+def _benchmark_methods(cls):
+    return sorted(m for m in dir(cls)
+                  if m.startswith("time_") or m.startswith("track_"))
+
+
+def is_benchmark_class(cls):
+    """
+    Whether cls is a class with at least one time_* or track_* method.
+    """
+    return isinstance(cls, type) and bool(_benchmark_methods(cls))
+
+
+def run_benchmarks(*benchmark_classes, **kwargs):
+    """
+    Run all time_* and track_* methods of the given benchmark classes
+    for all of their params and print the results.
+
+    Like in asv, track_* methods are called once and return the value
+    to report, e.g. a memory usage in bytes. If setup raises a
+    NotImplementedError, the benchmark is skipped for this param.
+
+    :param pattern: Only run benchmarks with a name ("Class.method")
+                    matching this regular expression.
+    :returns: A dictionary {"Class.method(param)": {"value":..., "unit":...}}.
+              The value is None for failed or skipped benchmarks.
+    """
+    pattern = kwargs.pop("pattern", None)
+    if kwargs:
+        raise TypeError("Unexpected keyword arguments {}".format(list(kwargs)))
+    results = {}
+    for cls in benchmark_classes:
+        params = getattr(cls, "params", [None])
+        for method in _benchmark_methods(cls):
+            name = "{}.{}".format(cls.__name__, method)
+            if pattern is not None and not re.search(pattern, name):
+                continue
+            for param in params:
+                key = name if param is None else "{}({})".format(name, param)
+                results[key] = _run_one(cls, method, param)
+                result = results[key]
+                if result["value"] is None:
+                    print("{}: {}".format(key, result["error"]))
+                elif method.startswith("track_"):
+                    print("{}: {} {}".format(key, result["value"], result["unit"]))
+                else:
+                    print("{}: {:.6f} s".format(key, result["value"]))
+                sys.stdout.flush()
+    return results
+
+
+def _run_one(cls, method, param):
+    """
+    Run setup, the benchmark method and teardown for a single param.
+
+    Teardown is only called, if setup succeeded.
+    """
+    bench = cls()
+    args = () if param is None else (param,)
+    try:
+        if hasattr(bench, "setup"):
+            bench.setup(*args)
+    except NotImplementedError:
+        return {"value": None, "unit": None, "error": "skipped"}
+    except Exception as e:
+        return _failed(e)
+    try:
+        if method.startswith("track_"):
+            value = getattr(bench, method)(*args)
+            unit = getattr(getattr(bench, method), "unit", "")
+        else:
+            value = _time_call(getattr(bench, method), args)
+            unit = "s"
+        return {"value": value, "unit": unit}
+    except Exception as e:
+        return _failed(e)
+    finally:
+        if hasattr(bench, "teardown"):
+            bench.teardown(*args)
+
+
+def _failed(e):
+    return {"value": None, "unit": None,
+            "error": "failed ({}: {})".format(type(e).__name__, e)}
+
+
+def environment_info():
+    """
+    Information about the machine and the code the benchmarks ran with.
+    """
+    import forgi
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.STDOUT).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"date": datetime.datetime.now().isoformat(),
+            "commit": commit,
+            "forgi_version": forgi.__version__,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "node": platform.node(),
+            "cpu_count": multiprocessing.cpu_count()}
+
+
+def save_results(results, filename):
+    """
+    Store benchmark results (from run_benchmarks) as a JSON file,
+    together with the environment_info().
+    """
+    data = {"environment": environment_info(), "results": results}
+    with open(filename, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def load_results(filename):
+    """
+    Load the results stored by save_results.
+
+    :returns: A tuple (environment, results)
+    """
+    with open(filename) as f:
+        data = json.load(f)
+    return data["environment"], data["results"]
+
+
+def compare_results(old, new, factor=1.5):
+    """
+    Compare two sets of benchmark results.
+
+    :param old, new: Dictionaries, as returned by run_benchmarks.
+    :param factor: Timings which are slower by more than this factor
+                   are regressions.
+    :returns: A list of tuples (name, old value, new value, ratio)
+              for all timing benchmarks, which became slower by
+              more than factor, sorted by name.
+    """
+    regressions = []
+    for name in sorted(set(old) & set(new)):
+        if old[name]["unit"] != "s" or new[name]["unit"] != "s":
+            continue
+        if not old[name]["value"] or new[name]["value"] is None:
+            continue
+        ratio = new[name]["value"] / old[name]["value"]
+        if ratio > factor:
+            regressions.append((name, old[name]["value"],
+                                new[name]["value"], ratio))
+    return regressions
@@ -7,6 +7,7 @@
 import json
 
 import forgi.threedee.model.coarse_grain as ftmc
+import forgi.threedee.utilities.average_atom_positions as ftua
 import forgi.threedee.utilities.graph_pdb as ftug
 import forgi.threedee.utilities.pdb as ftup
 import forgi.threedee.utilities.vector as ftuv
@@ -26,6 +27,8 @@ def main():
 
     #parser.add_option('-o', '--options', dest='some_option', default='yo', help="Place holder for a real option", type='str')
     #parser.add_option('-u', '--useless', dest='uselesss', default=False, action='store_true', help='Another useless option')
+    parser.add_option('--npz', dest='npz', default=None,
+                      help='Also store the positions as table for forgi/threedee/data/average_atom_positions.npz', type='str')
 
     (options, args) = parser.parse_args()
 
@@ -57,6 +60,9 @@ def main():
         pos = list(np.mean(poss[key], axis=0))
         avg_atom_poss[key] = pos
 
+    if options.npz is not None:
+        ftua.save_table(avg_atom_poss, options.npz)
+
     print(json.dumps(avg_atom_poss, sort_keys=True, indent=4))
 
 
@@ -73,7 +73,7 @@ def main():
                     pp.add_sphere(avg_coord, width=0.6,
                                   color_rgb=cmap(i / float(stem_len)))
                 else:
-                    coords = ftua.avg_atom_poss[identifier]
+                    coords = ftua.loop_table()[identifier]
                     pp.add_sphere(coords, width=0.2,
                                   color_rgb=cmap(i / float(stem_len)))
 
@@ -8,6 +8,7 @@
     from StringIO import StringIO
 else:
     from io import StringIO
+from io import BytesIO
 import string
 
 import numpy as np
@@ -33,6 +34,12 @@ def cg_or_bg_extention(cg):
         return ".cg"
 
 
+def to_binary(cg):
+    out = BytesIO()
+    cg.to_binary_file(out)
+    return out.getvalue()
+
+
 def bg_to_elem_string(cg):
     return fgb.BulgeGraph.to_dotbracket_string(cg) + "\n" + fgb.BulgeGraph.to_element_string(cg, with_numbers=True)
 
@@ -45,14 +52,16 @@ def to_pdb(cg):
 
 
 class OutFiletype:
-    def __init__(self, write_fun, extention_fun, rna_type):
+    def __init__(self, write_fun, extention_fun, rna_type, binary=False):
         self.convert = write_fun
         self.get_extention = extention_fun
         self.rna_type = rna_type
+        self.binary = binary
 
 
 FILETYPES = {
     "forgi": OutFiletype(to_bg_or_cg_string, cg_or_bg_extention, "any"),
+    "forgi_binary": OutFiletype(to_binary, lambda x: ".cgb", "any", binary=True),
     "bpseq": OutFiletype(fgb.BulgeGraph.to_bpseq_string, lambda x: ".bpseq", "cg"),
     "fasta": OutFiletype(fgb.BulgeGraph.to_fasta_string, lambda x: ".fa", "cg"),
     "dotbracket": OutFiletype(fgb.BulgeGraph.to_dotbracket_string, lambda x: ".dotbracket", "any"),
@@ -82,10 +91,6 @@ def __init__(self, write_fun, extention_fun, rna_type):
 
 if __name__ == "__main__":
     args = parser.parse_args()
-    with fuc.hide_traceback():
-        cgs = fuc.cgs_from_args(
-            args, rna_type=FILETYPES[args.target_type].rna_type)
-
     if args.filename:
         args.to_file = True
         if os.path.isdir(args.filename):
@@ -97,26 +102,31 @@ def __init__(self, write_fun, extention_fun, rna_type):
     else:
         filename = None
         directory = ""
-    for i, cg in enumerate(cgs):
-        if not args.to_file and i > 0:
-            print("\n\n========================================\n\n")
-        target_str = FILETYPES[args.target_type].convert(cg)
-        if args.to_file:
-            if filename:
-                if len(cgs) > 0:
+    with fuc.hide_traceback():
+        # The RNAs are loaded one at a time, while we iterate over them.
+        cgs = fuc.cgs_from_args(
+            args, rna_type=FILETYPES[args.target_type].rna_type, lazy=True)
+        for i, cg in enumerate(cgs):
+            if not args.to_file and i > 0 and not FILETYPES[args.target_type].binary:
+                print("\n\n========================================\n\n")
+            target_str = FILETYPES[args.target_type].convert(cg)
+            if args.to_file:
+                if filename:
                     fn = filename + "{:03d}".format(i + 1)
                 else:
-                    fn = filename
+                    if cg.name and cg.name != "untitled":
+                        fn = cg.name
+                    else:
+                        fn = "rna{:03d}".format(i + 1)
+                fn += FILETYPES[args.target_type].get_extention(cg)
+                fn = os.path.join(directory, fn)
             else:
-                if cg.name and cg.name != "untitled":
-                    fn = cg.name
+                fn = "-"
+            binary = FILETYPES[args.target_type].binary
+            with fuc.open_for_out(fn, args.force, "wb" if binary else "w") as outfile:
+                if binary:
+                    outfile.write(target_str)
                 else:
-                    fn = "rna{:03d}".format(i + 1)
-            fn += FILETYPES[args.target_type].get_extention(cg)
-            fn = os.path.join(directory, fn)
-        else:
-            fn = "-"
-        with fuc.open_for_out(fn, args.force) as outfile:
-            print(target_str, file=outfile)
-            if fn != "-":
-                log.info("file {} written".format(fn))
+                    print(target_str, file=outfile)
+                if fn != "-":
+                    log.info("file {} written".format(fn))
@@ -82,7 +82,10 @@
 from builtins import range
 from builtins import object
 from random import choice
-from numpy import sum, average, zeros
+from numpy import sum, average, zeros, ones, eye, array, arange, newaxis,\
+    flatnonzero, hstack, maximum, where
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
 from .rna2d import Pairs
 from .dict2d import Dict2D
 
@@ -372,7 +375,7 @@ def totalLength(self):
             PairedRegion in the list.
         """
         if self:
-            return sum(map(len, self))
+            return sum([len(pr) for pr in self])
         else:
             return 0
 
@@ -639,6 +642,40 @@ def PairedRegionsFromPairs(pairs):
     return PairedRegions(regions)
 
 
+def conflict_array(regions):
+    """Return square boolean numpy array of conflicts between regions
+
+    regions -- list of PairedRegion objects with unique IDs
+
+    Entry [a, b] is True if regions[a] and regions[b] are conflicting,
+        following the definition in PairedRegion.conflicting(). The
+        conflicts for all pairs of regions are calculated at once.
+    Overlapping regions cause a ValueError, just as in
+        PairedRegion.conflicting().
+    """
+    start = array([pr.Start for pr in regions], dtype=int)
+    end = array([pr.End for pr in regions], dtype=int)
+    length = array([pr.Length for pr in regions], dtype=int)
+    s1, s2 = start[:, newaxis], start[newaxis, :]
+    e1, e2 = end[:, newaxis], end[newaxis, :]
+    identical = eye(len(regions), dtype=bool)
+
+    # Overlap between any of the two halfregions of each region
+    halves = [(start, start + length - 1), (end - length + 1, end)]
+    overlapping = zeros((len(regions), len(regions)), dtype=bool)
+    for lo1, hi1 in halves:
+        for lo2, hi2 in halves:
+            overlapping |= ((lo1[:, newaxis] <= hi2[newaxis, :]) &
+                            (lo2[newaxis, :] <= hi1[:, newaxis]))
+    if (overlapping & ~identical).any():
+        raise ValueError("Can only handle non-overlapping regions")
+
+    not_conflicting = (((s2 > e1) & (e2 > e1)) | ((s1 > e2) & (e1 > e2)) |
+                       ((s1 < s2) & (s2 < e1) & (s1 < e2) & (e2 < e1)) |
+                       ((s2 < s1) & (s1 < e2) & (s2 < e1) & (e1 < e2)))
+    return ~(not_conflicting | identical)
+
+
 class ConflictMatrix(object):
     """Stores conflict matrix
 
@@ -654,15 +691,16 @@ def __init__(self, data):
             or anything that can be made into a Pairs object
             (e.g. a list of tuples)
 
-        This method sets the Matrix attribute to a Dict2D object containing
-            conflict information on the PairedRegions. 
+        This method sets the Conflicts attribute to a square boolean
+            array containing conflict information on the PairedRegions.
+            Ids holds the sorted region IDs, which correspond to the rows
+            and columns of the array.
         The input data is either a PairedRegions object or it is made into one.
             A ValueError will be raised when the pairs or regions are
             overlapping. Input data that can't be converted to Pairs
             will lead to downstream errors. Pairs doesn't perform
             any validation.
         Row and column IDs are the Identifiers of the PairedRegion objects.
-        The RowOrder and ColumnOrder of the Dict2D are the sorted region IDs.
         """
         if isinstance(data, PairedRegions):
             id_to_pr = data.byId()
@@ -675,28 +713,46 @@ def __init__(self, data):
             except:
                 raise ValueError("Can't convert data to Pairs")
 
-        # handle the rows and columns in order and set RowOrder and ColOrder
-        ro = list(id_to_pr.keys())
-        ro.sort()
-        co = list(id_to_pr.keys())
-        co.sort()
-        conf = {}  # dict of conflicts between blocks
-        for id1, bl in id_to_pr.items():
-            for id2, bl2 in id_to_pr.items():
-                if id2 < id1:  # minimize number of calculations
-                    continue
-                if id1 not in conf:
-                    conf[id1] = {}
-                if id2 not in conf:
-                    conf[id2] = {}
-                if id1 == id2:
-                    conf[id1][id2] = False
-                    conf[id2][id1] = False
-                    continue
-                is_conflicting = bl.conflicting(bl2)
-                conf[id1][id2] = is_conflicting
-                conf[id2][id1] = is_conflicting
-        self.Matrix = Dict2D(conf, RowOrder=ro, ColOrder=co)  # create Dict2D
+        ids = list(id_to_pr.keys())
+        ids.sort()
+        self._set(ids, conflict_array([id_to_pr[i] for i in ids]))
+
+    def _set(self, ids, conflicts):
+        """Set the region IDs and the boolean array of conflicts
+        """
+        self.Ids = ids
+        self.Conflicts = conflicts
+        self._index = dict((pr_id, k) for k, pr_id in enumerate(ids))
+        self._matrix = None
+
+    @property
+    def Matrix(self):
+        """Dict2D object with the conflicts, created on first access
+
+        The RowOrder and ColumnOrder of the Dict2D are the sorted region IDs.
+        """
+        if self._matrix is None:
+            conf = {}
+            for id1, row in zip(self.Ids, self.Conflicts.tolist()):
+                conf[id1] = dict(zip(self.Ids, row))
+            self._matrix = Dict2D(conf, RowOrder=list(self.Ids),
+                                  ColOrder=list(self.Ids))
+        return self._matrix
+
+    def indices(self, pr_ids):
+        """Return array of row indices for a list of region IDs
+        """
+        return array([self._index[pr_id] for pr_id in pr_ids], dtype=int)
+
+    def withoutRegion(self, pr_id):
+        """Return new ConflictMatrix without the region pr_id
+        """
+        keep = ones(len(self.Ids), dtype=bool)
+        keep[self._index[pr_id]] = False
+        result = ConflictMatrix.__new__(ConflictMatrix)
+        result._set([i for i in self.Ids if i != pr_id],
+                    self.Conflicts[keep][:, keep])
+        return result
 
     def conflictsOf(self, pr_id):
         """Return list of region IDs for regions that conflict with pr_id
@@ -706,60 +762,36 @@ def conflictsOf(self, pr_id):
         Input is ID of a particular region, return value are the IDs of
             all regions that conflict with the given region.
         """
-        return [k for k, v in self.Matrix[pr_id].items() if v is True]
+        row = self.Conflicts[self._index[pr_id]]
+        return [self.Ids[k] for k in flatnonzero(row)]
 
     def conflicting(self):
         """Return list of region IDs for conflicting regions
         """
-        result = []
-        cm = self.Matrix
-        for pr_id in cm.RowOrder:
-            if contains_true(list(cm[pr_id].values())):
-                result.append(pr_id)
-        return result
+        has_conflicts = self.Conflicts.any(axis=1)
+        return [self.Ids[k] for k in flatnonzero(has_conflicts)]
 
     def nonConflicting(self):
         """Return list of region IDs for non-conflicting regions
         """
-        result = []
-        cm = self.Matrix
-        for pr_id in cm.RowOrder:
-            if not contains_true(list(cm[pr_id].values())):
-                result.append(pr_id)
-        return result
+        has_conflicts = self.Conflicts.any(axis=1)
+        return [self.Ids[k] for k in flatnonzero(~has_conflicts)]
 
     def conflictCliques(self):
         """Return list of lists with IDs of mutually conflicting regions
 
         See documentation on PairedRegions.conflictCliques for more details.
+        The cliques are the connected components of the conflict graph,
+            ordered by their lowest region ID.
         """
-        cm = self.Matrix
-
-        cliques = []
-        seen = {}
-
-        for pr_id in cm.RowOrder:
-            if pr_id in seen:
-                continue
-            todo = set([pr_id])
-            done = set()
-            while todo != done:
-                collection = []  # collection of conflicts
-                for i in todo:
-                    if i in done:  # no need to do them twice
-                        continue
-                    conf = []  # conflicting regions
-                    for k, v in cm[i].items():
-                        if v is True:
-                            conf.append(k)
-                    collection.extend(conf)  # add conflict to collection
-                    done.add(i)  # register that i is done
-                todo.update(collection)  # update todo
-            if len(done) > 1:
-                cliques.append(list(done))
-            for i in done:
-                seen[i] = True
-        return cliques
+        if not self.Ids:
+            return []
+        num, labels = connected_components(csr_matrix(self.Conflicts),
+                                           directed=False)
+        cliques = [[] for _ in range(num)]
+        for pr_id, label in zip(self.Ids, labels):
+            cliques[label].append(pr_id)
+        return [cl for cl in cliques if len(cl) > 1]
 
 # =============================================================================
 # SCORING FUNCTIONS FOR DYNAMIC PROGRAMMING APPROACH
@@ -868,7 +900,7 @@ def pick_multi_best(candidates, goal='max'):
     seen = {}
     # Candidates have to be processed in order of length
     can_len = [(c.totalLength(), c) for c in candidates]
-    can_len.sort()
+    can_len.sort(key=lambda x: x[0])
     can_len.reverse()
     for l, c in can_len:
         c_ids = tuple(c.sortedIds())
@@ -1044,6 +1076,102 @@ def dp_matrix_multi(paired_regions, goal='max', scoring_function=num_bps):
     return result
 
 
+def dp_single_best(paired_regions):
+    """Return PairedRegions object with the best nested subset of regions
+
+    paired_regions -- PairedRegions object, the Score of each region
+        has to be set.
+
+    This function is a helper function of opt_single_property.
+    It returns the nested subset of paired_regions with the maximum
+        total score. Ties are broken by the properties used in
+        opt_single_property: the minimum number of regions, then the
+        minimum total range, then the minimum total start value.
+    Like in dp_matrix_multi, there is one row and column for each start
+        and end point of each region. Instead of a list of all optimal
+        solutions, each cell stores these four values in numpy arrays,
+        together with the choice that led to them. The cells are filled
+        one diagonal at a time: cell (i,j) is either the region
+        starting at i and ending at j plus the cell (i+1,j-1), or the
+        combination of the cells (i,k) and (k+1,j) for i <= k < j.
+        The solution is obtained by a traceback from the top-right cell.
+    """
+    prs = paired_regions
+    boundaries = prs.boundaries()
+    num_cells = len(boundaries)
+    inv_enum_boundaries = prs.invertedEnumeratedBoundaries()
+    # region_at[i] is the region starting at boundary i and
+    # closing[i] the index of its end point (or -1)
+    closing = -ones(num_cells, dtype=int)
+    region_at = {}
+    for pr in prs:
+        begin_idx = inv_enum_boundaries[pr.Start]
+        closing[begin_idx] = inv_enum_boundaries[pr.End]
+        region_at[begin_idx] = pr
+
+    # score, number of regions, total range and total start of the
+    # best solution for the boundaries i to j. Lower triangle is empty.
+    score = zeros((num_cells, num_cells),
+                  dtype=array([pr.Score for pr in prs]).dtype)
+    count = zeros((num_cells, num_cells), dtype=int)
+    ranges = zeros((num_cells, num_cells), dtype=int)
+    starts = zeros((num_cells, num_cells), dtype=int)
+    choice = zeros((num_cells, num_cells), dtype=int)
+    region_score = zeros(num_cells, dtype=score.dtype)
+    region_range = zeros(num_cells, dtype=int)
+    region_start = zeros(num_cells, dtype=int)
+    for begin_idx, pr in region_at.items():
+        region_score[begin_idx] = pr.Score
+        region_range[begin_idx] = pr.range()
+        region_start[begin_idx] = pr.Start
+
+    for width in range(1, num_cells):
+        i = arange(num_cells - width)
+        j = i + width
+        # columns 0..width-1: split after k=i+column, column width: region
+        k = i[:, newaxis] + arange(width)[newaxis, :]
+        is_region = closing[i] == j
+        inner = (i + 1, maximum(j - 1, i))
+        cand = []
+        for table, region_value in ((score, region_score),
+                                    (count, is_region.astype(int)),
+                                    (ranges, region_range),
+                                    (starts, region_start)):
+            split = table[i[:, newaxis], k] + table[k + 1, j[:, newaxis]]
+            paired = table[inner] + region_value[i]
+            cand.append(hstack([split, paired[:, newaxis]]))
+        cand_score, cand_count, cand_range, cand_start = cand
+        best = cand_score[:, :width].max(axis=1)
+        best = where(is_region, maximum(best, cand_score[:, width]), best)
+        valid = cand_score == best[:, newaxis]
+        valid[:, width] &= is_region
+        for values in (cand_count, cand_range, cand_start):
+            lowest = where(valid, values, values.max() + 1).min(axis=1)
+            valid &= values == lowest[:, newaxis]
+        column = valid.argmax(axis=1)
+        rows = arange(len(i))
+        score[i, j] = cand_score[rows, column]
+        count[i, j] = cand_count[rows, column]
+        ranges[i, j] = cand_range[rows, column]
+        starts[i, j] = cand_start[rows, column]
+        choice[i, j] = column
+
+    result = PairedRegions()
+    todo = [(0, num_cells - 1)]
+    while todo:
+        begin_idx, end_idx = todo.pop()
+        if begin_idx >= end_idx or count[begin_idx, end_idx] == 0:
+            continue
+        column = choice[begin_idx, end_idx]
+        if column == end_idx - begin_idx:
+            result.append(region_at[begin_idx])
+            todo.append((begin_idx + 1, end_idx - 1))
+        else:
+            todo.append((begin_idx, begin_idx + column))
+            todo.append((begin_idx + column + 1, end_idx))
+    return result
+
+
 def matrix_solutions(paired_regions, goal='max', scoring_function=num_bps):
     """Return the list of solutions in the top-right cell of the DP matrix
 
@@ -1197,6 +1325,44 @@ def opt_single_property(pairs, return_removed=False, goal='max',
         function. If one specifies for example goal='max' and 
         scoring_function=num_bps, the routine finds the nested structures
         with the maximum number of base pairs.
+    If all regions have a positive score and the goal is 'max', the
+        structure is calculated directly by dp_single_best instead of
+        enumerating all optimal structures.
+    """
+    if not pairs.hasPseudoknots():
+        if return_removed:
+            return pairs, Pairs()
+        return pairs
+
+    prs = PairedRegionsFromPairs(pairs)
+    for pr in prs:
+        pr.score(scoring_function)
+    if goal != 'max' or min([pr.Score for pr in prs]) <= 0:
+        return _opt_single_property_from_all(pairs, return_removed, goal,
+                                             scoring_function)
+
+    cm = ConflictMatrix(prs)
+    result = prs.nonConflicting(cm=cm)
+    for cl in prs.conflictCliques(cm=cm):
+        result.extend(dp_single_best(cl))
+    nested = result.toPairs()
+    if return_removed:
+        kept = dict.fromkeys([pr.Id for pr in result])
+        removed = []
+        for pr in prs:
+            if pr.Id not in kept:
+                removed.extend(pr.Pairs)
+        removed.sort()
+        return nested, removed
+    return nested
+
+
+def _opt_single_property_from_all(pairs, return_removed, goal,
+                                  scoring_function):
+    """Return result of opt_single_property by enumerating all solutions
+
+    See opt_single_property. All optimal solutions are calculated with
+        opt_all and the one with the best properties is returned.
     """
     nested_structs = opt_all(pairs, return_removed, goal,
                              scoring_function)
@@ -1250,36 +1416,16 @@ def find_max_conflicts(conflicting_ids, cm, id_to_pr):
         regions. Return the one with the minimum gain. If both properties
         are equal, return the region that starts closest to the 3' end.
     """
-    number_of_conflicts = {}
-    for pr_id in conflicting_ids:
-        noc = len(cm.conflictsOf(pr_id))
-        if noc not in number_of_conflicts:
-            number_of_conflicts[noc] = []
-        number_of_conflicts[noc].append(pr_id)
-    max_noc = max(number_of_conflicts.keys())
-    max_ids = number_of_conflicts[max_noc]
-    if len(max_ids) == 1:
-        return max_ids[0]
-    else:
-        len_diffs = {}
-        for pr_id in max_ids:
-            pr_len = id_to_pr[pr_id].Length
-            conf_len = sum([id_to_pr[i].Length for i in cm.conflictsOf(pr_id)])
-            diff = pr_len - conf_len
-            if diff not in len_diffs:
-                len_diffs[diff] = []
-            len_diffs[diff].append(pr_id)
-        min_ld = min(len_diffs.keys())
-        min_ids = len_diffs[min_ld]
-        if len(min_ids) == 1:
-            return min_ids[0]
-        else:
-            start_vals = {}
-            for pr_id in min_ids:
-                start = id_to_pr[pr_id].Start
-                start_vals[start] = pr_id
-            max_start = max(start_vals.keys())
-            return start_vals[max_start]
+    idx = cm.indices(conflicting_ids)
+    noc, diff, starts = _conflict_properties(idx, cm, id_to_pr)
+    max_noc = noc == noc.max()
+    if max_noc.sum() == 1:
+        return conflicting_ids[flatnonzero(max_noc)[0]]
+    min_ld = max_noc & (diff == diff[max_noc].min())
+    if min_ld.sum() == 1:
+        return conflicting_ids[flatnonzero(min_ld)[0]]
+    candidates = flatnonzero(min_ld)
+    return conflicting_ids[candidates[starts[candidates].argmax()]]
 
 
 def find_min_gain(conflicting_ids, cm, id_to_pr):
@@ -1301,36 +1447,36 @@ def find_min_gain(conflicting_ids, cm, id_to_pr):
         is returned. If both properties are equal, the method returns the
         region that starts closest to the 3' end.
     """
-    len_diffs = {}
-    for pr_id in conflicting_ids:
-        pr_len = id_to_pr[pr_id].Length
-        conf_len = sum([id_to_pr[i].Length for i in cm.conflictsOf(pr_id)])
-        diff = pr_len - conf_len
-        if diff not in len_diffs:
-            len_diffs[diff] = []
-        len_diffs[diff].append(pr_id)
-    min_ld = min(len_diffs.keys())
-    min_ids = len_diffs[min_ld]
-    if len(min_ids) == 1:
-        return min_ids[0]
-    else:
-        number_of_conflicts = {}
-        for pr_id in min_ids:
-            noc = len(cm.conflictsOf(pr_id))
-            if noc not in number_of_conflicts:
-                number_of_conflicts[noc] = []
-            number_of_conflicts[noc].append(pr_id)
-        max_noc = max(number_of_conflicts.keys())
-        max_ids = number_of_conflicts[max_noc]
-        if len(max_ids) == 1:
-            return max_ids[0]
-        else:
-            start_vals = {}
-            for pr_id in min_ids:
-                start = id_to_pr[pr_id].Start
-                start_vals[start] = pr_id
-            max_start = max(start_vals.keys())
-            return start_vals[max_start]
+    idx = cm.indices(conflicting_ids)
+    noc, diff, starts = _conflict_properties(idx, cm, id_to_pr)
+    min_ld = diff == diff.min()
+    if min_ld.sum() == 1:
+        return conflicting_ids[flatnonzero(min_ld)[0]]
+    max_noc = min_ld & (noc == noc[min_ld].max())
+    if max_noc.sum() == 1:
+        return conflicting_ids[flatnonzero(max_noc)[0]]
+    # All regions with the minimum gain are compared on their start
+    candidates = flatnonzero(min_ld)
+    return conflicting_ids[candidates[starts[candidates].argmax()]]
+
+
+def _conflict_properties(idx, cm, id_to_pr):
+    """Return arrays of number of conflicts, gain, and start of regions
+
+    idx -- array of row indices in the ConflictMatrix cm
+    cm -- ConflictMatrix object
+    id_to_pr -- dict of {region ID: PairedRegion}
+
+    Helper function for find_max_conflicts and find_min_gain.
+    Gain is the length of the region minus the cumulative length
+        of all of its conflicting regions.
+    """
+    lengths = array([id_to_pr[i].Length for i in cm.Ids], dtype=int)
+    rows = cm.Conflicts[idx]
+    noc = rows.sum(axis=1)
+    diff = lengths[idx] - rows.dot(lengths)
+    starts = array([id_to_pr[cm.Ids[k]].Start for k in idx], dtype=int)
+    return noc, diff, starts
 
 
 def add_back_non_conflicting(paired_regions, removed):
@@ -1350,28 +1496,28 @@ def add_back_non_conflicting(paired_regions, removed):
     """
     id_to_pr = paired_regions.byId()
     new_removed = removed.copy()
+    if not new_removed:
+        return PairedRegions(list(id_to_pr.values())), new_removed
+
+    cm = ConflictMatrix(PairedRegions(list(id_to_pr.values()) +
+                                      list(new_removed.values())))
+    in_solution = zeros(len(cm.Ids), dtype=bool)
+    in_solution[cm.indices(list(id_to_pr.keys()))] = True
 
     added = True
-    # process removed from 5' to 3'
-    order = [(pr.Start, pr.Id) for pr in new_removed.values()]
-    order.sort()  # from low start value to high start value
     while added:
         added = False
-        for start, region_id in order:
-            pr1 = new_removed[region_id]
-            is_conflicting = False
-            for pr2 in id_to_pr.values():
-                if pr1.conflicting(pr2):
-                    is_conflicting = True
-                    new_removed[region_id] = pr1
-                    break
-            if not is_conflicting:
-                id_to_pr[region_id] = pr1
-                del new_removed[region_id]
-                order = [(pr.Start, pr.Id) for pr in new_removed.values()]
-                order.sort()  # from low start value to high start value
-                added = True
-                break
+        # process removed from 5' to 3'
+        order = [(pr.Start, pr.Id) for pr in new_removed.values()]
+        order.sort()  # from low start value to high start value
+        order_idx = cm.indices([region_id for start, region_id in order])
+        is_conflicting = cm.Conflicts[order_idx][:, in_solution].any(axis=1)
+        if not is_conflicting.all():
+            first = flatnonzero(~is_conflicting)[0]
+            region_id = order[first][1]
+            id_to_pr[region_id] = new_removed.pop(region_id)
+            in_solution[order_idx[first]] = True
+            added = True
 
     return PairedRegions(list(id_to_pr.values())), new_removed
 
@@ -1415,11 +1561,11 @@ def conflict_elimination(pairs, sel_function, add_back=True,
     conf = cm.conflicting()
     while conf:
         to_remove = sel_function(conf, cm, id_to_pr)
-        removed[to_remove] = id_to_pr[to_remove]
-        prs.remove(id_to_pr[to_remove])
-        id_to_pr = prs.byId()
-        cm = ConflictMatrix(prs)
+        removed[to_remove] = id_to_pr.pop(to_remove)
+        # The conflicts between the remaining regions do not change
+        cm = cm.withoutRegion(to_remove)
         conf = cm.conflicting()
+    prs = PairedRegions([pr for pr in prs if pr.Id not in removed])
     # potential circular removal: add regions back in
     if add_back:
         # collect IDs of non-conflicting removed regions
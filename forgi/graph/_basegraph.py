@@ -1,7 +1,10 @@
 from collections import defaultdict
+import functools
 import logging
 import itertools as it
 
+import numpy as np
+
 from ..utilities.exceptions import GraphIntegrityError
 
 log = logging.getLogger(__name__)
@@ -12,6 +15,37 @@
     profile = lambda x: x
 
 
+def topology_memoized(method):
+    """
+    Memoize a method of a graph, whose result only depends on the defines
+    and edges (and the arguments).
+
+    The memo is discarded, whenever the structure version of the graph
+    changes (see BaseGraph._topology_memo). List arguments are converted to
+    tuples for the lookup and lists are returned as copies, so the caller
+    may modify the result.
+    """
+    name = method.__name__
+
+    @functools.wraps(method)
+    def memoized(self, *args, **kwargs):
+        memo = self._topology_memo()
+        if memo is None:
+            return method(self, *args, **kwargs)
+        key = (name,) + tuple(tuple(arg) if isinstance(arg, list) else arg
+                              for arg in args)
+        if kwargs:
+            key += tuple(sorted(kwargs.items()))
+        try:
+            result = memo[key]
+        except KeyError:
+            result = memo[key] = method(self, *args, **kwargs)
+        if isinstance(result, list):
+            return list(result)
+        return result
+    return memoized
+
+
 class BaseGraph(object):
     """
     A Base-class for the BulgeGraph and BulgeGraphConstruction.
@@ -23,11 +57,31 @@ class BaseGraph(object):
 
     It has no sequence.
     """
+    #: Lazily built lookup table nucleotide -> element. See `_element_lookup`
+    _elem_lookup = None
+    #: Incremented whenever the defines or edges change. None for graphs
+    #: that do not track changes. Those are never memoized.
+    _structure_version = None
+    _memo = None
+    _memo_version = None
 
     def __init__(self):
         self.defines = {}
         self.edges = defaultdict(set)
 
+    def _topology_memo(self):
+        """
+        The dictionary used by methods decorated with topology_memoized,
+        or None if the graph does not track changes of its structure.
+        """
+        if self._structure_version is None:
+            return None
+        if self._memo_version != self._structure_version:
+            self._memo = {}
+            self._memo_version = self._structure_version
+        return self._memo
+
+    @topology_memoized
     def connections(self, bulge):
         """
         :param g: Graph-like: A BulgeGraph or BulgeGraphConstruction.
@@ -84,7 +138,8 @@ def flanking_nucleotides(self, d):
                   set_adjacent, set_not_adjacent, flanking)
         return flanking
 
-    def _define_a_zerolength(self, elem):  # TODO speed-up by caching
+    @topology_memoized
+    def _define_a_zerolength(self, elem):
         """
         Return the define with adjacent nucleotides for a zero-length element.
 
@@ -146,6 +201,7 @@ def _zerolen_defines_a_between(self, stem1, stem2):
         log.debug("Returning zl-coordinates: %s", zl_coordinates)
         return zl_coordinates
 
+    @topology_memoized
     def _get_sides_plus(self, s1, bulge):
         """
         Get the side of s1 that is next to b.
@@ -189,16 +245,66 @@ def _get_sides_plus(self, s1, bulge):
 
     def get_node_from_residue_num(self, base_num):
         """
-        Iterate over the defines and see which one encompasses this base.
+        Return the element which contains the nucleotide base_num.
+
+        :param base_num: A 1-based nucleotide number
         """
-        seq_id = False
-        for key in self.defines:
-            for drange in self.define_range_iterator(key):
-                if drange[0] <= base_num <= drange[1]:
-                    return key
+        index, names = self._element_lookup()
+        if 0 < base_num < len(index) and index[base_num] >= 0:
+            return names[index[base_num]]
         raise LookupError(
             "Base number {} not found in the defines {}.".format(base_num, self.defines))
 
+    def elements_of(self, positions):
+        """
+        Vectorized version of get_node_from_residue_num.
+
+        :param positions: An array-like of 1-based nucleotide numbers
+        :returns: A numpy array (dtype object) of element names,
+                  with the same shape as positions.
+        """
+        index, names = self._element_lookup()
+        positions = np.asarray(positions, dtype=int)
+        if positions.size:
+            if positions.min() < 1 or positions.max() >= len(index):
+                raise LookupError("Base numbers out of range 1-{}: {}".format(
+                    len(index) - 1, positions))
+            elem_ids = index[positions]
+            if np.any(elem_ids < 0):
+                raise LookupError("Base numbers {} not found in the defines {}.".format(
+                    positions[elem_ids < 0], self.defines))
+        else:
+            elem_ids = np.zeros(positions.shape, dtype=int)
+        return names[elem_ids]
+
+    def _element_lookup(self):
+        """
+        The per-nucleotide element index.
+
+        :returns: A tuple (index, names), where index is an integer array of
+                  length seq_length+1 that holds, for every nucleotide, the
+                  position of its element in the object array names (-1
+                  for nucleotides not in any define).
+        """
+        if self._elem_lookup is None:
+            names = list(self.defines.keys())
+            length = max([max(d) for d in self.defines.values() if d] or [0])
+            index = np.full(length + 1, -1, dtype=int)
+            # Reversed, so in the (invalid) case of overlapping defines the
+            # first element wins, like in a linear search.
+            for i in reversed(range(len(names))):
+                for from_, to_ in self.define_range_iterator(names[i]):
+                    index[from_:to_ + 1] = i
+            self._elem_lookup = (index, np.array(names, dtype=object))
+        return self._elem_lookup
+
+    def _reset_element_lookup(self, key=None):
+        """
+        Invalidate the per-nucleotide element index.
+        Called, whenever the defines change.
+        """
+        self._elem_lookup = None
+
     def define_range_iterator(self, node, adjacent=False):
         """
         Return the ranges of the nucleotides in the define.
@@ -0,0 +1,430 @@
+"""
+Add or remove single base pairs of a BulgeGraph without rebuilding it.
+
+The elements are derived from the pair table like in _graph_construction:
+Stems are maximal runs of stacked base pairs and loops are the backbone
+segments between two paired nucleotides. A segment is identified by its
+flanking paired nucleotides (left, right), where 0 and seq_length+1 stand
+for the ends of the chain.
+
+Changing the base pair (i, j) only changes the segments touching i and j
+and the stems containing i, j and their stacked neighbors. Through the
+pairing of the two strands of interior loops, the classification of a few
+more segments may change. Only the elements containing these segments and
+stems are replaced, all other elements keep their names.
+"""
+from __future__ import absolute_import, division, print_function
+
+import logging
+
+import numpy as np
+
+from ..utilities import stuff as fus
+from ._graph_construction import _BulgeGraphConstruction
+
+log = logging.getLogger(__name__)
+
+# This module belongs to the BulgeGraph machinery and is allowed to access its private members
+# pylint: disable=protected-access
+
+
+def add_basepair(bg, i, j):
+    """
+    Add the base pair (i, j). See BulgeGraph.add_basepair
+    """
+    pt = bg._get_pair_table()
+    i, j = _check_positions(pt, i, j)
+    if pt[i] or pt[j]:
+        raise ValueError("Cannot add basepair ({}, {}): Nucleotide {} is already "
+                         "paired.".format(i, j, i if pt[i] else j))
+    new_pt = list(pt)
+    new_pt[i] = j
+    new_pt[j] = i
+    if bg.backbone_breaks_after:
+        return _rebuild(bg, new_pt)
+    old_stems = set()
+    # The new base pair is stacked onto these stems.
+    if i > 1 and pt[i - 1] == j + 1:
+        old_stems.add(bg.get_node_from_residue_num(i - 1))
+    if i + 1 < j - 1 and pt[i + 1] == j - 1:
+        old_stems.add(bg.get_node_from_residue_num(i + 1))
+    old_loops = set([bg.get_node_from_residue_num(i),
+                     bg.get_node_from_residue_num(j)])
+    return _replace_elements(bg, pt, new_pt, (i, j), old_stems, old_loops)
+
+
+def remove_basepair(bg, i, j):
+    """
+    Remove the base pair (i, j). See BulgeGraph.remove_basepair
+    """
+    pt = bg._get_pair_table()
+    i, j = _check_positions(pt, i, j)
+    if pt[i] != j:
+        raise ValueError("Cannot remove basepair ({}, {}): The nucleotides "
+                         "are not paired.".format(i, j))
+    new_pt = list(pt)
+    new_pt[i] = 0
+    new_pt[j] = 0
+    if bg.backbone_breaks_after:
+        return _rebuild(bg, new_pt)
+    stem = bg.get_node_from_residue_num(i)
+    old_loops = set(elem for elem in bg.edges[stem] if elem[0] != "s")
+    return _replace_elements(bg, pt, new_pt, (i, j), set([stem]), old_loops)
+
+
+def _check_positions(pt, i, j):
+    if i > j:
+        i, j = j, i
+    if i == j or i < 1 or j > pt[0]:
+        raise ValueError("Invalid basepair ({}, {}) for a structure with "
+                         "{} nucleotides.".format(i, j, pt[0]))
+    return i, j
+
+
+def _rebuild(bg, pt):
+    """
+    Recreate all elements from the pair table.
+
+    Used for structures with backbone breaks, where the elements are split
+    at the cutpoints after the graph construction.
+
+    :returns: The names of all old and new elements
+    """
+    log.info("Rebuilding the BulgeGraph, because it has backbone breaks.")
+    new_bg = type(bg)(_BulgeGraphConstruction(fus.pairtable_to_tuples(pt)),
+                      bg.seq, bg.name, _dont_split=False)
+    changed = set(bg.defines) | set(new_bg.defines)
+    bg.defines.clear()
+    bg.defines.update(new_bg.defines)
+    bg.edges = new_bg.edges
+    _structure_changed(bg, pt)
+    return changed
+
+
+def _structure_changed(bg, pt, elem_lookup=None):
+    bg._on_defines_change(None)
+    bg._pair_table = pt
+    bg._elem_lookup = elem_lookup
+
+
+def _next_paired(pt, pos):
+    """
+    The first paired nucleotide after pos, or seq_length+1
+    """
+    pos += 1
+    while pos < len(pt) and pt[pos] == 0:
+        pos += 1
+    return pos
+
+
+def _prev_paired(pt, pos):
+    """
+    The last paired nucleotide before pos, or 0
+    """
+    pos -= 1
+    while pos > 0 and pt[pos] == 0:
+        pos -= 1
+    return pos
+
+
+def _is_segment(pt, left, right):
+    """
+    Whether the backbone between two consecutive paired nucleotides
+    (or chain ends) left and right is a loop. See _graph_construction._find_loops
+    """
+    if right > left + 1:
+        return True
+    if left == 0 or right == len(pt):
+        return False
+    # A stacked base pair of a stem is not a loop,
+    # but a zero-length hairpin is.
+    return pt[left] != pt[right] + 1 or pt[left] == right
+
+
+def _segments_at(pt, pos):
+    """
+    All segments containing or flanked by the nucleotide pos.
+    """
+    if pt[pos] == 0:
+        candidates = [(_prev_paired(pt, pos), _next_paired(pt, pos))]
+    else:
+        candidates = [(_prev_paired(pt, pos), pos), (pos, _next_paired(pt, pos))]
+    return [seg for seg in candidates if _is_segment(pt, *seg)]
+
+
+def _segment_define(seg):
+    if seg[1] - seg[0] > 1:
+        return [seg[0] + 1, seg[1] - 1]
+    return []
+
+
+def _touches(seg, positions):
+    return any(seg[0] <= pos <= seg[1] for pos in positions)
+
+
+def _stem_at(pt, pos):
+    """
+    The define of the stem containing the paired nucleotide pos.
+    See _graph_construction._find_stems
+    """
+    start = end = min(pos, pt[pos])
+    while start > 1 and pt[start - 1] == pt[start] + 1:
+        start -= 1
+    while pt[end + 1] == pt[end] - 1 and end + 1 < pt[end + 1]:
+        end += 1
+    return [start, end, pt[end], pt[start]]
+
+
+def _old_segments(bg, elem):
+    """
+    The segments of an existing loop element.
+    """
+    define = bg.defines[elem]
+    if not define:
+        return [tuple(bg._define_a_zerolength(elem))]
+    segments = [(define[k] - 1, define[k + 1] + 1) for k in range(0, len(define), 2)]
+    if elem[0] == "i" and len(define) == 2:
+        # The other strand of the bulge has length 0.
+        outer, inner = sorted((bg.defines[stem] for stem in bg.edges[elem]),
+                              key=lambda d: d[0])
+        if segments[0][0] == outer[1]:
+            segments.append((inner[3], outer[2]))
+        else:
+            segments.append((outer[1], inner[0]))
+    return segments
+
+
+def _next_name(is_free, element_type):
+    i = 0
+    while not is_free("{}{}".format(element_type, i)):
+        i += 1
+    return "{}{}".format(element_type, i)
+
+
+def _overlaps(range1, range2):
+    return range1[0] <= range2[1] and range2[0] <= range1[1]
+
+
+def _replace_elements(bg, old_pt, pt, positions, old_stems, old_loops):
+    """
+    Replace the elements old_stems and old_loops (and the elements sharing an
+    interior loop with them) by the elements derived from the new pair table.
+
+    :param old_pt, pt: The pair table before and after the change
+    :param positions: The nucleotides whose pairing partner changed.
+    :returns: The names of the removed, new and changed elements
+    """
+    n = pt[0]
+    old_elem = bg.get_node_from_residue_num
+
+    # The stems at the changed positions.
+    new_stems = []
+    for pos in set(p + d for p in positions for d in (-1, 0, 1)):
+        if 0 < pos <= n and pt[pos] and (pos in positions or
+                                          (old_pt[pos] and old_elem(pos) in old_stems)):
+            define = _stem_at(pt, pos)
+            if define not in new_stems:
+                new_stems.append(define)
+    new_stems.sort()
+
+    def stem_define(pos):
+        for define in new_stems:
+            if define[0] <= pos <= define[1] or define[2] <= pos <= define[3]:
+                return define
+        return bg.defines[old_elem(pos)]
+
+    def old_owner(seg):
+        if seg[1] - seg[0] > 1:
+            return old_elem(seg[0] + 1)
+        for elem in bg.edges[old_elem(seg[0])] & bg.edges[old_elem(seg[1])]:
+            if not bg.defines[elem] and tuple(bg._define_a_zerolength(elem)) == seg:
+                return elem
+        raise AssertionError("No element found for segment {}".format(seg))
+
+    old_segments = {}
+    pending = set()
+    for pos in positions:
+        pending.update(_segments_at(pt, pos))
+
+    def replace_loop(elem):
+        old_loops.add(elem)
+        old_segments[elem] = _old_segments(bg, elem)
+        pending.update(seg for seg in old_segments[elem] if not _touches(seg, positions))
+
+    for elem in list(old_loops):
+        replace_loop(elem)
+
+    # Classify the segments, like _BulgeGraphConstruction._from_stems_and_loops
+    classified = {}
+    while pending:
+        seg = pending.pop()
+        if seg in classified:
+            continue
+        left, right = seg
+        kind, other = "m", None
+        if left == 0:
+            kind = "f"
+        elif right == n + 1:
+            kind = "t"
+        else:
+            stem1 = stem_define(left)
+            stem2 = stem_define(right)
+            if stem1 == stem2:
+                kind = "h"
+            elif left == stem1[1] and right == stem2[0]:
+                partner = (stem2[3], _next_paired(pt, stem2[3]))
+                if partner[1] == stem1[2]:
+                    kind, other = "i", partner
+            elif left == stem1[3] and right == stem2[2]:
+                partner = (stem2[1], _next_paired(pt, stem2[1]))
+                if partner[1] == stem1[0]:
+                    # The 3' strand of an interior loop. Stored with the 5' strand.
+                    kind, other = None, partner
+        classified[seg] = (kind, other)
+        if other is not None and other not in classified and other not in pending:
+            if _touches(other, positions):
+                pending.add(other)
+            else:
+                owner = old_owner(other)
+                if owner not in old_loops:
+                    replace_loop(owner)
+                pending.add(other)
+
+    new_loops = []
+    for seg, (kind, other) in sorted(classified.items()):
+        if kind is None:
+            continue
+        segments = [seg] if other is None else [seg, other]
+        define = [x for s in segments for x in _segment_define(s)]
+        if kind == "h" and not define:
+            continue  # Zero-length hairpins are not part of the graph
+        new_loops.append((kind, define, segments))
+    log.debug("Replacing stems %s and loops %s by stems %s and loops %s",
+              old_stems, old_loops, new_stems, new_loops)
+
+    # Loops, which only change because they are adjacent to a changed stem.
+    rewired = {}
+    for stem in old_stems:
+        for elem in bg.edges[stem]:
+            if elem not in old_loops and elem not in rewired:
+                rewired[elem] = _old_segments(bg, elem)
+
+    # Assign names. Changed elements keep the name of an old element of
+    # the same type they overlap with. Other new elements get the lowest
+    # unused number.
+    removed = old_stems | old_loops
+    assigned = set()
+
+    def is_free(name):
+        return name not in assigned and (name in removed or name not in bg.defines)
+
+    stem_names = {}
+    for define in new_stems:
+        candidates = sorted((bg.defines[elem][0], elem) for elem in old_stems
+                            if is_free(elem) and
+                            _overlaps(define[:2], bg.defines[elem][:2]))
+        name = candidates[0][1] if candidates else _next_name(is_free, "s")
+        assigned.add(name)
+        stem_names[tuple(define)] = name
+
+    loop_names = [None] * len(new_loops)
+    # Loops with unchanged segments first, then overlapping loops.
+    for exact in (True, False):
+        for k, (kind, define, segments) in enumerate(new_loops):
+            if loop_names[k] is not None:
+                continue
+            for elem in sorted(old_loops):
+                if not is_free(elem) or elem[0] != kind:
+                    continue
+                old = old_segments[elem]
+                if (exact and set(old) == set(segments) or
+                        not exact and any(_overlaps(s1, s2) for s1 in old for s2 in segments)):
+                    loop_names[k] = elem
+                    assigned.add(elem)
+                    break
+    for k, (kind, define, segments) in enumerate(new_loops):
+        if loop_names[k] is None:
+            loop_names[k] = _next_name(is_free, kind)
+            assigned.add(loop_names[k])
+
+    def stem_name(pos):
+        define = stem_define(pos)
+        return stem_names.get(tuple(define)) or old_elem(pos)
+
+    def adjacent_stems(segments):
+        return set(stem_name(pos) for seg in segments for pos in seg if 0 < pos <= n)
+
+    new_edges = {}
+    for name, (kind, define, segments) in zip(loop_names, new_loops):
+        new_edges[name] = adjacent_stems(segments)
+    for elem, segments in rewired.items():
+        new_edges[elem] = adjacent_stems(segments)
+
+    # Everything is computed, now modify the graph.
+    lookup = _updated_lookup(bg, removed, new_stems, stem_names, new_loops, loop_names)
+    for elem in removed:
+        for other in bg.edges.pop(elem, ()):
+            if other in bg.edges:
+                bg.edges[other].discard(elem)
+        del bg.defines[elem]
+    for define in new_stems:
+        bg.defines[stem_names[tuple(define)]] = define
+    for name, (kind, define, segments) in zip(loop_names, new_loops):
+        bg.defines[name] = define
+    for elem, stems in new_edges.items():
+        for stem in bg.edges[elem]:
+            bg.edges[stem].discard(elem)
+        bg.edges[elem] = stems
+        for stem in stems:
+            bg.edges[stem].add(elem)
+    for define in new_stems:
+        # Stems only adjacent to a zero-length hairpin have no edges.
+        bg.edges.setdefault(stem_names[tuple(define)], set())
+    _structure_changed(bg, pt, lookup)
+
+    changed = removed | assigned | set(rewired)
+    for name, (kind, define, segments) in zip(loop_names, new_loops):
+        if kind == "m" and not define:
+            # The positions of the zero-length segments between two stems
+            # follow from the order of their names, so a new segment may
+            # change the position of the others.
+            stem1, stem2 = bg.edges[name]
+            changed.update(elem for elem in bg.edges[stem1] & bg.edges[stem2]
+                           if not bg.defines[elem])
+    return changed
+
+
+def _updated_lookup(bg, removed, new_stems, stem_names, new_loops, loop_names):
+    """
+    The element lookup (see BaseGraph._element_lookup) after the change,
+    derived from the lookup before the change.
+
+    New elements take the positions of removed elements in the array of
+    names or are appended. Removed zero-length elements are not found in
+    the index, so their names stay in the array, but no nucleotide refers
+    to them anymore.
+    """
+    index, names = bg._element_lookup()
+    if len(names) > 2 * len(bg.defines):
+        # Too many stale names. Let it be rebuilt when it is needed.
+        return None
+    # The old lookup may be shared with a clone.
+    index = index.copy()
+    names = names.copy()
+    free = [index[bg.defines[elem][0]] for elem in removed if bg.defines[elem]]
+    elements = [(stem_names[tuple(define)], define) for define in new_stems]
+    elements += [(name, define) for name, (kind, define, segments)
+                 in zip(loop_names, new_loops)]
+    appended = []
+    for name, define in elements:
+        if free:
+            position = free.pop()
+            names[position] = name
+        else:
+            position = len(names) + len(appended)
+            appended.append(name)
+        for from_, to_ in zip(define[::2], define[1::2]):
+            index[from_:to_ + 1] = position
+    if appended:
+        names = np.append(names, np.array(appended, dtype=object))
+    return index, names
@@ -0,0 +1,100 @@
+"""
+Base-pair distances between the nucleotides at the corners of elements.
+
+The nucleotide graph (backbone links and base-pairs) is compressed to
+a graph over the define-endpoints ("corners") of all elements.
+The nucleotides between two consecutive corners along the backbone all
+belong to the same element and only lie on the backbone path between
+the two corners or on the ladder of a stem, so the distance between any
+two corners can be calculated on the compressed graph, which has only
+O(number of elements) nodes.
+"""
+import sys
+import logging
+
+import numpy as np
+import scipy.sparse
+import scipy.sparse.csgraph
+
+log = logging.getLogger(__name__)
+
+
+class CornerDistances(object):
+    """
+    All-pairs base-pair distances between the corner nucleotides of a graph.
+
+    This yields the same distances as a shortest path search on
+    BulgeGraph.to_networkx(), but needs O(E**2) instead of O(N**2) memory.
+    """
+
+    def __init__(self, bg):
+        """
+        :param bg: A BulgeGraph
+        """
+        corners = set()
+        for d in bg.defines.values():
+            corners.update(d)
+        #: A sorted array of all corner nucleotides
+        self.positions = np.array(sorted(corners), dtype=int)
+        num_corners = len(self.positions)
+        # Consecutive corners along the backbone
+        edges = {(i, i + 1): w
+                 for i, w in enumerate(np.diff(self.positions))}
+        # Basepairs at the ends of all stems.
+        # These may coincide with each other (stems of length 1) or with
+        # backbone links (0-length hairpins). Duplicate entries would be
+        # summed up by the sparse matrix, so we add every edge only once.
+        for stem in bg.stem_iterator():
+            i0, i1, i2, i3 = np.searchsorted(self.positions, bg.defines[stem])
+            edges[(i0, i3)] = 1
+            edges[(i1, i2)] = 1
+        rows, cols = zip(*edges.keys()) if edges else ((), ())
+        graph = scipy.sparse.csr_matrix((np.array(list(edges.values()), dtype=float),
+                                         (rows, cols)),
+                                        shape=(num_corners, num_corners))
+        log.debug("Calculating distances between %d corners", num_corners)
+        #: The distance matrix between all corners
+        self.distances = scipy.sparse.csgraph.shortest_path(graph, method="D",
+                                                            directed=False)
+        self._corner_indices = {
+            elem: np.searchsorted(self.positions, sorted(set(d)))
+            for elem, d in bg.defines.items()}
+
+    def min_max(self, e1, e2):
+        """
+        The minimal and maximal distance between the corners of two elements.
+
+        For zero-length elements, (sys.maxsize, 0) is returned.
+        """
+        c1 = self._corner_indices[e1]
+        c2 = self._corner_indices[e2]
+        if len(c1) == 0 or len(c2) == 0:
+            return (sys.maxsize, 0)
+        sub = self.distances[np.ix_(c1, c2)]
+        return (sub.min(), sub.max())
+
+    def min_max_matrix(self, elements):
+        """
+        The minimal and maximal distances between all pairs of elements.
+
+        :param elements: A list of element names
+        :returns: A tuple of two 2D arrays (min_dists, max_dists)
+                  with rows and columns in the order of elements.
+        """
+        min_dists = np.full((len(elements), len(elements)), float(sys.maxsize))
+        max_dists = np.zeros((len(elements), len(elements)))
+        nonempty = [i for i, elem in enumerate(elements)
+                    if len(self._corner_indices[elem])]
+        if not nonempty:
+            return min_dists, max_dists
+        corners = [self._corner_indices[elements[i]] for i in nonempty]
+        order = np.concatenate(corners)
+        starts = np.cumsum([0] + [len(c) for c in corners[:-1]])
+        grouped = self.distances[np.ix_(order, order)]
+        mins = np.minimum.reduceat(np.minimum.reduceat(grouped, starts, axis=0),
+                                   starts, axis=1)
+        maxs = np.maximum.reduceat(np.maximum.reduceat(grouped, starts, axis=0),
+                                   starts, axis=1)
+        min_dists[np.ix_(nonempty, nonempty)] = mins
+        max_dists[np.ix_(nonempty, nonempty)] = maxs
+        return min_dists, max_dists
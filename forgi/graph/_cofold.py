@@ -1,12 +1,12 @@
 """
 Take a BulgeGraph and return a copy of it with cofold splitpoints inserted.
 """
+import heapq
 import logging
 
+import numpy as np
 from logging_exceptions import log_to_exception
 
-
-from ._graph_construction import remove_vertex, relabel_node
 from ..utilities.exceptions import GraphConstructionError
 
 
@@ -23,11 +23,20 @@ def split_at_cofold_cutpoints(bg, cutpoints):
 
     We have constructed the bulge graph, as if they were connected along the backbone, so
     now we have to split it.
-    """
 
+    The cutpoints are handled in a single pass in ascending order. Whether the
+    strands form one molecule is checked beforehand, using the base pairs.
+    """
+    cutpoints = sorted(cutpoints)
+    if not _strands_connected(bg, cutpoints):
+        raise GraphConstructionError("Cannot create BulgeGraph. Found two sequences not connected by any "
+                                     " base-pair.")
+    if not cutpoints:
+        return
+    index = _ElementIndex(bg)
     for splitpoint in cutpoints:
-        element_left = bg.get_node_from_residue_num(splitpoint)
-        element_right = bg.get_node_from_residue_num(splitpoint + 1)
+        element_left = index.element_at(splitpoint)
+        element_right = index.element_at(splitpoint + 1)
         if element_left[0] in "ft" or element_right[0] in "ft":
             if element_left[0] == "t" and element_left[0] != "t":
                 continue  # Splitpoint already implemented
@@ -41,20 +50,51 @@ def split_at_cofold_cutpoints(bg, cutpoints):
                     log.error("Trying to split between %s and %s",
                               element_left, element_right)
                 raise e
-            return
         elif element_left[0] == "i" or element_right[0] == "i":
-            _split_interior_loop(bg, splitpoint, element_left, element_right)
+            _split_interior_loop(bg, splitpoint, element_left, element_right,
+                                 index)
         elif element_left != element_right:
             _split_between_elements(
-                        bg, splitpoint, element_left, element_right)
+                        bg, splitpoint, element_left, element_right, index)
         elif element_left[0] == "s":
-            _split_inside_stem(bg, splitpoint, element_left)
+            _split_inside_stem(bg, splitpoint, element_left, index)
         else:
-            _split_inside_loop(bg, splitpoint, element_left)
-        bg._node_to_resnum = {}
-    if not _is_connected(bg):
-        raise GraphConstructionError("Cannot create BulgeGraph. Found two sequences not connected by any "
-                                     " base-pair.")
+            _split_inside_loop(bg, splitpoint, element_left, index)
+
+
+def _strands_connected(bg, cutpoints):
+    """
+    Whether the strands between the (sorted) cutpoints are connected by base pairs.
+
+    Uses a union-find over the strands, so the graph does not need to be traversed.
+    """
+    num_strands = len(cutpoints) + 1
+    if num_strands == 1:
+        return True
+    stems = [bg.defines[elem] for elem in bg.defines if elem[0] == "s"]
+    if not stems:
+        return False
+    # All base pairs (i, j) of all stems
+    i = np.concatenate([np.arange(d[0], d[1] + 1) for d in stems])
+    j = np.concatenate([np.arange(d[3], d[2] - 1, -1) for d in stems])
+    # The strand of nucleotide i is the number of cutpoints before i.
+    strand_pairs = set(zip(np.searchsorted(cutpoints, i).tolist(),
+                           np.searchsorted(cutpoints, j).tolist()))
+    parent = list(range(num_strands))
+
+    def find(strand):
+        while parent[strand] != strand:
+            parent[strand] = parent[parent[strand]]
+            strand = parent[strand]
+        return strand
+
+    components = num_strands
+    for strand1, strand2 in strand_pairs:
+        root1, root2 = find(strand1), find(strand2)
+        if root1 != root2:
+            parent[root1] = root2
+            components -= 1
+    return components == 1
 
 
 def _is_connected(bg):
@@ -74,17 +114,123 @@ def _is_connected(bg):
     return known_nodes == set(bg.defines.keys())
 
 
-def _split_between_elements(bg, splitpoint, element_left, element_right):
+class _ElementIndex(object):
+    """
+    The nucleotide-to-element lookup and the free element names of a
+    BulgeGraph, updated locally while the graph is split.
+
+    The lookup of the BulgeGraph is rebuilt after every change of the defines
+    and finding a free name would need a scan over all defines. Here, every
+    change of the graph only touches the nucleotides and edges of the
+    affected elements.
+
+    New names are the lowest unused number for the element type,
+    like in a linear search.
+    """
+
+    def __init__(self, bg):
+        self.bg = bg
+        index, names = bg._element_lookup()
+        self._elements = np.where(index >= 0, names[index], None).tolist()
+        used = {}
+        for elem in bg.defines:
+            if elem[1:].isdigit() and str(int(elem[1:])) == elem[1:]:
+                used.setdefault(elem[0], set()).add(int(elem[1:]))
+        # Per element type: The next number after the highest used number
+        # and a heap of the unused numbers below it.
+        self._next_number = {}
+        self._free_numbers = {}
+        for element_type, numbers in used.items():
+            self._next_number[element_type] = max(numbers) + 1
+            self._free_numbers[element_type] = [n for n in range(max(numbers))
+                                                if n not in numbers]
+
+    def element_at(self, base_num):
+        """
+        Like BulgeGraph.get_node_from_residue_num
+        """
+        if 0 < base_num < len(self._elements) and self._elements[base_num] is not None:
+            return self._elements[base_num]
+        raise LookupError(
+            "Base number {} not found in the defines {}.".format(base_num, self.bg.defines))
+
+    def pairing_partner(self, base_num):
+        """
+        Like BulgeGraph.pairing_partner, for a nucleotide in a stem.
+        """
+        d = self.bg.defines[self.element_at(base_num)]
+        if d[0] <= base_num <= d[1]:
+            return d[3] - (base_num - d[0])
+        return d[0] + (d[3] - base_num)
+
+    def new_name(self, element_type):
+        """
+        Reserve the next available element name.
+
+        :param element_type: A single letter ("t", "f", "s"...)
+        """
+        free = self._free_numbers.setdefault(element_type, [])
+        if free:
+            number = heapq.heappop(free)
+        else:
+            number = self._next_number.get(element_type, 0)
+            self._next_number[element_type] = number + 1
+        return "{}{}".format(element_type, number)
+
+    def _release_name(self, elem):
+        if elem[1:].isdigit() and str(int(elem[1:])) == elem[1:]:
+            heapq.heappush(self._free_numbers[elem[0]], int(elem[1:]))
+
+    def set_define(self, elem, define):
+        self.bg.defines[elem] = define
+        for i in range(0, len(define), 2):
+            self._elements[define[i]:define[i + 1] + 1] = [elem] * (define[i + 1] - define[i] + 1)
+
+    def remove_node(self, elem):
+        """
+        Remove the element with all its edges.
+        """
+        for neighbor in self.bg.edges[elem]:
+            self.bg.edges[neighbor].remove(elem)
+        del self.bg.edges[elem]
+        define = self.bg.defines.pop(elem)
+        for i in range(0, len(define), 2):
+            for pos in range(define[i], define[i + 1] + 1):
+                if self._elements[pos] == elem:
+                    self._elements[pos] = None
+        self._release_name(elem)
+
+    def relabel_node(self, old_name, element_type):
+        """
+        Give the element the next available name of the given type.
+
+        :returns: The new name
+        """
+        new_name = self.new_name(element_type)
+        define = self.bg.defines.pop(old_name)
+        self.bg.defines[new_name] = define
+        edges = self.bg.edges.pop(old_name)
+        self.bg.edges[new_name] = edges
+        for neighbor in edges:
+            self.bg.edges[neighbor].remove(old_name)
+            self.bg.edges[neighbor].add(new_name)
+        for i in range(0, len(define), 2):
+            self._elements[define[i]:define[i + 1] + 1] = [new_name] * (define[i + 1] - define[i] + 1)
+        self._release_name(old_name)
+        return new_name
+
+
+def _split_between_elements(bg, splitpoint, element_left, element_right, index=None):
+    if index is None:
+        index = _ElementIndex(bg)
     log.debug("Before splitting between %s and %s at %s: %s", element_left,
               element_right, splitpoint, bg.defines)
     if element_left[0] in "mh":
-        next3 = _next_available_element_name(bg, "t")
-        relabel_node(bg, element_left, next3)
+        next3 = index.relabel_node(element_left, "t")
         if element_left[0] != "h":
             _remove_edge(bg, next3, element_right)
     elif element_right[0] in "mh":
-        next5 = _next_available_element_name(bg, "f")
-        relabel_node(bg, element_right, next5)
+        next5 = index.relabel_node(element_right, "f")
         if element_right[0] != "h":
             _remove_edge(bg, next5, element_left)
     else:
@@ -109,33 +255,35 @@ def _split_between_elements(bg, splitpoint, element_left, element_right):
         # pylint: disable=undefined-loop-variable
         if connection[0] == "m":
             # Just remove it without replacement
-            remove_vertex(bg, connection)
+            index.remove_node(connection)
         else:
             assert connection[0] == "i"
             # Replace i by ml (this is then located on the other strand than the splitpoint)
-            next_ml = _next_available_element_name(bg, "m")
-            assert next_ml not in bg.defines
-            relabel_node(bg, connection, next_ml)
+            index.relabel_node(connection, "m")
 
 
-def _split_inside_loop(bg, splitpoint, element):
+def _split_inside_loop(bg, splitpoint, element, index=None):
+    if index is None:
+        index = _ElementIndex(bg)
     if element[0] in "hm":
         from_, to_ = bg.defines[element]
-        stem_left = bg.get_node_from_residue_num(from_ - 1)
-        stem_right = bg.get_node_from_residue_num(to_ + 1)
+        stem_left = index.element_at(from_ - 1)
+        stem_right = index.element_at(to_ + 1)
 
-        next3 = _next_available_element_name(bg, "t")
-        next5 = _next_available_element_name(bg, "f")
-        bg.defines[next3] = [from_, splitpoint]
-        bg.defines[next5] = [splitpoint + 1, to_]
+        next3 = index.new_name("t")
+        next5 = index.new_name("f")
+        index.set_define(next3, [from_, splitpoint])
+        index.set_define(next5, [splitpoint + 1, to_])
         _add_edge(bg, stem_left, next3)
         _add_edge(bg, next5, stem_right)
-        remove_vertex(bg, element)
+        index.remove_node(element)
     else:
         assert False
 
 
-def _split_inside_stem(bg, splitpoint, element):
+def _split_inside_stem(bg, splitpoint, element, index=None):
+    if index is None:
+        index = _ElementIndex(bg)
     assert element[0] == "s"
     log.debug("Split inside stem %s at %s", element, splitpoint)
     if splitpoint == bg.defines[element][1]:
@@ -145,15 +293,15 @@ def _split_inside_stem(bg, splitpoint, element):
     if splitpoint < bg.defines[element][1]:
         # Splitpoint in forward strand:
         define1 = [bg.defines[element][0], splitpoint,
-                   bg.pairing_partner(splitpoint), bg.defines[element][3]]
+                   index.pairing_partner(splitpoint), bg.defines[element][3]]
         define2 = [splitpoint + 1, bg.defines[element][1],
-                   bg.defines[element][2], bg.pairing_partner(splitpoint + 1)]
+                   bg.defines[element][2], index.pairing_partner(splitpoint + 1)]
         log.debug("Split in forward strand")
     else:
         # Splitpoint in backwards strand:
-        define1 = [bg.defines[element][0], bg.pairing_partner(splitpoint + 1),
+        define1 = [bg.defines[element][0], index.pairing_partner(splitpoint + 1),
                    splitpoint + 1, bg.defines[element][3]]
-        define2 = [bg.pairing_partner(splitpoint), bg.defines[element][1],
+        define2 = [index.pairing_partner(splitpoint), bg.defines[element][1],
                    bg.defines[element][2], splitpoint]
         log.debug("Split in backwards strand")
     edges1 = []
@@ -177,13 +325,13 @@ def _split_inside_stem(bg, splitpoint, element):
                       "define2 %s", edge, bg.flanking_nucleotides(edge),
                       define1, define2)
             assert False
-    remove_vertex(bg, element)
-    next_s1 = _next_available_element_name(bg, "s")
-    bg.defines[next_s1] = define1
-    next_m = _next_available_element_name(bg, "m")
-    bg.defines[next_m] = []
-    next_s2 = _next_available_element_name(bg, "s")
-    bg.defines[next_s2] = define2
+    index.remove_node(element)
+    next_s1 = index.new_name("s")
+    index.set_define(next_s1, define1)
+    next_m = index.new_name("m")
+    index.set_define(next_m, [])
+    next_s2 = index.new_name("s")
+    index.set_define(next_s2, define2)
 
     for e1 in edges1:
         bg.edges[e1].add(next_s1)
@@ -196,18 +344,6 @@ def _split_inside_stem(bg, splitpoint, element):
     bg.edges[next_m] = set([next_s1, next_s2])
 
 
-def _next_available_element_name(bg, element_type):
-    """
-    :param element_type: A single letter ("t", "f", "s"...)
-    """
-    i = 0
-    while True:
-        name = "{}{}".format(element_type, i)
-        if name not in bg.defines:
-            return name
-        i += 1
-
-
 def _remove_edge(bg, from_element, to_element):
     bg.edges[from_element].remove(to_element)
     bg.edges[to_element].remove(from_element)
@@ -218,30 +354,33 @@ def _add_edge(bg, from_element, to_element):
     bg.edges[to_element].add(from_element)
 
 
-def _split_interior_loop_at_side(bg, splitpoint, strand, other_strand, stems):
+def _split_interior_loop_at_side(bg, splitpoint, strand, other_strand, stems, index=None):
     """
     Called by _split_at_cofold_cutpoints
     """
-    next_ml = _next_available_element_name(bg, "m")
-    next_a = _next_available_element_name(bg, "t")
-    next_b = _next_available_element_name(bg, "f")
-
+    if index is None:
+        index = _ElementIndex(bg)
+    next_ml = index.new_name("m")
     if other_strand[0] > other_strand[1]:
-        bg.defines[next_ml] = []
+        index.set_define(next_ml, [])
     else:
-        bg.defines[next_ml] = other_strand
+        index.set_define(next_ml, other_strand)
     _add_edge(bg, next_ml, stems[0])
     _add_edge(bg, next_ml, stems[1])
 
     if splitpoint >= strand[0]:
-        bg.defines[next_a] = [strand[0], splitpoint]
+        next_a = index.new_name("t")
+        index.set_define(next_a, [strand[0], splitpoint])
         _add_edge(bg, next_a, stems[0])
     if splitpoint < strand[1]:
-        bg.defines[next_b] = [splitpoint + 1, strand[1]]
+        next_b = index.new_name("f")
+        index.set_define(next_b, [splitpoint + 1, strand[1]])
         _add_edge(bg, next_b, stems[1])
 
 
-def _split_interior_loop(bg, splitpoint, element_left, element_right):
+def _split_interior_loop(bg, splitpoint, element_left, element_right, index=None):
+    if index is None:
+        index = _ElementIndex(bg)
     if element_left[0] == "i":
         iloop = element_left
     elif element_right[0] == "i":
@@ -256,10 +395,10 @@ def _split_interior_loop(bg, splitpoint, element_left, element_right):
     if forward_strand[0] - 1 <= splitpoint <= forward_strand[1]:
         # Split forward strand, relabel backwards strand to multiloop.
         _split_interior_loop_at_side(bg, splitpoint,
-                                     forward_strand, back_strand, c)
+                                     forward_strand, back_strand, c, index)
     elif back_strand[0] - 1 <= splitpoint <= back_strand[1]:
         _split_interior_loop_at_side(bg, splitpoint,
-                                     back_strand, forward_strand, [c[1], c[0]])
+                                     back_strand, forward_strand, [c[1], c[0]], index)
     else:
         assert False
-    remove_vertex(bg, iloop)
+    index.remove_node(iloop)
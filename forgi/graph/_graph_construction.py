@@ -1,6 +1,4 @@
-import sys
 import logging
-import itertools as it
 from collections import defaultdict
 from pprint import pformat
 
@@ -20,501 +18,163 @@ class _BulgeGraphConstruction(BaseGraph):
     def __init__(self, tuples):  # pylint: disable=W0231
         self.defines = {}
         self.edges = defaultdict(set)
-        self.weights = {}
-        self._name_counter = 0
         self.from_tuples(tuples)
 
     def from_tuples(self, tuples):
         """
         Create a bulge_graph from a list of pair tuples. Unpaired
         nucleotides have a pairing partner of 0.
-        """
-        stems = []
-        bulges = []
-
-        tuples.sort()  # We move along the backbone
-        tuples = iter(tuples)
-        (t1, t2) = next(tuples)
-
-        prev_from = t1
-        prev_to = t2
-
-        start_from = prev_from
-        start_to = prev_to
-        last_paired = prev_from
-
-        for t1, t2 in tuples:
-            (from_bp, to_bp) = (t1, t2)
-
-            if abs(to_bp - prev_to) == 1 and prev_to != 0:  # adjacent basepairs on 3' strand
-                # stem
-                if (((prev_to - prev_from > 0 and to_bp - from_bp > 0) or
-                     (prev_to - prev_from < 0 and to_bp - from_bp < 0)) and
-                        (to_bp - prev_to) == -(from_bp - prev_from)):
-                    (prev_from, prev_to) = (from_bp, to_bp)
-                    last_paired = from_bp
-                    continue
-
-            if to_bp == 0 and prev_to == 0:
-                # bulge
-                (prev_from, prev_to) = (from_bp, to_bp)
-                continue
-            else:
-                if prev_to != 0:
-                    new_stem = tuple(sorted([tuple(sorted([start_from - 1, start_to - 1])),
-                                             tuple(sorted([prev_from - 1, prev_to - 1]))]))
-                    if new_stem not in stems:
-                        stems += [new_stem]
-
-                    last_paired = from_bp
-                    start_from = from_bp
-                    start_to = to_bp
-                else:
-                    new_bulge = ((last_paired - 1, prev_from - 1))
-                    bulges += [new_bulge]
-
-                    start_from = from_bp
-                    start_to = to_bp
-
-            prev_from = from_bp
-            prev_to = to_bp
-
-        # Take care of the last element
-        if prev_to != 0:
-            new_stem = tuple(sorted([tuple(sorted([start_from - 1, start_to - 1])),
-                                     tuple(sorted([prev_from - 1, prev_to - 1]))]))
-            if new_stem not in stems:
-                stems += [new_stem]
-        if prev_to == 0:
-            new_bulge = ((last_paired - 1, prev_from - 1))
-            bulges += [new_bulge]
-
-        log.debug("from_tuples: stems %s, bulges %s", stems, bulges)
-        self.from_stems_and_bulges(stems, bulges)
-
-    def from_stems_and_bulges(self, stems, bulges):
-        """
-        Create the graph from the list of stems and bulges.
 
-        :param stems: A list of tuples of two two-tuples, each containing the start
-                      and end nucleotides of each strand of the stem.
-        :param bulges: A list of tuples containing the starts and ends of the
-                       of the bulge regions.
-        :return: Nothing, just make the bulgegraph
+        The graph is built in a single sweep along the backbone, so the
+        runtime is linear in the sequence length.
         """
         assert self.defines == {}
-        assert self.edges == defaultdict(set)
-        for i in range(len(stems)):
-            # one is added to each coordinate to make up for the fact that residues are 1-based
-            ss1 = stems[i][0][0] + 1
-            ss2 = stems[i][0][1] + 1
-            se1 = stems[i][1][0] + 1
-            se2 = stems[i][1][1] + 1
-            log.debug("stem define not sorted: %s %s %s %s",
-                      ss1, ss2, se1, se2)
-            log.debug("self.defines %s", self.defines)
-
-            self.defines['y%d' % (i)] = [min(ss1, se1), max(ss1, se1),
-                                         min(ss2, se2), max(ss2, se2)]
-            self.weights['y%d' % (i)] = 1
-
-        for i in range(len(bulges)):
-            bulge = bulges[i]
-            self.defines['b%d' % (i)] = sorted([bulge[0] + 1, bulge[1] + 1])
-            self.weights['b%d' % (i)] = 1
-
-        log.debug("from_stems_and_bulges: %s; %s", self.defines, self.edges)
-        self.create_bulge_graph(stems, bulges)
-        log.debug("after create_bulge_graph: DEFINES:\n %s;\n EDGES:\n %s", pformat(
-            self.defines), pformat(self.edges))
-        self.create_stem_graph(stems, len(bulges))
-        log.debug("after create_stem_graph: DEFINES \n%s;\nEDGES \n%s",
-                  pformat(self.defines), pformat(self.edges))
-        self.collapse()
-        log.debug("after collapse: DEFINES:\n %s;\n EDGES:\n %s",
+        pt = _tuples_to_pt(tuples)
+        stems, stem_of = _find_stems(pt)
+        loops = _find_loops(pt, stems, stem_of)
+        log.debug("from_tuples: stems %s, loops %s", stems, loops)
+        self._from_stems_and_loops(pt[0], stems, stem_of, loops)
+        log.debug("after from_tuples: DEFINES:\n %s;\n EDGES:\n %s",
                   pformat(self.defines), pformat(self.edges))
-        self.sort_defines()
-        log.debug("after _sort_defines: DEFINES:\n%s;\n EDGES:\n%s",
-                  pformat(self.defines), pformat(self.edges))
-        self.relabel_nodes()
-        log.debug("after relabel_nodes: DEFINES:\n %s;\n EDGES:\n %s",
-                  pformat(self.defines), pformat(self.edges))
-        self.remove_degenerate_nodes()
-
-    def remove_degenerate_nodes(self):
-        """
-        For now just remove all hairpins that have no length.
-        """
-        to_remove = []
-        for d in self.defines:
-            if d[0] == 'h' and len(self.defines[d]) == 0:
-                to_remove += [d]
-
-        for r in to_remove:
-            remove_vertex(self, r)
-
-    def sort_defines(self):
-        """
-        Sort the defines of interior loops and stems so that the 5' region
-        is always first.
-        """
-        for k in self.defines.keys():
-            d = self.defines[k]
-
-            if len(d) == 4:
-                if d[0] > d[2]:
-                    new_d = [d[2], d[3], d[0], d[1]]
-                    self.defines[k] = new_d
-
-    def reduce_defines(self):
-        """
-        Make defines like this:
-
-        define x0 2 124 124 3 4 125 127 5 5
-
-        Into this:
-
-        define x0 2 3 5 124 127
-
-        That is, consolidate contiguous bulge region defines.
-        """
-        for key in self.defines.keys():
-            if key[0] != 's':
-                assert (len(self.defines[key]) % 2 == 0)
-                new_j = 0
-
-                while new_j < len(self.defines[key]):
-
-                    j = new_j
-                    new_j += j + 2
-
-                    (f1, t1) = (int(self.defines[key][j]), int(
-                        self.defines[key][j + 1]))
-
-                    # remove bulges of length 0
-                    if f1 == -1 and t1 == -2:
-                        del self.defines[key][j]
-                        del self.defines[key][j]
-
-                        new_j = 0
-                        continue
-
-                    # merge contiguous bulge regions
-                    for k in range(j + 2, len(self.defines[key]), 2):
-                        if key[0] == 'y':
-                            # we can have stems with defines like: [1,2,3,4]
-                            # which would imply a non-existant loop at its end
-                            continue
-
-                        (f2, t2) = (int(self.defines[key][k]), int(
-                            self.defines[key][k + 1]))
-
-                        if t2 + 1 != f1 and t1 + 1 != f2:
-                            continue
-
-                        if t2 + 1 == f1:
-                            self.defines[key][j] = str(f2)
-                            self.defines[key][j + 1] = str(t1)
-                        elif t1 + 1 == f2:
-                            self.defines[key][j] = str(f1)
-                            self.defines[key][j + 1] = str(t2)
-
-                        del self.defines[key][k]
-                        del self.defines[key][k]
-
-                        new_j = 0
-
-                        break
-
-    def merge_vertices(self, vertices):
-        """
-        This is done when two of the outgoing strands of a stem
-        go to different bulges
-        It is assumed that the two ends are on the same sides because
-        at least one vertex has a weight of 2, implying that it accounts
-        for all of the edges going out of one side of the stem
-
-        :param vertices: A list of vertex names to combine into one.
-        """
-        new_vertex = self.get_vertex()
-        self.weights[new_vertex] = 0
-
-        # assert(len(vertices) == 2)
-
-        connections = set()
-
-        for v in vertices:
-
-            # what are we gonna merge?
-            for item in self.edges[v]:
-                connections.add(item)
-
-            # Add the definition of this vertex to the new vertex
-            # self.merge_defs[new_vertex] = self.merge_defs.get(new_vertex, []) + [v]
-
-            if v[0] == 's':
-                self.defines[new_vertex] = self.defines.get(new_vertex, []) + [self.defines[v][0],
-                                                                               self.defines[v][2]] + [
-                    self.defines[v][1], self.defines[v][3]]
-            else:
-                self.defines[new_vertex] = self.defines.get(
-                    new_vertex, []) + self.defines[v]
-
-            self.weights[new_vertex] += 1
-
-            # remove the old vertex, since it's been replaced by new_vertex
-            remove_vertex(self, v)
-            self.reduce_defines()
-
-        # self.weights[new_vertex] = 2
-        for connection in connections:
-            self.edges[new_vertex].add(connection)
-            self.edges[connection].add(new_vertex)
-
-        return new_vertex
 
-    def get_vertex(self, name=None):
+    def _from_stems_and_loops(self, seq_length, stems, stem_of, loops):
         """
-        Return a new unique vertex name starting with `x`.
+        Classify the loops, merge the two strands of interior loops and
+        assign the final element names.
 
-        At this stage stems and bulges are not distinguished
+        :param seq_length: The number of nucleotides
+        :param stems: A list of stem defines, sorted by their first nucleotide.
+        :param stem_of: A list mapping paired nucleotides to indices into stems.
+        :param loops: A list of triples (left, right, define), where left and
+                      right are the paired nucleotides flanking the loop
+                      (0 or seq_length+1 at the ends of the chain).
         """
-
-        if name is None:
-            name = "x{}".format(self._name_counter)
-            self._name_counter += 1
-
-        return name
-
-    def collapse(self):
-        """
-        If any vertices form a loop, then they are either a bulge region or
-        a fork region. The bulge (interior loop) regions will be condensed
-        into one node.
-        """
-
-        new_vertex = True
-        while new_vertex:
-            new_vertex = False
-            bulges = [k for k in self.defines if k[0] != 'y']
-
-            for (b1, b2) in it.combinations(bulges, r=2):
-                if self.edges[b1] == self.edges[b2] and len(self.edges[b1]) == 2:
-                    connections = self.connections(b1)
-
-                    all_connections = [sorted((self._get_sides_plus(connections[0], b1)[0],
-                                               self._get_sides_plus(connections[0], b2)[0])),
-                                       sorted((self._get_sides_plus(connections[1], b1)[0],
-                                               self._get_sides_plus(connections[1], b2)[0]))]
-
-                    if all_connections == [[1, 2], [0, 3]]:
-                        # interior loop
-                        log.debug("Collapsing %s and %s", b1, b2)
-                        self.merge_vertices([b1, b2])
-                        new_vertex = True
-                        break
-
-    def create_stem_graph(self, stems, bulge_counter):
-        """
-        Determine which stems are connected to each other. A stem can be connected to
-        another stem when there is an interior loop with an unpaired nucleotide on
-        one side. In this case, a bulge will be created on the other side, but it
-        will only consist of the two paired bases around where the unpaired base
-        would be if it existed.
-
-        The defines for these bulges will be printed as well as the connection strings
-        for the stems they are connected to.
-
-        :param stems: A list of tuples of tuples of the form [((s1, e1), (s2, e2))]
-                      where s1 and e1 are the nucleotides at one end of the stem
-                      and s2 and e2 are the nucleotides at the other.
-        :param bulge_counter: The number of bulges that have been encountered so far.
-
-        :returns: None
-        """
-        # print "stems:", stems
-        for i, j in it.combinations(range(len(stems)), 2):
-            for k1, k2, l1, l2 in it.product(range(2), repeat=4):
-                s1 = stems[i][k1][l1]
-                s2 = stems[j][k2][l2]
-                if k1 == 1 and stems[i][0][l1] == stems[i][1][l1]:
-                    continue
-                if k2 == 1 and stems[j][0][l2] == stems[j][1][l2]:
-                    continue
-                if abs(s1 - s2) == 1:
-                    bn = 'b{}'.format(bulge_counter)
-                    log.debug("Adding bulge %s between %s and %s. (%s is next to %s ) k1 %s, k2 %s, l1 %s, l2 %s",
-                              bn, stems[i], stems[j], s1, s2, k1, k2, l1, l2)
-                    # self.defines[bn] = [min(s1, s2)+1, max(s1, s2)+1]
-                    self.defines[bn] = []
-                    self.weights[bn] = 1
-
-                    self.edges['y{}'.format(i)].add(bn)
-                    self.edges[bn].add('y{}'.format(i))
-
-                    self.edges['y{}'.format(j)].add(bn)
-                    self.edges[bn].add('y{}'.format(j))
-
-                    bulge_counter += 1
-
-        for d in list(self.defines.keys()):  # 0-nt Hairpins
-            if d[0] != 'y':
-                continue
-
-            (s1, e1, s2, e2) = self.defines[d]
-            if abs(s2 - e1) == 1:
-                bn = 'b{}'.format(bulge_counter)
-
-                self.defines[bn] = []
-                self.weights[bn] = 1
-
-                self.edges[bn].add(d)
-                self.edges[d].add(bn)
-
-                bulge_counter += 1
-
-        return
-
-    def relabel_nodes(self):
-        """
-        Change the labels of the nodes to be more indicative of their nature.
-
-        s: stem
-        h: hairpin
-        i: interior loop
-        m: multiloop
-        f: five-prime unpaired
-        t: three-prime unpaired
-        """
-        stems = []
+        loop_by_left = dict((loop[0], loop) for loop in loops)
+        fiveprimes = []
+        threeprimes = []
         hairpins = []
         interior_loops = []
         multiloops = []
-        fiveprimes = []
-        threeprimes = []
-
-        seq_length = 0
-        for d in self.defines:
-            for r in self.define_range_iterator(d):
-                seq_length += r[1] - r[0] + 1
-
-        for d in self.defines.keys():
-            if d[0] == 'y' or d[0] == 's':
-                stems += [d]
-                continue
-
-            if len(self.defines[d]) == 0 and len(self.edges[d]) == 1:
-                hairpins += [d]
-                continue
-
-            if len(self.defines[d]) == 0 and len(self.edges[d]) == 2:
-                multiloops += [d]
-                continue
-
-            if len(self.edges[d]) <= 1 and self.defines[d][0] == 1:
-                fiveprimes += [d]
-                continue
-
-            if len(self.edges[d]) == 1 and self.defines[d][1] == seq_length:
-                threeprimes += [d]
-                continue
-
-            if (len(self.edges[d]) == 1 and
-                self.defines[d][0] != 1 and
-                    self.defines[d][1] != seq_length):
-                hairpins += [d]
-                continue
-
-            if d[0] == 'm' or (d[0] != 'i' and len(self.edges[d]) == 2 and
-                                       self.weights[d] == 1 and
-                                       self.defines[d][0] != 1 and
-                                       self.defines[d][1] != seq_length):
-                multiloops += [d]
-                continue
-
-            if d[0] == 'i' or self.weights[d] == 2:
-                interior_loops += [d]
-
-        stems.sort(key=self.compare_stems)
-        hairpins.sort(key=self.compare_hairpins)
-        multiloops.sort(key=self.compare_bulges)
-        interior_loops.sort(key=self.compare_stems)
-
-        if fiveprimes:
-            d, = fiveprimes
-            relabel_node(self, d, 'f0')
-        if threeprimes:
-            d, = threeprimes
-            relabel_node(self, d, 't0')
-        for i, d in enumerate(stems):
-            relabel_node(self, d, 's%d' % (i))
-        for i, d in enumerate(interior_loops):
-            relabel_node(self, d, 'i%d' % (i))
-        for i, d in enumerate(multiloops):
-            relabel_node(self, d, 'm%d' % (i))
-        for i, d in enumerate(hairpins):
-            relabel_node(self, d, 'h%d' % (i))
-
-    def compare_stems(self, b):
-        """
-        A function that can be passed in as the key to a sort.
-        """
-        return (self.defines[b][0], 0)
-
-    def compare_bulges(self, b):
-        """
-        A function that can be passed in as the key to a sort.
-
-        Compares based on the nucleotide number
-        (using define_a to allow for sorting 0-length MLs)
-        """
-        return self.define_a(b)
-
-    def compare_hairpins(self, b):
-        connections = self.connections(b)
-
-        return (self.defines[connections[0]][1], sys.maxsize)
-
-    def create_bulge_graph(self, stems, bulges):
-        """
-        Find out which stems connect to which bulges
-
-        Stems and bulges which share a nucleotide are considered connected.
-
-        :param stems: A list of tuples of tuples of the form [((s1, e1), (s2, e2))]
-                      where s1 and e1 are the nucleotides at one end of the stem
-                      and s2 and e2 are the nucleotides at the other.
+        merged = set()
+        for loop in loops:
+            left, right, define = loop
+            if left == 0:
+                fiveprimes.append(loop)
+            elif right == seq_length + 1:
+                threeprimes.append(loop)
+            elif stem_of[left] == stem_of[right]:
+                hairpins.append(loop)
+            elif left not in merged:
+                outer = stems[stem_of[left]]
+                inner = stems[stem_of[right]]
+                partner = loop_by_left.get(inner[3])
+                if (left == outer[1] and right == inner[0] and
+                        partner is not None and partner[1] == outer[2]):
+                    # The two strands of an interior loop.
+                    merged.add(partner[0])
+                    interior_loops.append((left, right, define + partner[2]))
+                else:
+                    multiloops.append(loop)
+        interior_loops.sort(key=lambda loop: loop[2][0])
+        # Multiloops and hairpins are sorted by their 5' flanking nucleotide.
+        multiloops.sort()
+        hairpins.sort()
+
+        named_loops = [("f0", loop) for loop in fiveprimes]
+        named_loops += [("t0", loop) for loop in threeprimes]
+        stem_names = ["s{}".format(i) for i in range(len(stems))]
+        for name, loop in named_loops:
+            self.defines[name] = loop[2]
+            self.edges[name] = set()
+        for name, stem in zip(stem_names, stems):
+            self.defines[name] = stem
+            self.edges[name] = set()
+        named_loops += [("i{}".format(i), loop)
+                        for i, loop in enumerate(interior_loops)]
+        named_loops += [("m{}".format(i), loop)
+                        for i, loop in enumerate(multiloops)]
+        # Zero-length hairpins are numbered, but not added to the graph.
+        named_loops += [("h{}".format(i), loop)
+                        for i, loop in enumerate(hairpins) if loop[2]]
+        for name, loop in named_loops:
+            if name not in self.defines:
+                self.defines[name] = loop[2]
+                self.edges[name] = set()
+            for flank in loop[:2]:
+                if 0 < flank <= seq_length:
+                    self.edges[name].add(stem_names[stem_of[flank]])
+                    self.edges[stem_names[stem_of[flank]]].add(name)
+
+
+def _tuples_to_pt(tuples):
+    """
+    Convert a list of pair tuples to a pair table (with the length at index 0).
+    """
+    seq_length = 0
+    for t1, t2 in tuples:
+        seq_length = max(seq_length, t1, t2)
+    pt = [0] * (seq_length + 1)
+    pt[0] = seq_length
+    for t1, t2 in tuples:
+        pt[t1] = t2
+    return pt
 
-        :param bulges: A list of tuples of the form [(s, e)] where s and e are the
-                       numbers of the nucleotides at the start and end of the bulge.
-        """
-        for i in range(len(stems)):
-            stem = stems[i]
-            for j in range(len(bulges)):
-                bulge = bulges[j]
-                if any_difference_of_one(stem, bulge):
-                    self.edges['y{}'.format(i)].add('b{}'.format(j))
-                    self.edges['b{}'.format(j)].add('y{}'.format(i))
 
+def _find_stems(pt):
+    """
+    Find all helices in a pair table.
 
-def any_difference_of_one(stem, bulge):
+    :returns: A tuple (stems, stem_of). stems is a list of defines
+              [start1, end1, start2, end2], sorted by start1.
+              stem_of is a list mapping every paired nucleotide to the
+              index of its stem in stems (-1 for unpaired nucleotides).
+    """
+    stems = []
+    stem_of = [-1] * (pt[0] + 2)
+    for i in range(1, pt[0] + 1):
+        j = pt[i]
+        if j <= i:
+            # Unpaired or on the 3' strand of a known stem.
+            continue
+        if i > 1 and pt[i - 1] == j + 1:
+            stem = stem_of[i - 1]
+            stems[stem][1] = i
+            stems[stem][2] = j
+        else:
+            stem = len(stems)
+            stems.append([i, i, j, j])
+        stem_of[i] = stem
+        stem_of[j] = stem
+    return stems, stem_of
+
+
+def _find_loops(pt, stems, stem_of):
     """
-    See if there's any difference of one between the two
-    ends of the stem [(a,b),(c,d)] and a bulge (e,f)
+    Find all loops between the stems in a pair table.
+
+    Every maximal stretch of unpaired nucleotides is a loop and so is every
+    backbone link between two paired nucleotides that does not continue a stem.
+    The latter loops have a define of length 0.
 
-    :param stem: A couple of couples (2 x 2-tuple) indicating the start and end
-                 nucleotides of the stem in the form ((s1, e1), (s2, e2))
-    :param bulge: A couple (2-tuple) indicating the first and last position
-                  of the bulge.
-    :return: True if there is an overlap between the stem nucleotides and the
-                  bulge nucleotides. False otherwise
+    :returns: A list of triples (left, right, define), sorted along the
+              backbone. left and right are the paired nucleotides flanking the
+              loop. Their value is 0 and pt[0]+1 at the 5' and 3' end.
     """
-    for stem_part in stem:
-        for part in stem_part:
-            for bulge_part in bulge:
-                if abs(bulge_part - part) == 1:
-                    return True
-    return False
+    loops = []
+    prev_paired = 0
+    for i in range(1, pt[0] + 1):
+        if pt[i] == 0:
+            continue
+        if i - 1 > prev_paired:
+            loops.append((prev_paired, i, [prev_paired + 1, i - 1]))
+        elif prev_paired > 0:
+            stem = stems[stem_of[i]]
+            if stem_of[prev_paired] != stem_of[i] or (prev_paired == stem[1] and i == stem[2]):
+                loops.append((prev_paired, i, []))
+        prev_paired = i
+    if prev_paired < pt[0]:
+        loops.append((prev_paired, pt[0] + 1, [prev_paired + 1, pt[0]]))
+    return loops
 
 
 def remove_vertex(bg, v):
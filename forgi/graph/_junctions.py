@@ -0,0 +1,142 @@
+"""
+An index of all multiloops (junctions) of a BulgeGraph.
+
+A multiloop is a cycle (or, for exterior loops, a chain) of multiloop
+segments ("m", "f" and "t" elements), where every segment is followed
+by the next single stranded region along the stem it leads to
+(see BulgeGraph.get_next_ml_segment).
+"""
+import itertools as it
+import logging
+
+log = logging.getLogger(__name__)
+
+
+# This module belongs to the BulgeGraph and is allowed to access its private members
+# pylint: disable=protected-access
+
+
+class JunctionIndex(object):
+    """
+    All multiloops of a graph with their segments and descriptors,
+    calculated in one pass over the multiloop segments.
+
+    It yields the same results as walking the graph segment by segment
+    with BulgeGraph.get_next_ml_segment.
+    """
+
+    def __init__(self, bg):
+        """
+        :param bg: A BulgeGraph
+        """
+        segments = list(it.chain(bg.mloop_iterator(), bg.floop_iterator(),
+                                 bg.tloop_iterator()))
+        #: A dict {segment: next segment or None}
+        self.next_segment = bg._next_ml_segments()
+        loops = _loops_along_next_segments(segments, self.next_segment)
+        if loops is None:
+            # Several segments lead to the same segment (some pseudoknots)
+            loops = _loops_from_ml_graph(segments, self.next_segment)
+        loops = [_rotate_to_first(bg, loop) for loop in loops]
+        #: A sorted list of tuples, see BulgeGraph.find_mlonly_multiloops
+        self.loops = sorted(loops)
+        #: A dict {segment: multiloop}
+        self.loop_of = {}
+        for loop in self.loops:
+            for segment in loop:
+                self.loop_of[segment] = loop
+        #: A dict {multiloop: frozenset of descriptors},
+        #: see BulgeGraph.describe_multiloop
+        self.descriptors = {}
+        for loop in self.loops:
+            try:
+                self.descriptors[loop] = frozenset(bg._describe_multiloop(loop))
+            except (AssertionError, ValueError):
+                # Raised again, if describe_multiloop is called for this loop.
+                log.info("Cannot describe multiloop %s", loop)
+
+
+def _loops_along_next_segments(segments, next_segment):
+    """
+    Follow the next segments to get the multiloops.
+
+    Every multiloop is ordered along the backbone. Chains start at the
+    segment without a predecessor, cycles at any segment.
+
+    :returns: A list of lists or None, if a segment is the next segment
+              of more than one segment.
+    """
+    previous = {}
+    for segment, next_seg in next_segment.items():
+        if next_seg is not None:
+            if next_seg in previous:
+                return None
+            previous[next_seg] = segment
+    loops = []
+    visited = set()
+    for segment in segments:
+        if segment in visited:
+            continue
+        start = segment
+        while start in previous and previous[start] != segment:
+            start = previous[start]
+        loop = [start]
+        visited.add(start)
+        next_seg = next_segment[start]
+        while next_seg is not None and next_seg not in visited:
+            loop.append(next_seg)
+            visited.add(next_seg)
+            next_seg = next_segment[next_seg]
+        loops.append(loop)
+    return loops
+
+
+def _loops_from_ml_graph(segments, next_segment):
+    """
+    The multiloops as connected components of the graph of segments
+    and their next segments, each ordered along the backbone.
+
+    :returns: A list of lists
+    """
+    import networkx as nx
+    ml_graph = nx.Graph()
+    for d in segments:
+        if next_segment[d] is not None:
+            ml_graph.add_edge(d, next_segment[d])
+        else:
+            ml_graph.add_node(d)
+    loops = []
+    for comp in nx.connected_components(ml_graph):
+        # We need to start at a node with only 1 connection, if present
+        for x in comp:
+            if len(ml_graph.edges(x)) == 1:
+                st_node = x
+                break
+        else:
+            st_node = x  # Just take any node
+        # Sort nodes along the cycle
+        loop = list(nx.dfs_preorder_nodes(ml_graph.subgraph(comp), st_node))
+        # See if we need to reverse the order
+        for i, l in enumerate(loop):
+            next_l = next_segment[l]
+            if i + 1 < len(loop):
+                if loop[i + 1] == next_l:
+                    break
+            else:
+                if loop[0] == next_l:
+                    break
+        else:
+            loop.reverse()
+        loops.append(loop)
+    return loops
+
+
+def _rotate_to_first(bg, loop):
+    """
+    Start the multiloop at the segment with the lowest flanking nucleotides.
+
+    :returns: A tuple
+    """
+    first = min(loop, key=lambda x: sorted(bg.flanking_nucleotides(x)))
+    first_i = loop.index(first)
+    return tuple(loop[first_i:] + loop[:first_i])
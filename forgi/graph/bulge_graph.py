@@ -19,7 +19,12 @@
 import warnings
 import math
 import logging
+import heapq
 from pprint import pformat
+try:
+    from types import MappingProxyType
+except ImportError:  # Python 2
+    MappingProxyType = dict
 
 import numpy as np
 
@@ -27,12 +32,16 @@
 
 from ..utilities import stuff as fus
 from ..utilities.exceptions import GraphConstructionError, GraphIntegrityError
+from ..utilities.observedDict import observedDict
 from .sequence import Sequence, _insert_breakpoints_simple, SequenceLoader, _seq_ids_from_seq_str, VALID_CHAINIDS
 from . import transform_graphs as fgt
 from .residue import RESID
-from ._basegraph import BaseGraph
+from ._basegraph import BaseGraph, topology_memoized
 from ._graph_construction import _BulgeGraphConstruction
 from . import _cofold as fgc
+from . import _bp_distances as fgbd
+from . import _basepair_edit as fgbe
+from . import _junctions as fgj
 
 log = logging.getLogger(__name__)
 
@@ -44,7 +53,78 @@ def profile(x):
         return x
 
 
+class _BgFileLoader(object):
+    """
+    Parses the lines of a bg-file in a single pass.
+
+    Every line is dispatched on its first word to one of the methods in
+    `keywords`. Lines with unknown keywords are ignored.
+    Subclasses extend `keywords` for additional line types.
+    """
+    keywords = {
+        "seq": "_sequence_line",
+        "seq_ids": "_sequence_line",
+        "missing": "_sequence_line",
+        "modification": "_sequence_line",
+        "name": "_name_line",
+        "length": "_length_line",
+        "define": "_define_line",
+        "connect": "_connect_line",
+        "info": "_info_line",
+    }
+
+    def __init__(self):
+        self.seq_loader = SequenceLoader()
+        self.name = None
+        self.length = None
+        self.defines = {}
+        self.edges = col.defaultdict(set)
+        self.infos = col.defaultdict(list)
+        self._handlers = {key: getattr(self, method)
+                          for key, method in self.keywords.items()}
+
+    def consume_lines(self, lines):
+        handlers = self._handlers
+        for line in lines:
+            parts = line.split()
+            if parts:
+                handler = handlers.get(parts[0])
+                if handler is not None:
+                    handler(parts)
+
+    def _sequence_line(self, parts):
+        self.seq_loader.consume_fields(parts)
+
+    def _name_line(self, parts):
+        self.name = parts[1]
+
+    def _length_line(self, parts):
+        self.length = int(parts[1])
+
+    def _define_line(self, parts):
+        self.defines[parts[1]] = list(map(int, parts[2:]))
+
+    def _connect_line(self, parts):
+        for p in parts[2:]:
+            self.edges[parts[1]].add(p)
+            self.edges[p].add(parts[1])
+
+    def _info_line(self, parts):
+        self.infos[parts[1]].append(" ".join(parts[2:]))
+
+    def create(self, cls):
+        """
+        Create the BulgeGraph (or subclass) from all lines consumed so far.
+        """
+        # The defines in the file already contain the cofold cutpoints.
+        return cls(self, self.seq_loader.sequence, self.name, self.infos,
+                   _dont_split=True)
+
+
 class BulgeGraph(BaseGraph):
+    #: Used by from_bg_string. Subclasses with additional
+    #: line types in the file format set their own loader.
+    _bg_file_loader = _BgFileLoader
 
     def __init__(self, graph_construction, seq_obj, name=None, infos=None, _dont_split=False):   # pylint: disable=W0231
         """
@@ -64,9 +144,6 @@ def __init__(self, graph_construction, seq_obj, name=None, infos=None, _dont_spl
         #                     TODO: It would be better to move split_at_cofold_cutpoints
         #                     Somewhere out of BulgeGraph.
 
-        self.ang_types = None
-        self.mst = None
-        self.build_order = None
         if name is None:
             self.name = "untitled"
             log.info("No name given. name was set to %s", self.name)
@@ -75,17 +152,18 @@ def __init__(self, graph_construction, seq_obj, name=None, infos=None, _dont_spl
             self.name = name
         #: The coarse grain element definitions: Keys are for example 's1'/ 'm2'/ 'h3'/ 'f1'/ 't1'
         #: Values are the positions in the sequence (1D-coordinate) of start , end, ...
-        self.defines = {}
+        #: If the defines change, the nucleotide-to-element lookup is invalidated.
+        self.defines = observedDict(on_change=self._on_defines_change)
         self.defines.update(graph_construction.defines)
         self.edges = col.defaultdict(set)
         self.edges.update(graph_construction.edges)
         self.longrange = col.defaultdict(set)
 
         # Some cached values:
-        self.nx_graph = None
-        self.nuc_bp_dists = None
+        self._sparse_graph = None
+        self._corner_bp_dists = None
         self._elem_bp_dists = {}
-        self._node_to_resnum = {}
+        self._pair_table = None
 
         # Additional infos as key-value pairs are stored here.
         self.infos = col.defaultdict(list)
@@ -96,6 +174,8 @@ def __init__(self, graph_construction, seq_obj, name=None, infos=None, _dont_spl
 
         if not _dont_split:
             fgc.split_at_cofold_cutpoints(self, self.seq.backbone_breaks_after)
+        # The graph is complete, from now on topology queries are memoized.
+        self._structure_version = 0
 
     ############################################################################
     # Factory functions.
@@ -255,38 +335,9 @@ def from_bg_string(cls, bg_str):
         :param bg_str: The string representation of a BugleGraph.
         :returns: A BulgeGraphObject
         """
-        # Initialize an empty BulgeGraph. (this is cumbersome by design)
-        class DummyGraphConstr:
-            defines = {}
-            edges = {}
-        log.debug("Creating empty BG")
-        bg = cls(DummyGraphConstr(), Sequence("", []))
-        log.debug("Now loading BG")
-        lines = bg_str.split('\n')
-        length = None
-        seq_loader = SequenceLoader()
-        for line in lines:
-            line = line.strip()
-            parts = line.split()
-            if len(parts) == 0:
-                # blank line
-                continue
-            if seq_loader.consume_fields(parts):
-                continue
-            if parts[0] == 'length':
-                length = int(parts[1])
-            elif parts[0] == 'define':
-                bg.defines[parts[1]] = list(map(int, parts[2:]))
-            elif parts[0] == 'connect':
-                for p in parts[2:]:
-                    bg.edges[parts[1]].add(p)
-                    bg.edges[p].add(parts[1])
-            elif parts[0] == 'name':
-                bg.name = parts[1].strip()
-            elif parts[0] == 'info':
-                bg.infos[parts[1]].append(" ".join(parts[2:]))
-        bg._seq = seq_loader.sequence
-        return bg
+        loader = cls._bg_file_loader()
+        loader.consume_lines(bg_str.split('\n'))
+        return loader.create(cls)
 
     @classmethod
     def from_fasta_text(cls, fasta_text, dissolve_length_one_stems=False,
@@ -296,93 +347,56 @@ def from_fasta_text(cls, fasta_text, dissolve_length_one_stems=False,
 
         :returns: A list of BulgeGraphs
         """
-        # compile searches for the fasta id, sequence and
-        # secondary structure respectively
-        id_search = re.compile(r'>(.+)')
-        seq_search = re.compile(r'^([acgutACGUT&]+)$')
-        stru_search = re.compile(r'^([(){}<>.A-Za-z&\[\]]+)$')
-
-        prev_id = None
-        prev_seq = None
-        prev_struct = None
-        curr_id = None
-
-        bgs = []
-
-        for i, line in enumerate(fasta_text.split('\n')):
-            # newlines suck
-            line = line.strip()
-            # We allow comments
-            if line.startswith("#"):
-                continue
-            # find out what this line contains
-            id_match = id_search.match(line)
-            seq_match = seq_search.match(line)
-            stru_match = stru_search.match(line)
-
-            if id_match is not None:
-                prev_id = curr_id
-                # we found an id, check if there's a previous
-                # sequence and structure, and create a BG
-                curr_id = id_match.group(1)
-
-                if prev_seq is None and prev_struct is None:
-                    # must be the first sequence/structure
-                    continue
-
-                if prev_struct is None:
-                    raise GraphConstructionError(
-                        "No structure for id: {}".format(prev_id))
-
-                bg = cls.from_dotbracket(prev_struct, prev_seq, name=prev_id,
-                                         dissolve_length_one_stems=dissolve_length_one_stems,
-                                         remove_pseudoknots=remove_pseudoknots)
-                bgs.append(bg)
-                prev_seq = None
-                prev_struct = None
-                prev_id = None
-
-            if seq_match is not None:
-                curr_seq = seq_match.group(1)
-                if "t" in curr_seq or "T" in curr_seq:
-                    warnings.warn(
-                        "Original sequence contained T. All occurrences of T/t were replaced by U/u respectively!")
-                    curr_seq = curr_seq.replace("T", "U")
-                    curr_seq = curr_seq.replace("t", "u")
-                if prev_seq:
-                    prev_seq += curr_seq
-                else:
-                    prev_seq = curr_seq
-
-            if id_match is None and seq_match is None:
-                if stru_match:
-                    if prev_struct:
-                        prev_struct += line
-                    else:
-                        prev_struct = line
-                elif line:
-                    raise GraphConstructionError(
-                        "Cannot parse line {}: '{}' is neither sequence, nor structure, nor name (starting with '>'), nor comment (starting with '#').".format(i, line))
-
-        if prev_struct is None:
-            raise GraphConstructionError(
-                "Error during parsing of fasta file. No structure found for id {} and sequence {}".format(prev_id, prev_seq))
-
-        bg = cls.from_dotbracket(prev_struct, prev_seq, name=curr_id,
-                                 dissolve_length_one_stems=dissolve_length_one_stems,
-                                 remove_pseudoknots=remove_pseudoknots)
-        bgs.append(bg)
-
-        return bgs
+        return list(cls._iter_fasta_lines(fasta_text.split('\n'),
+                                          dissolve_length_one_stems,
+                                          remove_pseudoknots))
 
     @classmethod
     def from_fasta(cls, filename, dissolve_length_one_stems=False):
         """
         Return a list of BulgeGraphs from a fasta file.
         """
-        with open(filename) as f:
-            fasta_text = f.read()
-        return cls.from_fasta_text(fasta_text, dissolve_length_one_stems)
+        return list(cls.iter_fasta(filename, dissolve_length_one_stems))
+
+    @classmethod
+    def iter_fasta(cls, filename, dissolve_length_one_stems=False,
+                   remove_pseudoknots=False, name_filter=None):
+        """
+        Iterate over the BulgeGraphs in a fasta (or dotbracket) file.
+
+        In contrast to from_fasta, the file is read line by line and the
+        BulgeGraphs are created one at a time, so memory usage does not
+        depend on the number of records in the file.
+
+        :param filename: A filename or an open file-like object.
+        :param name_filter: If this is not None, only records with a name
+                    for which name_filter(name) is True are converted to
+                    BulgeGraphs, all other records are skipped.
+                    Alternatively a container (e.g. a set) of names to load.
+        :yields: BulgeGraphs
+        """
+        if fus.is_string_type(filename):
+            with open(filename) as f:
+                for bg in cls._iter_fasta_lines(f, dissolve_length_one_stems,
+                                                remove_pseudoknots, name_filter):
+                    yield bg
+        else:
+            for bg in cls._iter_fasta_lines(filename, dissolve_length_one_stems,
+                                            remove_pseudoknots, name_filter):
+                yield bg
+
+    @classmethod
+    def _iter_fasta_lines(cls, lines, dissolve_length_one_stems=False,
+                          remove_pseudoknots=False, name_filter=None):
+        if name_filter is not None and not callable(name_filter):
+            name_filter = name_filter.__contains__
+        for name, seq, struct in _iter_fasta_records(lines):
+            if name_filter is not None and not name_filter(name):
+                log.debug("Skipping record %s", name)
+                continue
+            yield cls.from_dotbracket(struct, seq, name=name,
+                                      dissolve_length_one_stems=dissolve_length_one_stems,
+                                      remove_pseudoknots=remove_pseudoknots)
 
     ############################################################################
     # Convert this object to different file formats.
@@ -521,9 +535,23 @@ def to_pair_table(self):
 
         i.e. [5,5,4,0,2,1]
         """
-        pair_tuples = self.to_pair_tuples()
+        return list(self._get_pair_table())
 
-        return fus.tuples_to_pairtable(pair_tuples)
+    def _get_pair_table(self):
+        """
+        The cached pair table. Do not modify the returned list.
+        """
+        if self._pair_table is None:
+            # Directly from the stems, because pairing_partner searches
+            # all stems for every nucleotide.
+            pt = [self.seq_length] + [0] * self.seq_length
+            for stem in self.stem_iterator():
+                define = self.defines[stem]
+                for k in range(define[1] - define[0] + 1):
+                    pt[define[0] + k] = define[3] - k
+                    pt[define[3] - k] = define[0] + k
+            self._pair_table = pt
+        return self._pair_table
 
     def to_pair_tuples(self, remove_basepairs=None):
         """
@@ -640,6 +668,44 @@ def to_networkx(self):
 
         return G
 
+    def to_sparse_graph(self):
+        """
+        The nucleotide graph of `to_networkx` as a sparse adjacency matrix.
+
+        This needs much less memory than the networkx graph and can be used
+        with the algorithms in scipy.sparse.csgraph.
+        Like in `to_networkx`, consecutive nucleotides are connected
+        (also across backbone breaks) and so are base-paired nucleotides.
+
+        :returns: A symmetric scipy.sparse.csr_matrix of shape
+                  (seq_length, seq_length). Row and column i-1 belong to
+                  nucleotide i. Connected nucleotides have an entry of 1.
+        """
+        return self._get_sparse_graph().copy()
+
+    def _get_sparse_graph(self):
+        """
+        A cached version of to_sparse_graph(), which is reset whenever the
+        defines change. It must not be modified by the caller.
+        """
+        if self._sparse_graph is None:
+            import scipy.sparse
+            n = self.seq_length
+            # The backbone and the base pairs of all stems (0-based)
+            stems = [self.defines[s] for s in self.stem_iterator()]
+            rows = [np.arange(n - 1)] + [np.arange(d[0] - 1, d[1]) for d in stems]
+            cols = [np.arange(1, n)] + [np.arange(d[3] - 1, d[2] - 2, -1) for d in stems]
+            rows = np.concatenate(rows)
+            cols = np.concatenate(cols)
+            graph = scipy.sparse.coo_matrix((np.ones(len(rows)), (rows, cols)),
+                                            shape=(n, n)).tocsr()
+            graph = graph + graph.T
+            # Base pairs between consecutive nucleotides are also backbone
+            # links. Their entries were summed up.
+            graph.data[:] = 1
+            self._sparse_graph = graph
+        return self._sparse_graph
+
     ###########################################################################
     # Helper functions only used for conversion
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -846,6 +912,7 @@ def stem_length(self, key):
         else:
             return min(self.get_bulge_dimensions(key))
 
+    @topology_memoized
     def define_a(self, elem):
         # Special case, because interior loops can have
         # defines of length 2 or 4
@@ -992,6 +1059,7 @@ def _define_a_nonzero(self, elem):
                 new_def.append(min(define[i + 1] + 1, self.seq_length))
         return new_def
 
+    @topology_memoized
     def _all_connections(self, elem):
         """
         Return the connected elements in order along the backbone.
@@ -1020,6 +1088,52 @@ def _all_connections(self, elem):
         return connections
     ############################################################################
 
+    def _on_defines_change(self, key):
+        """
+        Invalidate all cached values derived from the defines.
+        Called whenever the defines change.
+
+        :param key: The element, whose define was changed.
+        """
+        self._reset_element_lookup()
+        if self._structure_version is not None:
+            self._structure_version += 1
+        self._sparse_graph = None
+        self._corner_bp_dists = None
+        self._elem_bp_dists = {}
+        self._pair_table = None
+
+    def add_basepair(self, i, j):
+        """
+        Add the base pair (i, j) to the secondary structure.
+
+        Only the elements around the new base pair are updated. All other
+        elements keep their names. The elements are the same as those of a
+        BulgeGraph created from the new structure, but may have different names:
+        A changed element keeps the name of an old element of the same type
+        it overlaps with, new elements get the lowest unused number.
+
+        For structures with backbone breaks, the whole graph is rebuilt.
+
+        :param i, j: The 1-based numbers of two unpaired nucleotides.
+        :raises: ValueError, if one of the nucleotides is already paired.
+        :returns: A set with the names of all removed, new and changed elements.
+        """
+        return fgbe.add_basepair(self, i, j)
+
+    def remove_basepair(self, i, j):
+        """
+        Remove the base pair (i, j) from the secondary structure.
+
+        Only the elements around the base pair are updated,
+        see `add_basepair`.
+
+        :param i, j: The 1-based numbers of two paired nucleotides.
+        :raises: ValueError, if i and j do not form a base pair.
+        :returns: A set with the names of all removed, new and changed elements.
+        """
+        return fgbe.remove_basepair(self, i, j)
+
     def get_elem(self, position):
         """
         Get the secondary structure element from a nucleotide position
@@ -1028,11 +1142,7 @@ def get_elem(self, position):
         """
         if isinstance(position, RESID):
             position = self.seq.to_integer(position)
-
-        if position not in self._node_to_resnum:
-            self._node_to_resnum[position] = super(
-                BulgeGraph, self).get_node_from_residue_num(position)
-        return self._node_to_resnum[position]
+        return super(BulgeGraph, self).get_node_from_residue_num(position)
 
     def get_node_from_residue_num(self, base_num):
         """
@@ -1118,8 +1228,8 @@ def shortest_bg_loop(self, vertex):
         :return: A list containing the elements in the shortest cycle.
         """
         log.debug("Starting shortest BG loop for %s", vertex)
-        G = self.to_networkx()
-        log.debug("nx graph  %r with edges %r ", G, G.adj)
+        # A copy, because edges are removed below
+        graph = self.to_sparse_graph().tolil()
 
         # use the nucleotide in the middle of this element as the starting point
         residues = sorted(
@@ -1129,18 +1239,16 @@ def shortest_bg_loop(self, vertex):
         if len(residues) == 2:
             # no-residue multiloop
             # find the neighbor which isn't part of the multiloop
-            neighbors = [n for n in G.neighbors(mid_res) if n != residues[0]]
+            neighbors = [n + 1 for n in graph.rows[mid_res - 1] if n + 1 != residues[0]]
 
             if len(neighbors) == 2:
                 # break the chain so that we don't get cycles within a stem
                 for n in neighbors:
                     if abs(n - mid_res) == 1:
-                        G.remove_edge(n, mid_res)
+                        graph[n - 1, mid_res - 1] = graph[mid_res - 1, n - 1] = 0
                         break
 
-        import forgi.utilities.graph as fug
-
-        path = fug.shortest_cycle(G, mid_res)
+        path = _shortest_cycle(graph, mid_res)
         log.debug("Shortest cycle is %s", path)
         return path
 
@@ -1161,7 +1269,6 @@ def _chain_start_end(self, pos):
             else:
                 return self.backbone_breaks_after[i - 1] + 1
 
-    @profile
     def get_next_ml_segment(self, ml_segment):
         """
         Get the adjacent multiloop-segment (or 3' loop) next to the 3' side of ml_segment.
@@ -1169,6 +1276,17 @@ def get_next_ml_segment(self, ml_segment):
         If there is no other single stranded RNA after the stem, the backbone must end there.
         In that case return None.
         """
+        if self._topology_memo() is not None:
+            next_segments = self._next_ml_segments()
+            if ml_segment in next_segments:
+                return next_segments[ml_segment]
+        return self._next_ml_segment(ml_segment)
+
+    @profile
+    def _next_ml_segment(self, ml_segment):
+        """
+        Uncached version of get_next_ml_segment. Used to build the junction index.
+        """
         log.debug("get_next_ml_segment called for %s", ml_segment)
         if ml_segment.startswith("t"):
             return None
@@ -1208,10 +1326,11 @@ def get_next_ml_segment(self, ml_segment):
         elem = self.get_node_from_residue_num(ml_nuc)
         log.debug("side now %s, ml_nuc %s, ml %s", side_stem, ml_nuc, elem)
         if elem[0] == "s":
-            # 0-length multiloop
-            elems = self.edges[elem] & self.edges[s]
-            for elem in elems:
-                if self.element_length(elem) == 0:
+            # 0-length multiloop. Two stems may be connected by more than
+            # one of them, so compare their positions.
+            define_a = sorted([self.defines[s][side_stem], ml_nuc])
+            for elem in self.edges[elem] & self.edges[s]:
+                if self.element_length(elem) == 0 and self.define_a(elem) == define_a:
                     return elem
             assert False
         if elem[0] not in "mft":
@@ -1221,10 +1340,13 @@ def get_next_ml_segment(self, ml_segment):
         return elem
 
     def shortest_mlonly_multiloop(self, ml_segment):
-        loops = self.find_mlonly_multiloops()
-        for loop in loops:
-            if ml_segment in loop:
-                return loop
+        """
+        The multiloop (see `find_mlonly_multiloops`) containing the segment.
+
+        :param ml_segment: A "m", "f" or "t" element.
+        :returns: A tuple or None
+        """
+        return self._junction_index().loop_of.get(ml_segment)
 
     def flanking_nuc_at_stem_side(self, s, side):
         """
@@ -1335,6 +1457,7 @@ def has_connection(self, v1, v2):
 
             return False
 
+    @topology_memoized
     def connection_type(self, define, connections):
         """
         Classify the way that two stems are connected according to the type
@@ -1463,53 +1586,55 @@ def get_multiloop_nucleotides(self, multiloop_loop):
             residues += self.define_residue_num_iterator(m, adjacent=False)
         return residues
 
-    @profile
     def find_mlonly_multiloops(self):
-        import networkx as nx
-        ml_graph = nx.Graph()
-        for d in it.chain(self.mloop_iterator(), self.floop_iterator(), self.tloop_iterator()):
-            next_ml = self.get_next_ml_segment(d)
-            if next_ml is not None:
-                ml_graph.add_edge(d, next_ml)
-            else:
-                ml_graph.add_node(d)
-        loops = []
-        for comp in nx.connected_components(ml_graph):
-            # Order along the cycle, in arbitrary direction.
-
-            # We need to start at a node with only 1 connection, if present
-            for x in comp:
-                if len(ml_graph.edges(x)) == 1:
-                    st_node = x
-                    break
-            else:
-                st_node = x  # Just take any node
-            # Sort nodes along the cycle
-            loop = list(nx.dfs_preorder_nodes(
-                ml_graph.subgraph(comp), st_node))
-            # See if we need to reverse the order
-            for i, l in enumerate(loop):
-                next_l = self.get_next_ml_segment(l)
-                if i + 1 < len(loop):
-                    if loop[i + 1] == next_l:
-                        break
-                else:
-                    if loop[0] == next_l:
-                        break
-            else:
-                loop.reverse()
-            # Find first node
-            first = min(loop, key=lambda x: sorted(
-                self.flanking_nucleotides(x)))
-            first_i = loop.index(first)
-            loop = loop[first_i:] + loop[:first_i]
-            loops.append(tuple(loop))
-        return list(sorted(loops))
+        """
+        All multiloops, without the stems.
+
+        Every multiloop is a tuple of the multiloop segments ("m", "f" and "t"
+        elements), ordered along the backbone and starting with the segment
+        with the lowest flanking nucleotides. Exterior loops and pseudoknots
+        are included.
+
+        :returns: A sorted list of tuples
+        """
+        return list(self._junction_index().loops)
+
+    def _next_ml_segments(self):
+        """
+        A dict {segment: next segment} for all multiloop segments.
+        Cached until the structure changes.
+        """
+        return self._traversal_product("next_ml_segments", self._calculate_next_ml_segments)
+
+    def _calculate_next_ml_segments(self):
+        return {d: self._next_ml_segment(d)
+                for d in it.chain(self.mloop_iterator(), self.floop_iterator(),
+                                  self.tloop_iterator())}
+
+    def _junction_index(self):
+        """
+        All multiloops with their segments and descriptors.
+        Cached until the structure changes.
+        """
+        return self._traversal_product("junction_index",
+                                       lambda: fgj.JunctionIndex(self))
 
     def describe_multiloop(self, multiloop):
         """
+        Classify the multiloop.
+
         :param multiloop: An iterable of nodes (only "m", "t" and "f" elements)
+        :returns: A set of descriptors: "open", "pseudoknot" and/or
+                  "regular_multiloop"
         """
+        multiloop = tuple(multiloop)
+        if self._topology_memo() is not None:
+            descriptors = self._junction_index().descriptors.get(multiloop)
+            if descriptors is not None:
+                return set(descriptors)
+        return self._describe_multiloop(multiloop)
+
+    def _describe_multiloop(self, multiloop):
         descriptors = set()
         all_stems = col.Counter()
         angle_types = col.Counter()
@@ -1672,6 +1797,7 @@ def get_connected_residues(self, s1, s2, bulge=None):
         else:
             return [list(dists[0][1:])]
 
+    @topology_memoized
     def get_link_direction(self, stem1, stem2, bulge=None):
         """
         Get the direction in which stem1 and stem2 are linked (by the bulge)
@@ -1729,6 +1855,7 @@ def get_stem_edge(self, stem, pos):
         raise ValueError("Position (%d) not in stem (%s)." % (pos, stem))
 
 
+    @topology_memoized
     def get_sides(self, s1, b):
         """
         Get the side of s1 that is next to b.
@@ -2116,11 +2243,14 @@ def connected_stem_iterator(self):
     def sorted_edges_for_mst(self):
         """
         Keep track of all linked nodes. Used for the generation of the minimal spanning tree.
+
+        Ties are broken by the position of the elements, not by their names.
         """
         priority = {'s': 1, 'i': 2, 'm': 3, 'f': 4, 't': 5}
         edges = sorted(it.chain(self.mloop_iterator(),
                                 self.iloop_iterator()),
-                       key=lambda x: (priority[x[0]], min(self.get_node_dimensions(x)), x))
+                       key=lambda x: (priority[x[0]], min(self.get_node_dimensions(x)),
+                                      self.define_a(x)))
         return edges
 
     def get_mst(self):
@@ -2129,44 +2259,47 @@ def get_mst(self):
         for constructing a structure where each section of a multiloop is
         sampled independently and we want to introduce a break at the largest
         multiloop section.
+
+        See also the cached, read-only property `mst`.
+
+        :returns: A set of element names
         """
-        # keep track of all linked nodes
-        edges = self.sorted_edges_for_mst()
+        return set(self.mst)
 
+    @property
+    def mst(self):
+        """
+        The elements in the minimum spanning tree (a frozenset).
+
+        Read-only. It is cached until the structure changes.
+        """
+        return self._traversal_product("mst", self._calculate_mst)
+
+    def _calculate_mst(self):
+        # Kruskal's algorithm with a union-find over the elements.
         mst = set(it.chain(self.stem_iterator(),
                            self.floop_iterator(),
                            self.tloop_iterator(),
                            self.hloop_iterator()))
+        parent = {elem: elem for elem in mst}
 
-        # store all of the disconnected trees
-        forest = [set([m]) for m in mst]
-
-        # get the tree containing a particular element
-        def get_tree(elem):
-            for t in forest:
-                if elem in t:
-                    return t
+        def find(elem):
+            while parent[elem] != elem:
+                parent[elem] = parent[parent[elem]]
+                elem = parent[elem]
+            return elem
 
-        while len(edges) > 0:
-            conn = edges.pop(0)
-            neighbors = list(self.edges[conn])
-
-            # get the trees containing the neighbors of this node
-            # the node should be an interior loop or multiloop so
+        for conn in self.sorted_edges_for_mst():
+            # The node should be an interior loop or multiloop so
             # the neighbors should necessarily be stems, 5' or 3'
-            t1 = get_tree(neighbors[0])
-            t2 = get_tree(neighbors[1])
-
-            if len(set.intersection(t1, t2)) == 0:
+            neighbors = list(self.edges[conn])
+            root1 = find(neighbors[0])
+            root2 = find(neighbors[1])
+            if root1 != root2:
                 # if this node connects two disparate trees, then add it to the mst
-                new_tree = t1.union(t2)
-                forest.remove(t1)
-                forest.remove(t2)
-                forest.append(new_tree)
-
+                parent[root1] = root2
                 mst.add(conn)
-
-        return mst
+        return frozenset(mst)
 
     def traverse_graph(self):
         """
@@ -2174,29 +2307,51 @@ def traverse_graph(self):
         which corners of the stem are connected by the multiloop or internal
         loop.
 
+        See also the cached, read-only property `build_order`.
+
         :returns: A list of triples (stem, loop, stem)
         """
-        if self.mst is None:
-            self.mst = self.get_mst()
+        return list(self.build_order)
+
+    @property
+    def build_order(self):
+        """
+        The order in which the stems are connected in a breadth-first
+        traversal along the minimum spanning tree.
+
+        Read-only. It is cached until the structure changes.
+
+        A tuple of triples (stem, loop, stem).
+        """
+        return self._traversal_product("build_order", self._calculate_build_order)
 
+    def _calculate_build_order(self):
+        mst = self.mst
         build_order = []
-        to_visit = [('s0', 'start')]
-        visited = set(['s0'])
-        build_paths = col.defaultdict(list)
+        # A heap instead of sorting the list of elements to visit after every
+        # step. The counter keeps elements of equal size in the order in which
+        # they were added.
+        counter = it.count()
+        stems = list(self.stem_iterator())
+        if not stems:
+            return ()
+        # Start at the first stem. It is 's0', unless base pairs were
+        # added or removed.
+        first = min(stems, key=lambda s: self.defines[s][0])
+        to_visit = [(min(self.get_node_dimensions(first)), next(counter), first, 'start')]
+        visited = set([first])
 
         while len(to_visit) > 0:
-            to_visit.sort(key=lambda x: min(self.get_node_dimensions(x[0])))
-            (current, prev) = to_visit.pop(0)
+            _, _, current, prev = heapq.heappop(to_visit)
 
-            for e in self.edges[current]:
-                if e not in visited and e in self.mst:
+            # Sorted by position, so elements of equal size are visited in
+            # the same order, independent of the order of the set.
+            for e in sorted(self.edges[current], key=self.define_a):
+                if e not in visited and e in mst:
                     # make sure the node hasn't been visited
                     # and is in the minimum spanning tree
-                    to_visit.append((e, current))
-
-                    build_paths[e] += [e]
-                    build_paths[e] += build_paths[current]
-
+                    heapq.heappush(to_visit, (min(self.get_node_dimensions(e)),
+                                              next(counter), e, current))
                     visited.add(e)
 
             if current[0] != 's' and len(self.edges[current]) == 2:
@@ -2206,21 +2361,50 @@ def traverse_graph(self):
                 # equal to prev
                 next_stem = set.difference(self.edges[current],
                                            set([prev]))
-                build_order += [(prev, current, list(next_stem)[0])]
-        self.build_order = build_order
-
-        return build_order
+                build_order.append((prev, current, list(next_stem)[0]))
+        return tuple(build_order)
 
     def set_angle_types(self):
         """
-        Fill in the angle types based on the build order
+        Fill in the angle types based on the build order.
+
+        The angle types are calculated on demand, so calling this is
+        not necessary. See the property `ang_types`.
+        """
+        self.ang_types  # pylint: disable=pointless-statement
+
+    @property
+    def ang_types(self):
+        """
+        A read-only dictionary {loop: angle type}, for all interior loops and
+        multiloop segments in the build order.
+
+        It is cached until the structure changes.
         """
-        if self.build_order is None:
-            self.traverse_graph()
+        return self._traversal_product("ang_types", self._calculate_ang_types)
 
-        self.ang_types = dict()
+    def _calculate_ang_types(self):
+        ang_types = {}
         for (s1, b, s2) in self.build_order:
-            self.ang_types[b] = self.connection_type(b, [s1, s2])
+            ang_types[b] = self.connection_type(b, [s1, s2])
+        return MappingProxyType(ang_types)
+
+    def _traversal_product(self, key, calculate):
+        """
+        The cached result of calculate(), stored in the topology memo.
+
+        Graphs, which do not track changes of their structure,
+        calculate the value on every call.
+        """
+        memo = self._topology_memo()
+        if memo is None:
+            return calculate()
+        key = ("traversal", key)
+        try:
+            return memo[key]
+        except KeyError:
+            value = memo[key] = calculate()
+            return value
 
     def get_angle_type(self, bulge, allow_broken=False):
         """
@@ -2234,11 +2418,9 @@ def get_angle_type(self, bulge, allow_broken=False):
                              * True: Return the angle type according to the build-order
                                (i.e. from the first built stem to the last-built stem)
         """
-        if self.ang_types is None:
-            self.set_angle_types()
-
-        if bulge in self.ang_types:
-            return self.ang_types[bulge]
+        ang_types = self.ang_types
+        if bulge in ang_types:
+            return ang_types[bulge]
         else:
             if allow_broken:
                 stems = self.connections(bulge)
@@ -2255,12 +2437,15 @@ def buildorder_of(self, element):
         :returns: An index into self.build_order or None, if the element is not
                   part of the build_order (e.g. hairpin loops)
         """
-        if self.build_order is None:
-            self.traverse_graph()
+        return self._traversal_product("buildorder_index",
+                                       self._calculate_buildorder_index).get(element)
+
+    def _calculate_buildorder_index(self):
+        index = {}
         for i, elements in enumerate(self.build_order):
-            if element in elements:
-                return i
-        return None
+            for element in elements:
+                index.setdefault(element, i)
+        return index
 
     def is_loop_pseudoknot(self, loop):
         """
@@ -2384,45 +2569,66 @@ def ss_distance(self, e1, e2):
         :return: The integer distance between the two elements / residues along the secondary
                  structure. (if a element is given, we use its corner for the distance, otherwise the exact nucleotide)
         '''
-        # get the edge nucleotides
-        # thanks to:
-        # http://stackoverflow.com/questions/2154249/identify-groups-of-continuous-numbers-in-a-list
-        # we get the edges, except that they might be one too close because we use adjacent
-        # nucleotides, nevertheless we'll take care of that later
-        d1_corners = []
-        d2_corners = []
-
-        correction = 0
-
-        if isinstance(e1, int):
-            d1_corners=[e1]
-        elif isinstance(e1, RESID):
-            d1_corners=[self.seq.to_integer(e1)]
-        else:
-            d1_corners=self.defines[e1]
-            if not d1_corners:
-                d1_corners=self.define_a(e1)
-                correction+=1
-
-        if isinstance(e2, int):
-            d2_corners=[e2]
-        elif isinstance(e2, RESID):
-            d2_corners=[self.seq.to_integer(e2)]
-        else:
-            d2_corners=self.defines[e2]
-            if not d2_corners:
-                d2_corners=self.define_a(e2)
-                correction+=1
-
+        d1_corners, correction1 = self._ss_distance_corners(e1)
+        d2_corners, correction2 = self._ss_distance_corners(e2)
         log.debug("Corners for distance are %s and %s", d1_corners, d2_corners)
-        import networkx as nx
-
-        G = self.to_networkx()
-        path_lengths = []
-        for c1, c2 in it.product(d1_corners, d2_corners):
-            path_lengths += [nx.shortest_path_length(G, c1, c2)]
 
-        return min(path_lengths)+correction
+        corner_dists = self._get_corner_bp_dists()
+        if (np.all(np.isin(d1_corners, corner_dists.positions)) and
+                np.all(np.isin(d2_corners, corner_dists.positions))):
+            i1 = np.searchsorted(corner_dists.positions, d1_corners)
+            i2 = np.searchsorted(corner_dists.positions, d2_corners)
+            dist = int(corner_dists.distances[np.ix_(i1, i2)].min())
+        else:
+            # At least one nucleotide in the middle of an element
+            dist = _bfs_distance(self._get_sparse_graph(), d1_corners, d2_corners)
+        return dist + correction1 + correction2
+
+    def _ss_distance_corners(self, elem):
+        """
+        Used by ss_distance. The nucleotides from which the distance is
+        measured and the correction for zero-length elements.
+
+        :param elem: An element name, a 1-based nucleotide number or a RESID
+        :returns: A tuple (list of nucleotide numbers, correction)
+        """
+        if isinstance(elem, int):
+            return [elem], 0
+        elif isinstance(elem, RESID):
+            return [self.seq.to_integer(elem)], 0
+        elif not self.defines[elem]:
+            # Zero-length elements. We use the adjacent nucleotides,
+            # which are one too close.
+            return self.define_a(elem), 1
+        return self.defines[elem], 0
+
+    def ss_distance_matrix(self, elements=None):
+        """
+        Calculate ss_distance for all pairs of elements at once.
+
+        :param elements: A list of element names. If this is None,
+                         all elements in the order of `self.defines`
+        :returns: A 2D numpy integer array with rows and columns
+                  in the order of elements.
+        """
+        if elements is None:
+            elements = list(self.defines.keys())
+        corner_dists = self._get_corner_bp_dists()
+        corners = []
+        corrections = []
+        for elem in elements:
+            c, correction = self._ss_distance_corners(elem)
+            corners.append(np.searchsorted(corner_dists.positions, c))
+            corrections.append(correction)
+        if not corners:
+            return np.zeros((0, 0), dtype=int)
+        order = np.concatenate(corners)
+        starts = np.cumsum([0] + [len(c) for c in corners[:-1]])
+        grouped = corner_dists.distances[np.ix_(order, order)]
+        dists = np.minimum.reduceat(np.minimum.reduceat(grouped, starts, axis=0),
+                                    starts, axis=1)
+        corrections = np.array(corrections)
+        return dists.astype(int) + corrections[:, np.newaxis] + corrections[np.newaxis, :]
 
     def define_residue_num_iterator(self, node, adjacent=False, seq_ids=False):
         """
@@ -2454,19 +2660,18 @@ def shortest_path(self, e1, e2):
 
         '''
 
-        import networkx as nx
-
-        # Get residue numbers of source and targets, for shortest_path in nx
+        # Get residue numbers of source and targets
         source = min([res for res in self.define_residue_num_iterator(e1)])
         target = min([res for res in self.define_residue_num_iterator(e2)])
 
-        # Get nx graph, and the shortest path
-        G = self.to_networkx()
-        nx_sp = nx.shortest_path(G, source=source, target=target)
+        # The shortest path of residue numbers in the nucleotide graph
+        res_sp = _bfs_path(self._get_sparse_graph(), source, target)
+        if res_sp is None:
+            raise GraphIntegrityError("No path between {} and {}".format(e1, e2))
 
         # Convert shortest path of residue numbers to a shortest path of node names
         sp, sp_set = [], set()  # Use set to keep track of additions for faster lookup
-        for res in nx_sp:
+        for res in res_sp:
             node = self.get_node_from_residue_num(res)
             if node not in sp_set:
                 sp_set.add(node)
@@ -2588,38 +2793,193 @@ def min_max_bp_distance(self, e1, e2):
         if (e1, e2) in self._elem_bp_dists:  # Shortcut if cached.
             return self._elem_bp_dists[(e1, e2)]
 
-        min_bp = sys.maxsize
-        max_bp = 0
-
-        if self.nx_graph is None:
-            self.nx_graph = self.to_networkx()
-
-        if self.nuc_bp_dists is None:
-            import networkx as nx
-            self.nuc_bp_dists = np.zeros(
-                (self.seq_length + 1, self.seq_length + 1))  # col.defaultdict(dict)
-            self.nuc_bp_dists[0, :] = np.nan
-            self.nuc_bp_dists[:, 0] = np.nan
-            dist_matrix = np.array(nx.floyd_warshall_numpy(self.nx_graph))
-            for (i1, n1), (i2, n2) in it.product(enumerate(self.nx_graph.nodes()),
-                                                 enumerate(self.nx_graph.nodes())):
-                self.nuc_bp_dists[n1, n2] = dist_matrix[i1][i2]
-
-        for f1, f2 in it.product(set(self.defines[e1]), set(self.defines[e2])):
-            #d =  nx.dijkstra_path_length(self.nx_graph, f1, f2)
-            d = self.nuc_bp_dists[f1, f2]
-
-            if d < min_bp:
-                min_bp = d
-            if d > max_bp:
-                max_bp = d
+        min_bp, max_bp = self._get_corner_bp_dists().min_max(e1, e2)
         self._elem_bp_dists[(e1, e2)] = (min_bp, max_bp)
         self._elem_bp_dists[(e2, e1)] = (min_bp, max_bp)
         return (min_bp, max_bp)
 
+    def min_max_bp_distance_matrix(self, elements=None):
+        """
+        Get the minimum and maximum base pair distances between all pairs
+        of elements at once.
+
+        The entries are the same as the values returned by
+        `self.min_max_bp_distance`.
+
+        :param elements: A list of element names. If this is None,
+                         all elements in the order of `self.defines`
+        :returns: A tuple of two 2D numpy arrays (min_dists, max_dists),
+                  with rows and columns in the order of elements.
+        """
+        if elements is None:
+            elements = list(self.defines.keys())
+        return self._get_corner_bp_dists().min_max_matrix(list(elements))
+
+    def _get_corner_bp_dists(self):
+        if self._corner_bp_dists is None:
+            self._corner_bp_dists = fgbd.CornerDistances(self)
+        return self._corner_bp_dists
+
 # Free functions
 
 
+def _iter_fasta_records(lines):
+    """
+    Parse fasta(like) records with a secondary structure line by line.
+
+    Sequence lines may contain N (unknown nucleotide). Without this, a line
+    like "NNNN" would be read as a secondary structure of unclosed brackets.
+
+    :param lines: An iterable of strings, e.g. an open file.
+    :yields: Tuples (name, sequence, dotbracket). name and sequence may be None.
+    """
+    # compile searches for the fasta id, sequence and
+    # secondary structure respectively
+    id_search = re.compile(r'>(.+)')
+    seq_search = re.compile(r'^([acgutnACGUTN&]+)$')
+    stru_search = re.compile(r'^([(){}<>.A-Za-z&\[\]]+)$')
+
+    prev_seq = None
+    prev_struct = None
+    curr_id = None
+
+    for i, line in enumerate(lines):
+        # newlines suck
+        line = line.strip()
+        # We allow comments
+        if line.startswith("#"):
+            continue
+        # find out what this line contains
+        id_match = id_search.match(line)
+        seq_match = seq_search.match(line)
+        stru_match = stru_search.match(line)
+
+        if id_match is not None:
+            prev_id = curr_id
+            # we found an id, check if there's a previous
+            # sequence and structure, and yield it
+            curr_id = id_match.group(1)
+
+            if prev_seq is None and prev_struct is None:
+                # must be the first sequence/structure
+                continue
+
+            if prev_struct is None:
+                raise GraphConstructionError(
+                    "No structure for id: {}".format(prev_id))
+
+            yield prev_id, prev_seq, prev_struct
+            prev_seq = None
+            prev_struct = None
+
+        if seq_match is not None:
+            curr_seq = seq_match.group(1)
+            if "t" in curr_seq or "T" in curr_seq:
+                warnings.warn(
+                    "Original sequence contained T. All occurrences of T/t were replaced by U/u respectively!")
+                curr_seq = curr_seq.replace("T", "U")
+                curr_seq = curr_seq.replace("t", "u")
+            if prev_seq:
+                prev_seq += curr_seq
+            else:
+                prev_seq = curr_seq
+
+        if id_match is None and seq_match is None:
+            if stru_match:
+                if prev_struct:
+                    prev_struct += line
+                else:
+                    prev_struct = line
+            elif line:
+                raise GraphConstructionError(
+                    "Cannot parse line {}: '{}' is neither sequence, nor structure, nor name (starting with '>'), nor comment (starting with '#').".format(i, line))
+
+    if prev_struct is None:
+        raise GraphConstructionError(
+            "Error during parsing of fasta file. No structure found for id {} and sequence {}".format(curr_id, prev_seq))
+
+    yield curr_id, prev_seq, prev_struct
+
+
+def _bfs_path(graph, source, target):
+    """
+    One of the shortest paths from source to target in the nucleotide graph.
+
+    :param graph: A sparse adjacency matrix, see BulgeGraph.to_sparse_graph
+    :param source: A 1-based nucleotide number
+    :param target: A 1-based nucleotide number
+    :returns: A list of 1-based nucleotide numbers from source to target,
+              or None, if target cannot be reached.
+    """
+    import scipy.sparse.csgraph
+    _, predecessors = scipy.sparse.csgraph.breadth_first_order(
+        graph, source - 1, directed=False, return_predecessors=True)
+    path = [target - 1]
+    while path[-1] != source - 1:
+        node = predecessors[path[-1]]
+        if node < 0:
+            return None
+        path.append(node)
+    return [node + 1 for node in reversed(path)]
+
+
+def _shortest_cycle(graph, v):
+    """
+    One of the shortest cycles in the nucleotide graph, which include v.
+
+    Used by BulgeGraph.shortest_bg_loop. The sparse version of
+    forgi.utilities.graph.shortest_cycle
+
+    :param graph: A sparse adjacency matrix, see BulgeGraph.to_sparse_graph
+    :param v: A 1-based nucleotide number
+    :returns: A list of 1-based nucleotide numbers, starting with v.
+              An empty list, if v is not part of a cycle.
+    """
+    lengths = []
+    graph = graph.tolil()
+    for n in list(graph.rows[v - 1]):
+        # Paths from v to its neighbor n, which do not use the edge (v, n)
+        graph[v - 1, n] = graph[n, v - 1] = 0
+        path = _bfs_path(graph.tocsr(), v, n + 1)
+        graph[v - 1, n] = graph[n, v - 1] = 1
+        if path is not None:
+            lengths.append((len(path), path))
+    if lengths:
+        return min(lengths)[1]
+    return []
+
+
+def _bfs_distance(graph, sources, targets):
+    """
+    The length of the shortest path from any of the sources to any of the
+    targets in the nucleotide graph.
+
+    Used by BulgeGraph.ss_distance.
+
+    :param graph: A sparse adjacency matrix, see BulgeGraph.to_sparse_graph
+    :param sources: A list of 1-based nucleotide numbers
+    :param targets: A list of 1-based nucleotide numbers
+    """
+    import scipy.sparse.csgraph
+    best = None
+    for source in sources:
+        # A breadth first search, without the distances. They are found by
+        # walking back from the targets.
+        _, predecessors = scipy.sparse.csgraph.breadth_first_order(
+            graph, source - 1, directed=False, return_predecessors=True)
+        for target in targets:
+            node = target - 1
+            dist = 0
+            while node != source - 1 and node >= 0:
+                node = predecessors[node]
+                dist += 1
+            if node >= 0 and (best is None or dist < best):
+                best = dist
+    if best is None:
+        raise GraphIntegrityError("No path between {} and {}".format(sources, targets))
+    return best
+
+
 def print_brackets(brackets):
     """
     Print the brackets and a numbering, for debugging purposes
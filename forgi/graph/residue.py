@@ -8,6 +8,9 @@
 
 class RESID(Resid_base):
     # Thanks to https://stackoverflow.com/a/42146452 for hints on extending named_tuples
+    # No per-instance __dict__. Structures hold one RESID per nucleotide.
+    __slots__ = ()
+
     def __repr__(self):
         return "Res(\"" + resid_to_str(self) + "\")"
 
@@ -41,14 +44,13 @@ def resid_from_str(resstr):
         chain, resid = resstr.split(":")
     else:
         resid = resstr
-        log.debug("No chain given in string {!r}".format(resstr))
+        log.debug("No chain given in string %r", resstr)
         chain = None
-    if chain is not None:
-        chain = str(chain)
     idparts = resid.split(".")
     if len(idparts) == 1:
         idparts.append(" ")
-    return RESID(chain, (' ', int(idparts[0]), str(idparts[1])))
+    # All parts are already normalized, so RESID.__new__ can be bypassed.
+    return Resid_base.__new__(RESID, chain, (' ', int(idparts[0]), idparts[1]))
 
 
 def resid_from_biopython(residue):
@@ -23,6 +23,8 @@
 
 
 class MissingResidue(object):
+    __slots__ = ("resid", "res_name")
+
     def __init__(self, resid, res_name):
         """
         :param resid: A fgr.RESID instance of a string.
@@ -350,18 +352,15 @@ def __init__(self, seq, seqids, missing_residues=None, modifications=None):
         :param missing_residues: A list of dictionaries with the following keys:
                 "res_name", "chain", "ssseq", "insertion"
         """
-        log.debug("Sequence initialized with %s, %s, %s", seq, list(
-            map(fgr.resid_to_str, seqids)), missing_residues)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Sequence initialized with %s, %s, %s", seq, list(
+                map(fgr.resid_to_str, seqids)), missing_residues)
         # Uses 0-based indexing
-        i = 0
         self._breaks_after = []
-        remaining = seq
-        while remaining:
-            c, remaining = remaining[0], remaining[1:]
+        for j, c in enumerate(seq):
             if c == '&':
-                self._breaks_after.append(i - 1)
-            else:
-                i += 1
+                # j-1 nucleotides and len(self._breaks_after) '&'s precede c.
+                self._breaks_after.append(j - len(self._breaks_after) - 1)
         log.debug("Break-points for seq %s are: %s", seq, self._breaks_after)
         self._seq = seq.replace('&', '')
         self._seqids = SeqidList(seqids)
@@ -0,0 +1,193 @@
+"""
+A compact, immutable representation of the secondary structure of a BulgeGraph.
+
+The element table is stored as a structured numpy array and the adjacency
+as CSR arrays (indptr/indices), so a topology needs a few bytes per element
+instead of one dict entry, list and set per element.
+A single GraphTopology can be shared by many 3D structures of the same RNA
+(see forgi.threedee.model.compact).
+"""
+from __future__ import absolute_import, division, print_function
+
+import logging
+
+import numpy as np
+
+from ._basegraph import BaseGraph
+
+log = logging.getLogger(__name__)
+
+#: The dtype of GraphTopology.elements.
+#: Defines shorter than 4 (loops and zero-length elements) are padded with 0.
+ELEMENT_DTYPE = np.dtype([("type", "U1"),
+                          ("define", np.int32, (4,)),
+                          ("define_len", np.int8)])
+
+
+def _readonly(array):
+    array.flags.writeable = False
+    return array
+
+
+def _frozen_items(mapping):
+    """
+    A dict of lists (like BulgeGraph.infos) as sorted tuple of (key, tuple) pairs.
+    """
+    return tuple(sorted((key, tuple(values)) for key, values in dict(mapping).items()))
+
+
+class GraphTopology(object):
+    """
+    The defines and edges of a BulgeGraph, together with its name,
+    sequence and infos.
+
+    Instances are immutable and can safely be shared between many
+    structures that only differ in their coordinates.
+    BulgeGraph.longrange is not part of the topology.
+
+    Elements are numbered in the order of `names`, which is sorted
+    by element name.
+    """
+    __slots__ = ("name", "seq", "names", "elements", "indptr", "indices",
+                 "infos", "_name_to_index", "__weakref__")
+
+    def __init__(self, name, seq, names, elements, indptr, indices, infos=()):
+        """
+        Use GraphTopology.from_bg instead of calling this directly.
+
+        :param name: The name of the RNA.
+        :param seq: A forgi.graph.sequence.Sequence instance
+        :param names: A sequence of element names
+        :param elements: A structured array with dtype ELEMENT_DTYPE
+        :param indptr, indices: The adjacency of the elements in CSR format.
+                                The neighbors of element i are
+                                indices[indptr[i]:indptr[i+1]]
+        :param infos: A dict of lists, like BulgeGraph.infos. It is stored as
+                      sorted tuple of (key, tuple of values) pairs.
+        """
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "seq", seq)
+        object.__setattr__(self, "names", tuple(names))
+        object.__setattr__(self, "elements", _readonly(elements))
+        object.__setattr__(self, "indptr", _readonly(indptr))
+        object.__setattr__(self, "indices", _readonly(indices))
+        object.__setattr__(self, "infos", _frozen_items(infos))
+        object.__setattr__(self, "_name_to_index",
+                           {elem: i for i, elem in enumerate(self.names)})
+
+    def __setattr__(self, key, value):
+        raise AttributeError("GraphTopology is immutable")
+
+    def __delattr__(self, key):
+        raise AttributeError("GraphTopology is immutable")
+
+    def __reduce__(self):
+        return (self.__class__, (self.name, self.seq, self.names,
+                                 self.elements.copy(), self.indptr.copy(),
+                                 self.indices.copy(), self.infos))
+
+    @classmethod
+    def from_bg(cls, bg):
+        """
+        Create the topology of a BulgeGraph (or CoarseGrainRNA).
+
+        :param bg: A BulgeGraph
+        """
+        names = sorted(bg.defines)
+        name_to_index = {elem: i for i, elem in enumerate(names)}
+        elements = np.zeros(len(names), dtype=ELEMENT_DTYPE)
+        indptr = np.zeros(len(names) + 1, dtype=np.int32)
+        indices = []
+        for i, elem in enumerate(names):
+            define = bg.defines[elem]
+            elements[i]["type"] = elem[0]
+            elements[i]["define"][:len(define)] = define
+            elements[i]["define_len"] = len(define)
+            neighbors = sorted(name_to_index[other] for other in bg.edges[elem])
+            indices.extend(neighbors)
+            indptr[i + 1] = len(indices)
+        return cls(bg.name, bg.seq, names, elements, indptr,
+                   np.array(indices, dtype=np.int32), bg.infos)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __eq__(self, other):
+        if not isinstance(other, GraphTopology):
+            return NotImplemented
+        if self is other:
+            return True
+        return (self.names == other.names and
+                str(self.seq) == str(other.seq) and
+                self.infos == other.infos and
+                np.array_equal(self.elements, other.elements) and
+                np.array_equal(self.indptr, other.indptr) and
+                np.array_equal(self.indices, other.indices))
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        if eq is NotImplemented:
+            return eq
+        return not eq
+
+    __hash__ = object.__hash__
+
+    def index(self, elem):
+        """
+        The position of an element in `names` and `elements`.
+
+        :raises: KeyError, if the element does not exist.
+        """
+        return self._name_to_index[elem]
+
+    def define(self, elem):
+        """
+        The define of an element as a list, like BulgeGraph.defines[elem]
+        """
+        row = self.elements[self.index(elem)]
+        return [int(x) for x in row["define"][:row["define_len"]]]
+
+    def neighbors(self, elem):
+        """
+        The names of all elements connected to elem, like BulgeGraph.edges[elem]
+        """
+        i = self.index(elem)
+        return set(self.names[j]
+                   for j in self.indices[self.indptr[i]:self.indptr[i + 1]])
+
+    def stem_names(self):
+        """
+        The names of all stems in the order of `names`.
+        """
+        return [elem for elem in self.names if elem[0] == "s"]
+
+    @property
+    def nbytes(self):
+        """
+        The number of bytes used by the numpy arrays of this topology.
+        """
+        return self.elements.nbytes + self.indptr.nbytes + self.indices.nbytes
+
+    def to_graph_construction(self):
+        """
+        A graph-like object holding defines and edges as dicts,
+        which can be passed to BulgeGraph.__init__
+        """
+        constr = BaseGraph()
+        for elem in self.names:
+            constr.defines[elem] = self.define(elem)
+            constr.edges[elem] = self.neighbors(elem)
+        return constr
+
+    def to_bg(self, cls=None):
+        """
+        Create a new, independent BulgeGraph with this topology
+        (including the name, sequence and infos).
+
+        :param cls: The class of the returned object. Defaults to BulgeGraph.
+        """
+        if cls is None:
+            from .bulge_graph import BulgeGraph as cls
+        infos = dict((key, list(values)) for key, values in self.infos)
+        return cls(self.to_graph_construction(), self.seq, self.name, infos,
+                   _dont_split=True)
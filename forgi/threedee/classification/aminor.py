@@ -67,18 +67,21 @@ def loop_potential_interactions(cg, loop, domain=None):
         stems = (s for s in domain if s[0] == "s")
     else:
         stems = cg.stem_iterator()
-    for stem in stems:
-        if stem in cg.edges[loop]:
-            continue
-        # To save computation time
-        if not ftuv.elements_closer_than(cg.coords[loop][0],
-                                         cg.coords[loop][1],
-                                         cg.coords[stem][0],
-                                         cg.coords[stem][1],
-                                         CUTOFFDIST):
-            continue
-        geos.append(get_relative_orientation(cg, loop, stem))
-        labels.append([loop, stem])
+    stems = [stem for stem in stems if stem not in cg.edges[loop]]
+    if stems:
+        stem_coords = cg.coords[stems]
+        loop_start, loop_end = cg.coords[loop]
+        # The closest points of all stems and the loop at once.
+        points_on_stems, points_on_loop, distances = ftuv.segment_distances(
+            stem_coords[::2], stem_coords[1::2],
+            np.tile(loop_start, (len(stems), 1)), np.tile(loop_end, (len(stems), 1)))
+        for i, stem in enumerate(stems):
+            # To save computation time
+            if not distances[i] < CUTOFFDIST:
+                continue
+            geos.append(_relative_orientation(cg, stem, points_on_stems[i],
+                                              points_on_loop[i]))
+            labels.append([loop, stem])
     geos = np.array(geos)
     if len(geos) > 0:
         geos[:, 0] /= ANGLEWEIGHT
@@ -362,6 +365,14 @@ def get_relative_orientation(cg, loop, stem):
                                                               cg.coords[stem][1],
                                                               cg.coords[loop][0],
                                                               cg.coords[loop][1])
+    return _relative_orientation(cg, stem, point_on_stem, point_on_loop)
+
+
+def _relative_orientation(cg, stem, point_on_stem, point_on_loop):
+    """
+    The 3 parameters of get_relative_orientation, given the closest
+    points of the stem and the loop.
+    """
     conn_vec = point_on_loop - point_on_stem
     dist = ftuv.magnitude(conn_vec)
     angle1 = ftuv.vec_angle(cg.coords.get_direction(stem),
@@ -0,0 +1,237 @@
+"""
+A binary, memory-mappable file format for coarse grained RNA.
+
+The file consists of a fixed header, a table of sections and the data of
+all sections. Every section is a contiguous numpy array, so it can be read
+with numpy.memmap without any parsing. Only the small, variable part of the
+forgi text format (name, infos, missing residues, modifications, sampled,
+longrange, interacting and project lines) is stored as UTF-8 text.
+
+Layout (all integers little-endian)::
+
+    header:  magic (8 bytes), version (uint16), number of sections (uint16),
+             reserved (uint32)
+    table:   per section: name (16 bytes), numpy dtype string (16 bytes),
+             offset (uint64), ndim (uint8), shape (3 x uint64)
+    data:    the arrays, each aligned to 8 bytes.
+
+The format stores the same information as the text format (to_cg_string),
+including the order of the elements.
+"""
+from __future__ import absolute_import, division, print_function
+
+import io
+import logging
+import struct
+from collections import OrderedDict
+
+import numpy as np
+
+from ...graph import residue as fgr
+from ...graph.sequence import Sequence
+from ...graph._basegraph import BaseGraph
+from ...utilities.exceptions import CgConstructionError
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"FGCGBIN\x00"
+VERSION = 1
+
+_HEADER = struct.Struct("<8sHHI")
+_SECTION = struct.Struct("<16s16sQB3Q")
+_ALIGNMENT = 8
+
+
+def is_cg_binary(filename):
+    """
+    Whether or not the file starts with the magic bytes of this format.
+    """
+    with open(filename, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _meta_string(cg):
+    """
+    The lines of the forgi text format that are not stored as arrays.
+    """
+    lines = [cg._get_name_str(), cg._get_info_str()]
+    for line in cg.seq.get_bg_str().splitlines():
+        if line.startswith("missing") or line.startswith("modification"):
+            lines.append(line + "\n")
+    lines.append(cg._get_sampled_stems_str())
+    lines.append(cg._get_long_range_str())
+    lines.append(cg._get_interacting_str())
+    if cg.project_from is not None:
+        lines.append("project {} {} {}\n".format(*cg.project_from))
+    return "".join(lines)
+
+
+def _string_array(strings):
+    encoded = [s.encode("utf-8") for s in strings]
+    return np.array(encoded, dtype="S{}".format(max([len(s) for s in encoded] + [1])))
+
+
+def _to_sections(cg):
+    # Elements are stored in the order of cg.defines, because the text format
+    # depends on it (e.g. for the order of defines with the same start).
+    names = list(cg.defines)
+    index = {elem: i for i, elem in enumerate(names)}
+    stems = [elem for elem in names if elem[0] == "s"]
+    seqids = [cg.seq.to_resid(i) for i in range(1, cg.seq_length + 1)]
+    defines = np.zeros((len(names), 4), dtype="<i4")
+    define_len = np.zeros(len(names), dtype="i1")
+    edge_indptr = np.zeros(len(names) + 1, dtype="<i4")
+    edge_indices = []
+    vres_indptr = np.zeros(len(names) + 1, dtype="<i4")
+    vres = []
+    for i, elem in enumerate(names):
+        define = cg.defines[elem]
+        defines[i, :len(define)] = define
+        define_len[i] = len(define)
+        edge_indices.extend(sorted(index[other] for other in cg.edges[elem]))
+        edge_indptr[i + 1] = len(edge_indices)
+        if elem[0] != "s" and cg.vposs.get(elem):
+            vres.extend(v for _, v in sorted(cg.vposs[elem].items()))
+        vres_indptr[i + 1] = len(vres)
+
+    sections = OrderedDict()
+    sections["meta"] = np.frombuffer(_meta_string(cg).encode("utf-8"), dtype="u1")
+    sections["seq"] = np.frombuffer(str(cg.seq).encode("ascii"), dtype="S1")
+    sections["seqid_chain"] = _string_array(
+        [r.chain if r.chain is not None else "" for r in seqids])
+    sections["seqid_number"] = np.array([r.resid[1] for r in seqids], dtype="<i4")
+    sections["seqid_icode"] = _string_array([r.resid[2] for r in seqids])
+    sections["elem_names"] = _string_array(names)
+    sections["defines"] = defines
+    sections["define_len"] = define_len
+    sections["edge_indptr"] = edge_indptr
+    sections["edge_indices"] = np.array(edge_indices, dtype="<i4")
+    sections["coords"] = cg.coords[names].reshape((len(names), 2, 3)).astype("<f8")
+    sections["twists"] = cg.twists[stems].reshape((len(stems), 2, 3)).astype("<f8")
+    sections["vres_indptr"] = vres_indptr
+    sections["vres"] = np.array(vres, dtype="<f8").reshape((len(vres), 3))
+    return sections
+
+
+def write(cg, filename):
+    """
+    Store a CoarseGrainRNA in the binary format.
+
+    :param cg: A CoarseGrainRNA
+    :param filename: A filename or a file-like object opened in binary mode.
+    """
+    sections = _to_sections(cg)
+    offset = _HEADER.size + _SECTION.size * len(sections)
+    table = []
+    for name, array in sections.items():
+        offset += -offset % _ALIGNMENT
+        shape = tuple(array.shape) + (0,) * (3 - array.ndim)
+        table.append(_SECTION.pack(name.encode("ascii"), array.dtype.str.encode("ascii"),
+                                   offset, array.ndim, *shape))
+        offset += array.nbytes
+    out = io.BytesIO()
+    out.write(_HEADER.pack(MAGIC, VERSION, len(sections), 0))
+    for entry in table:
+        out.write(entry)
+    for array in sections.values():
+        out.write(b"\x00" * (-out.tell() % _ALIGNMENT))
+        out.write(np.ascontiguousarray(array).tobytes())
+    if hasattr(filename, "write"):
+        filename.write(out.getvalue())
+    else:
+        with open(filename, "wb") as f:
+            f.write(out.getvalue())
+
+
+def read_sections(filename, mmap_mode="r"):
+    """
+    Read all arrays stored in a binary cg file.
+
+    :param filename: The filename
+    :param mmap_mode: Passed to numpy.memmap. If it is None, the file is
+                      read into memory instead of memory-mapping it.
+    :returns: A dictionary {section name: numpy array}. With mmap_mode,
+              the arrays are views of the memory-mapped file.
+    """
+    if mmap_mode is None:
+        data = np.fromfile(filename, dtype="u1")
+    else:
+        data = np.memmap(filename, dtype="u1", mode=mmap_mode)
+    magic, version, num_sections, _ = _HEADER.unpack(data[:_HEADER.size].tobytes())
+    if magic != MAGIC:
+        raise CgConstructionError("File {} is not a binary cg file.".format(filename))
+    if version > VERSION:
+        raise CgConstructionError("File {} has version {} of the binary cg format. "
+                                  "Only versions up to {} are supported.".format(
+                                      filename, version, VERSION))
+    sections = {}
+    for i in range(num_sections):
+        start = _HEADER.size + i * _SECTION.size
+        name, dtype, offset, ndim, s0, s1, s2 = _SECTION.unpack(
+            data[start:start + _SECTION.size].tobytes())
+        name = name.rstrip(b"\x00").decode("ascii")
+        dtype = np.dtype(dtype.rstrip(b"\x00").decode("ascii"))
+        shape = (s0, s1, s2)[:ndim]
+        nbytes = dtype.itemsize * int(np.prod(shape, dtype=np.int64))
+        sections[name] = data[offset:offset + nbytes].view(dtype).reshape(shape)
+    return sections
+
+
+def _decode(array):
+    # Chains and insertion codes repeat, so only the unique values are decoded.
+    unique, inverse = np.unique(array, return_inverse=True)
+    decoded = [s.decode("utf-8") for s in unique.tolist()]
+    return [decoded[i] for i in inverse.tolist()]
+
+
+def read(filename, cls=None, mmap_mode="r"):
+    """
+    Load a CoarseGrainRNA from a binary cg file.
+
+    :param filename: The filename
+    :param cls: The class of the returned object. Defaults to CoarseGrainRNA
+    :param mmap_mode: See read_sections.
+    :returns: A CoarseGrainRNA. It does not reference the file,
+              all arrays are copied.
+    """
+    if cls is None:
+        from .coarse_grain import CoarseGrainRNA as cls
+    sections = read_sections(filename, mmap_mode)
+
+    # The text part is parsed like the corresponding lines of the text format.
+    loader = cls._bg_file_loader()
+    loader.consume_lines(sections["meta"].tobytes().decode("utf-8").splitlines())
+
+    seq = sections["seq"].tobytes().decode("ascii")
+    # The values are already normalized, so we bypass RESID.__new__,
+    # which is a bottleneck for large structures.
+    seqids = [fgr.Resid_base.__new__(fgr.RESID, chain or None, (" ", number, icode))
+              for chain, number, icode in zip(_decode(sections["seqid_chain"]),
+                                              sections["seqid_number"].tolist(),
+                                              _decode(sections["seqid_icode"]))]
+    seq_obj = Sequence(seq, seqids, loader.seq_loader.mr, loader.seq_loader.mod)
+
+    names = _decode(sections["elem_names"])
+    stems = [elem for elem in names if elem[0] == "s"]
+    defines = sections["defines"].tolist()
+    define_len = sections["define_len"].tolist()
+    edge_indptr = sections["edge_indptr"].tolist()
+    edge_indices = sections["edge_indices"].tolist()
+    graph_constr = BaseGraph()
+    for i, elem in enumerate(names):
+        graph_constr.defines[elem] = defines[i][:define_len[i]]
+        graph_constr.edges[elem] = set(names[j] for j in
+                                       edge_indices[edge_indptr[i]:edge_indptr[i + 1]])
+    cg = cls(graph_constr, seq_obj, loader.name, loader.infos, _dont_split=True)
+
+    cg.coords.set_array(names, sections["coords"].reshape((-1, 3)))
+    cg.twists.set_array(stems, sections["twists"].reshape((-1, 3)))
+    vres_indptr = sections["vres_indptr"].tolist()
+    vres = np.array(sections["vres"], dtype=float)
+    for i, elem in enumerate(names):
+        if vres_indptr[i] != vres_indptr[i + 1]:
+            cg.vposs[elem] = {j: v for j, v in
+                              enumerate(vres[vres_indptr[i]:vres_indptr[i + 1]])}
+
+    loader.fill_3d(cg)
+    return cg
@@ -7,6 +7,7 @@
 
 import collections as c
 import contextlib
+import copy
 import os
 import os.path as op
 import shutil
@@ -57,6 +58,7 @@
 from ..utilities import mcannotate as ftum
 from ..utilities import pdb as ftup
 from . import descriptors as ftmd
+from . import cg_binary as ftmcb
 from ..utilities import _dssr as ftud
 from ..utilities import vector as ftuv
 from ...utilities import debug as fud
@@ -276,6 +278,83 @@ class RnaMissing3dError(LookupError):
     pass
 
 
+class _CgFileLoader(fgb._BgFileLoader):
+    """
+    Parses the lines of a cg-file in a single pass.
+
+    Coordinates and twists are collected as floats and written to the
+    coordinate storages of the CoarseGrainRNA at once.
+    """
+    keywords = dict(fgb._BgFileLoader.keywords)
+    keywords.update({
+        "coord": "_coord_line",
+        "twist": "_twist_line",
+        "longrange": "_longrange_line",
+        "sampled": "_sampled_line",
+        "project": "_project_line",
+        "interacting": "_interacting_line",
+        "vres": "_vres_line",
+    })
+
+    def __init__(self):
+        super(_CgFileLoader, self).__init__()
+        self.coords = {}
+        self.twists = {}
+        self.longrange = []
+        self.sampled = {}
+        self.project_from = None
+        self.interacting_residues = []
+        self.vposs = {}
+
+    def _coord_line(self, parts):
+        self.coords[parts[1]] = parts[2:8]
+
+    def _twist_line(self, parts):
+        self.twists[parts[1]] = parts[2:8]
+
+    def _longrange_line(self, parts):
+        self.longrange.append((parts[1], parts[2]))
+
+    def _sampled_line(self, parts):
+        self.sampled[parts[1]] = [parts[2]] + list(map(int, parts[3:]))
+
+    def _project_line(self, parts):
+        self.project_from = np.array(parts[1:], dtype=float)
+
+    def _interacting_line(self, parts):
+        self.interacting_residues.append(fgr.resid_from_str(parts[1]))
+
+    def _vres_line(self, parts):
+        self.vposs[parts[1]] = ftuvres.parse_vres(parts[2:])
+
+    def fill_3d(self, cg):
+        """
+        Add the 3D information of the consumed lines to a CoarseGrainRNA
+        """
+        for storage, values in [(cg.coords, self.coords), (cg.twists, self.twists)]:
+            if values:
+                names = list(values)
+                array = np.array([values[name] for name in names], dtype=float)
+                storage.set_array(names, array.reshape((-1, 3)))
+        for elem1, elem2 in self.longrange:
+            cg.longrange[elem1].add(elem2)
+            cg.longrange[elem2].add(elem1)
+        cg.sampled.update(self.sampled)
+        if self.project_from is not None:
+            cg.project_from = self.project_from
+        cg.interacting_residues.extend(self.interacting_residues)
+        cg.vposs.update(self.vposs)
+
+    def create(self, cls):
+        cg = super(_CgFileLoader, self).create(cls)
+        if cg.coords is None:
+            cg._init_coords()
+        self.fill_3d(cg)
+        # Old versions of the file may contain bulge coordinates in the wrong order.
+        cg.add_bulge_coords_from_stems()
+        return cg
+
+
 class CoarseGrainRNA(fgb.BulgeGraph):
     '''
     A coarse grain model of RNA structure based on the
@@ -285,6 +364,7 @@ class CoarseGrainRNA(fgb.BulgeGraph):
     and two twist vetors pointing towards the centers of the base
     pairs at each end of the helix.
     '''
+    _bg_file_loader = _CgFileLoader
 
     def __init__(self, graph_construction, sequence, name=None, infos=None, _dont_split=False):
         '''
@@ -296,6 +376,7 @@ def __init__(self, graph_construction, sequence, name=None, infos=None, _dont_sp
         self.dssr = None
 
         self._virtual_atom_cache = {}
+        self._virtual_atom_arrays = {}
         #: Keys are element identifiers (e.g.: "s1" or "i3"), values are 2-tuples of vectors
         #: The first value of stem coordinates corresponds to the start of the stem
         #: (the one with the lowest nucleotide number),
@@ -348,48 +429,17 @@ def __init__(self, graph_construction, sequence, name=None, infos=None, _dont_sp
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
     @classmethod
-    def from_bg_string(cls, cg_string):
-        '''
-        Populate this structure from the string
-        representation of a graph.
-        '''
-        # pylint: disable=no-member  # See https://github.com/PyCQA/pylint/issues/981
-        # Reading the bulge_graph-part of the file
-        cg = super(CoarseGrainRNA, cls).from_bg_string(cg_string)
-        cg._init_coords()
-        log.debug("BG read. Now reading 3D information")
-        # Reading the part of the file responsible for 3D information
-        lines = cg_string.split('\n')
-        for line in lines:
-            line = line.strip()
-            parts = line.split()
-            if len(parts) == 0:
-                continue
-            if parts[0] == 'coord':
-                name = parts[1]
-                cg.coords[name] = np.array(
-                    [list(map(float, parts[2:5])), list(map(float, parts[5:8]))])
-            if parts[0] == 'twist':
-                name = parts[1]
-                cg.twists[name] = np.array(
-                    [list(map(float, parts[2:5])), list(map(float, parts[5:8]))])
-            if parts[0] == 'longrange':
-                cg.longrange[parts[1]].add(parts[2])
-                cg.longrange[parts[2]].add(parts[1])
-
-            if parts[0] == 'sampled':
-                cg.sampled[parts[1]] = [parts[2]] + list(map(int, parts[3:]))
-            if parts[0] == 'project':
-                cg.project_from = np.array(parts[1:], dtype=float)
-            if parts[0] == "interacting":
-                cg.interacting_residues.append(fgr.resid_from_str(parts[1]))
-            if parts[0] == "vres":
-                elem = parts[1]
-                cg.vposs[elem] = ftuvres.parse_vres(parts[2:])
+    def from_binary_file(cls, filename, mmap_mode="r"):
+        """
+        Load a structure stored with to_binary_file.
 
-        # Old versions of the file may contain bulge coordinates in the wrong order.
-        cg.add_bulge_coords_from_stems()
-        return cg
+        This is much faster than parsing the text format,
+        see forgi.threedee.model.cg_binary
+
+        :param mmap_mode: Passed to numpy.memmap. Use None to read
+                          the whole file instead of memory-mapping it.
+        """
+        return ftmcb.read(filename, cls, mmap_mode)
 
     @classmethod
     def from_pdb(cls, pdb_filename, load_chains=None, remove_pseudoknots=False,
@@ -654,7 +704,8 @@ def add_bulge_coords_from_stems(self):
 
     def add_all_virtual_residues(self):
         """
-        Calls ftug.add_virtual_residues() for all stems of this RNA.
+        Adds the virtual residues for all stems of this RNA
+        (see ftug.add_stems_virtual_residues).
 
         .. note::
            Don't forget to call this again if you changed the structure of the RNA,
@@ -667,7 +718,15 @@ def add_all_virtual_residues(self):
            was loaded from the PDB, residue positions from the PDB file are
            stored already.
         """
-        for stem in self.stem_iterator():
+        stems = list(self.stem_iterator())
+        try:
+            # All stems at once
+            ftug.add_stems_virtual_residues(self, stems)
+            return
+        except ValueError as e:
+            # Stem by stem, to raise the appropriate error
+            log.info("Adding virtual residues stem by stem, because %s", e)
+        for stem in stems:
             try:
                 log.debug(
                     "Adding virtual residues for stem %s with coords %s", stem, self.coords[stem])
@@ -785,12 +844,11 @@ def get_ordered_virtual_residue_poss(self, return_elements=False):
         if not self.v3dposs:
             self.add_all_virtual_residues()
         vress = []
-        elems = []
         for i in range(1, len(self.seq)+1):
             pos = self.get_virtual_residue(i, allow_single_stranded = True)
             vress.append(pos)
-            elems.append(self.get_elem(i))
         if return_elements:
+            elems = list(self.elements_of(np.arange(1, len(self.seq) + 1)))
             return np.array(vress), elems
         return np.array(vress)
 
@@ -837,14 +895,10 @@ def steric_value(self, elements, method="r**-2"):
         except:
             print(elements, repr(elements))
             raise
+        all_vas, residues, _ = self.virtual_atom_array()
         if method == "kde":
             # print(center)
-            all_vas = []
-            for pos in range(1, self.seq_length + 1):
-                for va in self.virtual_atoms(pos).values():
-                    all_vas.append(va)
-
-            all_vas = np.array(all_vas).T
+            all_vas = all_vas.T
             log.debug("Shape of all atoms {}".format(all_vas.shape))
             # randomly take 50 Angstrom bandwidth
             kde = scipy.stats.gaussian_kde(all_vas, 50)
@@ -854,21 +908,17 @@ def steric_value(self, elements, method="r**-2"):
             exclude = method[5:]
             if exclude and exclude != "e":
                 raise ValueError("Not supported method")
-            value = 0
-            for pos in range(1, self.seq_length + 1):
-                if exclude and self.get_node_from_residue_num(pos) in elements:
-                    continue
-                for va in self.virtual_atoms(pos).values():
-                    value += 1 / (1 + ftuv.vec_distance(va, center))**power
-            return value
+            if exclude:
+                excluded = set(elements)
+                pos_elems = self.elements_of(np.arange(1, self.seq_length + 1))
+                included = np.array([elem not in excluded for elem in pos_elems])
+                all_vas = all_vas[included[residues - 1]]
+            distances = np.sqrt(np.sum((all_vas - center)**2, axis=1))
+            return np.sum(1 / (1 + distances)**power)
         elif method.startswith("cutoff"):
             cutoff = float(method.split()[1])
-            value = 0
-            for pos in range(1, self.seq_length + 1):
-                for va in self.virtual_atoms(pos).values():
-                    if ftuv.vec_distance(va, center) < cutoff:
-                        value += 1
-            return value
+            distances = np.sqrt(np.sum((all_vas - center)**2, axis=1))
+            return int(np.sum(distances < cutoff))
 
     def _get_twist_str(self):
         '''
@@ -950,6 +1000,12 @@ def to_file(self, filename):
             cg_str = self.to_cg_string()
             f.write(cg_str)
 
+    def to_binary_file(self, filename):
+        """
+        Store this structure in the binary format of forgi.threedee.model.cg_binary
+        """
+        ftmcb.write(self, filename)
+
     def get_bulge_angle_stats_core(self, elem, forward=True):
         '''
         Return the angle stats for a particular bulge. These stats describe the
@@ -993,20 +1049,15 @@ def get_bulge_angle_stats_core(self, elem, forward=True):
         log.debug("u %s, v %s", u, v)
 
         if elem[0] == "m":
-            mls = self.find_mlonly_multiloops()
-            for ml in mls:
-                if elem in ml:
-                    descr = self.describe_multiloop(
-                        [x for x in ml if x[0] != "s"])
-                    if "pseudoknot" in descr:
-                        stat_type = "pseudo"
-                    elif "open" in descr:
-                        stat_type = "open"
-                    else:
-                        stat_type = "angle"  # ML
-                    break
+            ml = self.shortest_mlonly_multiloop(elem)
+            assert ml is not None
+            descr = self.describe_multiloop(ml)
+            if "pseudoknot" in descr:
+                stat_type = "pseudo"
+            elif "open" in descr:
+                stat_type = "open"
             else:
-                assert False
+                stat_type = "angle"  # ML
         else:
             stat_type = "angle"  # IL
 
@@ -1654,7 +1705,8 @@ def sorted_edges_for_mst(self):
         priority = {'s': 1, 'i': 2, 'm': 3, 'f': 4, 't': 5}
         edges = sorted(it.chain(self.mloop_iterator(),
                                 self.iloop_iterator()),
-                       key=lambda x: (priority[x[0]], min(self.get_node_dimensions(x)), not x in self.sampled, x))
+                       key=lambda x: (priority[x[0]], min(self.get_node_dimensions(x)),
+                                      not x in self.sampled, self.define_a(x)))
         return edges
 
     def coords_to_directions(self):
@@ -1682,8 +1734,6 @@ def coords_from_directions(self, directions):
         sorted_defines = sorted(self.defines.keys())
         assert len(sorted_defines) == len(directions), "{} != {}".format(
             len(sorted_defines), len(directions))
-        if self.build_order is None:
-            self.traverse_graph()
         self.coords["s0"] = np.array(
             [0, 0, 0]), directions[sorted_defines.index("s0")]
 
@@ -1754,6 +1804,30 @@ def virtual_atoms(self, key):
         else:
             raise ValueError("Expected an int, found {}".format(key))
 
+    def virtual_atom_array(self, sidechain=True):
+        """
+        Get the virtual atoms of all residues as arrays.
+
+        The result is cached until the coordinates change.
+        The returned arrays must not be modified.
+
+        :param sidechain: Whether or not to include the side chain atoms.
+        :returns: A tuple (coords, residues, atoms) of arrays.
+                  coords (N_atoms x 3) are the atom positions, residues the
+                  residue numbers (starting with 1) and atoms the indices of
+                  the atom names in ftug.virtual_atom_names.
+                  E.g. coords[residues == 3] are the same positions as
+                  self.virtual_atoms(3).values().
+        """
+        try:
+            return self._virtual_atom_arrays[sidechain]
+        except KeyError:
+            arrays = ftug.virtual_atom_array(self, sidechain)
+            for array in arrays:
+                array.flags.writeable = False
+            self._virtual_atom_arrays[sidechain] = arrays
+            return arrays
+
     def reset_vatom_cache(self, key):
         """
         Delete all cached information about virtual residues and virtual atoms.
@@ -1762,32 +1836,24 @@ def reset_vatom_cache(self, key):
         :param key: A coarse grain element name, e.g. "s1" or "m15"
         """
         try:
-            if not self._virtual_atom_cache:
-                return
+            if self._virtual_atom_arrays:
+                self._virtual_atom_arrays = {}
+            vres_caches = [self.vbases, self.vvecs, self.v3dposs, self.vinvs]
         except AttributeError:  # Happens during deepcopy
             return
 
-        define = self.defines[key]
-
         # Do not delete self.vposs, it's in the element's coordinate system
 
         # Delete virtual residues
-        try:
-            del self.vbases[key]
-        except KeyError:
-            pass
-        try:
-            del self.vvecs[key]
-        except KeyError:
-            pass
-        try:
-            del self.v3dposs[key]
-        except KeyError:
-            pass
-        try:
-            del self.vinvs[key]
-        except KeyError:
-            pass
+        for cache in vres_caches:
+            try:
+                del cache[key]
+            except KeyError:
+                pass
+
+        if not self._virtual_atom_cache:
+            return
+        define = self.defines[key]
 
         # Delete virtual atoms
         if len(define) > 1:
@@ -1800,6 +1866,122 @@ def reset_vatom_cache(self, key):
                     del self._virtual_atom_cache[i]
     # def __deepcopy__(self, memo):
 
+    def clone(self, share_topology=True):
+        """
+        A fast copy of this structure, e.g. for the moves of a sampler.
+
+        :param share_topology: If True, the clone shares the sequence and
+                    the caches derived from the defines and edges with this
+                    structure, until one of them changes its secondary
+                    structure. The defines and edges dictionaries are
+                    shallow copies, which notify only their own structure.
+                    The coordinates and twists are copied. The caches of
+                    virtual residues and virtual atoms are shared per
+                    element and replaced, not modified, when the
+                    coordinates change. PDB chains are shared until one of
+                    the structures is rotated.
+                    If False, a deep copy is returned.
+        """
+        if not share_topology:
+            return copy.deepcopy(self)
+        new = object.__new__(type(self))
+        new.__dict__.update(self.__dict__)
+        new.defines = observedDict(self.defines, on_change=new._on_defines_change)
+        new.edges = c.defaultdict(set, ((k, set(v)) for k, v in self.edges.items()))
+        if self.coords is not None:
+            new.coords = self.coords.copy(new.reset_vatom_cache)
+            new.twists = self.twists.copy(new.reset_vatom_cache)
+        # One level deeper, the caches hold per-element dicts, which are
+        # always replaced as a whole and can be shared.
+        for attr in ["vposs", "vbases", "vvecs", "v3dposs", "vinvs"]:
+            setattr(new, attr, c.defaultdict(dict, getattr(self, attr)))
+        new._virtual_atom_cache = dict(self._virtual_atom_cache)
+        new._virtual_atom_arrays = dict(self._virtual_atom_arrays)
+        new.bases = dict(self.bases)
+        new.stem_invs = dict(self.stem_invs)
+        new.sampled = dict(self.sampled)
+        new.longrange = c.defaultdict(set, ((k, set(v)) for k, v in self.longrange.items()))
+        new.infos = c.defaultdict(list, ((k, list(v)) for k, v in self.infos.items()))
+        new.interacting_residues = list(self.interacting_residues)
+        if self.chains:
+            self._shared_chains = new._shared_chains = True
+        return new
+
+    #: True, if self.chains is shared with a clone
+    _shared_chains = False
+
+    def add_basepair(self, i, j):
+        """
+        Add the base pair (i, j) to the secondary structure.
+        See BulgeGraph.add_basepair
+
+        The 3D coordinates of the changed elements and of the loops next
+        to changed stems are unknown afterwards and set to NaN
+        (see `coords.is_filled`). All other elements keep their
+        coordinates, twists and virtual residue positions.
+
+        :param i, j: The 1-based numbers of two unpaired nucleotides.
+        :returns: A set with the names of all removed, new and changed elements.
+        """
+        changed = super(CoarseGrainRNA, self).add_basepair(i, j)
+        self._forget_elements(changed)
+        return changed
+
+    def remove_basepair(self, i, j):
+        """
+        Remove the base pair (i, j) from the secondary structure.
+        See BulgeGraph.remove_basepair
+
+        Like for `add_basepair`, the coordinates of the changed elements
+        are set to NaN.
+
+        :param i, j: The 1-based numbers of two paired nucleotides.
+        :returns: A set with the names of all removed, new and changed elements.
+        """
+        changed = super(CoarseGrainRNA, self).remove_basepair(i, j)
+        self._forget_elements(changed)
+        return changed
+
+    def _forget_elements(self, changed):
+        """
+        Called after the secondary structure changed. Discard the 3D
+        information of the changed elements.
+
+        :param changed: The names of the removed, new and changed elements.
+        """
+        storages = []
+        if self.coords is not None:
+            storages = [(self.coords, changed),
+                        (self.twists, [e for e in changed if e[0] == "s"])]
+        for storage, elements in storages:
+            removed = [elem for elem in elements
+                       if elem in storage and elem not in self.defines]
+            added = [elem for elem in elements
+                     if elem in self.defines and elem not in storage]
+            if removed or added:
+                storage.replace_keys(removed, added)
+            present = [elem for elem in elements if elem in self.defines]
+            if present:
+                # Calls reset_vatom_cache for the present elements, which
+                # covers all nucleotides of the removed elements.
+                storage.set_array(present, np.full_like(storage[present], np.nan))
+        for elem in changed:
+            for cache in [self.vbases, self.vvecs, self.v3dposs, self.vinvs,
+                          self.vposs, self.sampled, self.bases, self.stem_invs]:
+                cache.pop(elem, None)
+            for other in self.longrange.pop(elem, ()):
+                self.longrange.get(other, set()).discard(elem)
+        self._incomplete_elements = None
+        self._interacting_elements = None
+
+    def _unshare_chains(self):
+        """
+        Called before the chains are modified in place.
+        """
+        if self._shared_chains:
+            self.chains = copy.deepcopy(self.chains)
+            self._shared_chains = False
+
     def rotate(self, angle, axis="x", unit="radians"):
         if unit == "degrees":
             angle = math.radians(angle)
@@ -1812,6 +1994,7 @@ def rotate(self, angle, axis="x", unit="radians"):
         self.coords.rotate(rotation_matrix)
         self.twists.rotate(rotation_matrix)
         self.after_coordinates_changed()
+        self._unshare_chains()
         for chain in self.chains.values():
             chain.transform(rotation_matrix.T, [0, 0, 0])
 
@@ -1823,6 +2006,7 @@ def rotate_translate(self, offset, rotation_matrix):
         self.coords.rotate(rotation_matrix)
         self.twists.rotate(rotation_matrix)
         self.after_coordinates_changed()
+        self._unshare_chains()
         for chain in self.chains.values():
             chain.transform([[1, 0, 0], [0, 1, 0], [0, 0, 1]], -offset)
             chain.transform(rotation_matrix.T, [0, 0, 0])
@@ -1835,3 +2019,4 @@ def after_coordinates_changed(self):
         self.vvecs = c.defaultdict(dict)
         self.v3dposs= c.defaultdict(dict)
         self.vinvs = c.defaultdict(dict)
+        self._virtual_atom_arrays = {}
@@ -0,0 +1,132 @@
+"""
+A memory-efficient representation of many 3D structures of the same RNA.
+
+A CoarseGrainRNA carries its own defines, edges, sequence and many caches
+(virtual residues, virtual atoms, ...). CompactCoarseGrainRNA only stores
+the coarse-grained coordinates and twists in two numpy arrays and references
+a shared, immutable forgi.graph.topology.GraphTopology.
+
+CoarseGrainRNA itself does not reference a GraphTopology: Its defines and
+edges are mutable dicts, which are used throughout forgi and changed by
+e.g. add_basepair, and its caches are keyed by element names.
+Full CoarseGrainRNA objects of the same RNA can instead share the caches
+derived from their topology via CoarseGrainRNA.clone(). This module is
+meant for storing many structures; to_cg creates a full CoarseGrainRNA
+when one is needed.
+
+Usage::
+
+    topology = GraphTopology.from_bg(cg)
+    compact = [CompactCoarseGrainRNA.from_cg(cg, topology) for cg in cgs]
+    cg = compact[0].to_cg()
+"""
+from __future__ import absolute_import, division, print_function
+
+import logging
+
+import numpy as np
+
+from ...graph.topology import GraphTopology, _frozen_items
+
+log = logging.getLogger(__name__)
+
+
+class CompactCoarseGrainRNA(object):
+    """
+    Coordinates and twists of a coarse grained RNA with a shared topology.
+
+    Besides the topology, coordinates and twists, only the infos and the
+    sampled fragments of a CoarseGrainRNA are kept. Virtual residue
+    positions, long-range interactions, interacting residues,
+    project_from, PDB chains and DSSR annotations are lost.
+
+    :ivar topology: A GraphTopology instance. Shared between instances.
+    :ivar coords: A float array of shape (len(topology), 2, 3) holding the
+                  start and end coordinates of all elements in the order of
+                  topology.names
+    :ivar twists: A float array of shape (number of stems, 2, 3), in the
+                  order of topology.stem_names()
+    :ivar infos: The infos of this structure as tuple of (key, values) pairs
+                 (see GraphTopology.infos) or None to use the infos of the
+                 topology.
+    :ivar sampled: The entries of CoarseGrainRNA.sampled as tuple of
+                   (element, values) pairs.
+    """
+    __slots__ = ("topology", "coords", "twists", "infos", "sampled")
+
+    def __init__(self, topology, coords=None, twists=None, infos=None, sampled=()):
+        """
+        :param topology: A GraphTopology
+        :param coords, twists: Numpy arrays or None.
+                               If None, they are initialized with NANs.
+        :param infos: A dict of lists, like CoarseGrainRNA.infos, or None.
+        :param sampled: A dict, like CoarseGrainRNA.sampled
+        """
+        self.topology = topology
+        num_stems = len(topology.stem_names())
+        if coords is None:
+            coords = np.full((len(topology), 2, 3), np.nan)
+        if twists is None:
+            twists = np.full((num_stems, 2, 3), np.nan)
+        coords = np.asarray(coords, dtype=float)
+        twists = np.asarray(twists, dtype=float)
+        if coords.shape != (len(topology), 2, 3):
+            raise ValueError("Expected coords of shape {}, found {}".format(
+                (len(topology), 2, 3), coords.shape))
+        if twists.shape != (num_stems, 2, 3):
+            raise ValueError("Expected twists of shape {}, found {}".format(
+                (num_stems, 2, 3), twists.shape))
+        self.coords = coords
+        self.twists = twists
+        self.infos = None if infos is None else _frozen_items(infos)
+        self.sampled = _frozen_items(sampled)
+
+    def __reduce__(self):
+        return (self.__class__, (self.topology, self.coords, self.twists,
+                                 self.infos, self.sampled))
+
+    @classmethod
+    def from_cg(cls, cg, topology=None):
+        """
+        Extract coordinates, twists, infos and sampled fragments
+        from a CoarseGrainRNA.
+
+        :param cg: A CoarseGrainRNA
+        :param topology: A GraphTopology to share with other instances.
+                         If None, a new topology is created from cg.
+        :raises: ValueError, if the topology does not belong to cg.
+        """
+        if topology is None:
+            topology = GraphTopology.from_bg(cg)
+        elif (set(topology.names) != set(cg.defines) or
+              any(topology.define(elem) != list(cg.defines[elem])
+                  for elem in topology.names)):
+            raise ValueError("The topology does not match the defines "
+                             "of {}".format(cg.name))
+        coords = cg.coords[list(topology.names)].reshape((len(topology), 2, 3))
+        stems = topology.stem_names()
+        twists = cg.twists[stems].reshape((len(stems), 2, 3))
+        return cls(topology, coords, twists, cg.infos, cg.sampled)
+
+    def to_cg(self):
+        """
+        Create a new, independent CoarseGrainRNA with these coordinates,
+        infos and sampled fragments.
+        """
+        from .coarse_grain import CoarseGrainRNA
+        cg = self.topology.to_bg(CoarseGrainRNA)
+        cg.coords.set_array(self.topology.names, self.coords.reshape((-1, 3)))
+        cg.twists.set_array(self.topology.stem_names(), self.twists.reshape((-1, 3)))
+        if self.infos is not None:
+            cg.infos.clear()
+            cg.infos.update((key, list(values)) for key, values in self.infos)
+        cg.sampled.update((elem, list(values)) for elem, values in self.sampled)
+        return cg
+
+    @property
+    def nbytes(self):
+        """
+        The number of bytes used by the coordinate arrays of this structure,
+        not counting the shared topology.
+        """
+        return self.coords.nbytes + self.twists.nbytes
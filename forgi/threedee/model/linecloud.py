@@ -9,8 +9,8 @@
     viewkeys = lambda dic, **kwargs: dic.keys(**kwargs)
 
 import numpy as np
+import scipy.spatial
 from collections import Mapping
-import itertools
 import logging
 import forgi.threedee.utilities.vector as ftuv
 
@@ -23,6 +23,13 @@ def profile(f):
         return f
 
 
+def _with_tolerance(distance):
+    """
+    The distance, slightly enlarged to account for rounding errors.
+    """
+    return distance * (1 + 1e-9) + 1e-9
+
+
 class CoordinateStorage(Mapping):
     """
     Provides a dictionary-like interface for the access to coordinates of elements,
@@ -134,6 +141,76 @@ def get_array(self):
         """
         return np.copy(self._coordinates)
 
+    def copy(self, on_change=None):
+        """
+        A copy with its own coordinate array.
+
+        This is much faster than copy.deepcopy.
+
+        :param on_change: The on_change function of the copy.
+                          If None, the copy uses the same function as self.
+        """
+        new = object.__new__(type(self))
+        new.__dict__.update(self.__dict__)
+        new._coordinates = self._coordinates.copy()
+        if on_change is not None:
+            new.on_change = on_change
+        return new
+
+    def set_array(self, elem_names, coordinates):
+        """
+        Set the coordinates of many elements at once.
+
+        :param elem_names: A sequence of element names
+        :param coordinates: An array with self._coords_per_key rows per element,
+                            in the order of elem_names. This is the same
+                            layout as the array returned by self[elem_names]
+        """
+        indices = []
+        for elem in elem_names:
+            indices += self._indices_for(elem)
+        coordinates = np.asarray(coordinates)
+        if coordinates.shape != (len(indices), self._dimensions):
+            raise ValueError("Expected coordinates of shape {}, found {}".format(
+                (len(indices), self._dimensions), coordinates.shape))
+        self._coordinates[indices] = coordinates
+        for elem in elem_names:
+            self.on_change(elem)
+
+    def replace_keys(self, removed, added):
+        """
+        Remove some keys and add new keys with the coordinates set to NaN.
+
+        The coordinates of all other keys are unchanged and on_change is
+        not called.
+
+        :param removed: A sequence of keys of this storage
+        :param added: A sequence of keys not in this storage
+        """
+        elem_names = dict(self._elem_names)
+        free = [elem_names.pop(key) for key in removed]
+        num_keys = len(elem_names) + len(added)
+        # The array stays contiguous: The added keys and (if fewer keys are
+        # added than removed) the keys at the end of the array are moved
+        # into the gaps.
+        gaps = sorted(position for position in free if position < num_keys)
+        gaps += range(len(self._elem_names), num_keys)
+        moved = [key for key, position in elem_names.items() if position >= num_keys]
+        coordinates = np.ones((self._coords_per_key * num_keys, self._dimensions)) * np.nan
+        kept = self._coords_per_key * min(num_keys, len(self._elem_names))
+        coordinates[:kept] = self._coordinates[:kept]
+        for key, position in zip(moved + list(added), gaps):
+            rows = slice(self._coords_per_key * position, self._coords_per_key * (position + 1))
+            if key in elem_names:
+                old = elem_names[key]
+                coordinates[rows] = self._coordinates[
+                    self._coords_per_key * old:self._coords_per_key * (old + 1)]
+            else:
+                coordinates[rows] = np.nan
+            elem_names[key] = position
+        self._coordinates = coordinates
+        self._elem_names = elem_names
+
     @property
     def is_filled(self):
         """
@@ -183,16 +260,29 @@ def __init__(self, *args, **kwargs):
         super(LineSegmentStorage, self).__init__(*args, **kwargs)
         self._i_to_elem = {i: elem for elem, i in self._elem_names.items()}
         self.is_centered = False
-        self.on_change = self._extended_on_change(self.on_change)
+        self._user_on_change = self.on_change
+        self.on_change = self._extended_on_change
 
-    def _extended_on_change(self, f):
+    def _extended_on_change(self, key):
         """
         In addition to the user-supplied function, also reset is_centered.
+
+        (A method and not a closure, so the storage can be pickled.)
         """
-        def fu(key):
-            f(key)
-            self.is_centered = False
-        return fu
+        self._user_on_change(key)
+        self.is_centered = False
+
+    def copy(self, on_change=None):
+        if on_change is None:
+            on_change = self._user_on_change
+        new = super(LineSegmentStorage, self).copy()
+        new._user_on_change = on_change
+        new.on_change = new._extended_on_change
+        return new
+
+    def replace_keys(self, removed, added):
+        super(LineSegmentStorage, self).replace_keys(removed, added)
+        self._i_to_elem = {i: elem for elem, i in self._elem_names.items()}
 
     def center(self):
         self._coordinates = ftuv.center_on_centroid(self._coordinates)
@@ -204,156 +294,69 @@ def get_direction(self, elem_name):
         indices = self._indices_for(elem_name)
         return self._coordinates[indices[1]] - self._coordinates[indices[0]]
 
+    def _candidate_pairs(self, cutoff):
+        """
+        All pairs of element indices (i<j, in the order of itertools.combinations),
+        which could be closer than cutoff.
+
+        Segments whose midpoints are further apart than cutoff plus half
+        the lengths of both segments cannot be closer than cutoff.
+        A KD-tree over the midpoints finds all remaining pairs,
+        without looking at all n*(n-1)/2 pairs.
+
+        :returns: An (N, 2) array of indices
+        """
+        starts = self._coordinates[::2]
+        ends = self._coordinates[1::2]
+        mids = (starts + ends) / 2
+        half_lengths = np.linalg.norm(ends - starts, axis=1) / 2
+        # Segments with nan never lead to a hit
+        valid = np.flatnonzero(np.isfinite(half_lengths))
+        if len(valid) < 2:
+            return np.zeros((0, 2), dtype=int)
+        # The tolerances make sure rounding errors cannot lose a pair.
+        radius = _with_tolerance(cutoff + 2 * np.max(half_lengths[valid]))
+        tree = scipy.spatial.cKDTree(mids[valid])
+        pairs = valid[tree.query_pairs(radius, output_type="ndarray")]
+        if len(pairs) == 0:
+            return np.zeros((0, 2), dtype=int)
+        pairs.sort(axis=1)
+        i, j = pairs[:, 0], pairs[:, 1]
+        mid_dist = np.linalg.norm(mids[j] - mids[i], axis=1)
+        pairs = pairs[mid_dist <= _with_tolerance(cutoff + half_lengths[i] + half_lengths[j])]
+        return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
     @profile
     def elements_closer_than(self, cutoff, ignore=[]):
         """
+        All pairs of elements with a distance smaller than cutoff.
+
+        Only pairs of segments found by a spatial index (see _candidate_pairs)
+        are passed to ftuv.segment_distances.
+
+        :param cutoff: The distance in Angstrom
         :param ignore: A set of tuples (element name-pairs) to ignore
+        :returns: A list of sorted tuples (element name-pairs)
         """
-        # See http://stackoverflow.com/a/18994296/5069869 by Fnord
-        # Modified to make use of numpy vectorization.
-        i_to_elem = self._i_to_elem
-
         assert self._coords_per_key == 2
-        directions = self._coordinates[1::2] - self._coordinates[::2]
-        magnitudes = np.linalg.norm(directions, axis=1, keepdims=True)
-        normed_directions = directions / magnitudes
-        hits = []
-        for i, j in itertools.combinations(range(len(self._elem_names)), 2):
-            potential_interaction = tuple(sorted((i_to_elem[i], i_to_elem[j])))
-            node1, node2 = potential_interaction
+        i_to_elem = self._i_to_elem
+        pairs = []
+        for i, j in self._candidate_pairs(cutoff).tolist():
+            node1, node2 = sorted((i_to_elem[i], i_to_elem[j]))
             if (node1, node2) in ignore or (node2, node1) in ignore:
-                log.debug("Ignoring nodes %s", potential_interaction)
-                continue
-            else:
-                log.debug("Testing closeness of %s", (node1, node2))
-            a0 = self._coordinates[2 * i]
-            a1 = self._coordinates[2 * i + 1]
-            b0 = self._coordinates[2 * j]
-            b1 = self._coordinates[2 * j + 1]
-            vec_a0b0 = b0 - a0
-            len_a0b0 = ftuv.magnitude(vec_a0b0)
-            if len_a0b0 < cutoff:
-                log.debug("a0b0 already confirms hit for %s",
-                          potential_interaction)
-                hits.append(potential_interaction)
-                continue
-            elif len_a0b0 > cutoff + magnitudes[i] + magnitudes[j]:
-                log.debug("a0b0 already rules out a hit for %s",
-                          potential_interaction)
-                continue  # Cannot be closer than cutoff!
-            a_normed = normed_directions[i]
-            b_normed = normed_directions[j]
-            cross = np.cross(a_normed, b_normed)
-            denom = np.sum(cross**2)  # =norm**2
-            SMALL_NUMBER = 0.000001
-            if denom < SMALL_NUMBER:  # lines are parallel
-                d0 = np.dot(a_normed, vec_a0b0)
-                vec_a0b1 = b1 - a0
-                d1 = np.dot(a_normed, vec_a0b1)
-                # Is segment B before A?
-                if d0 <= 0 >= d1:
-                    if np.absolute(d0) < np.absolute(d1):
-                        if len_a0b0 < cutoff:
-                            hits.append(potential_interaction)
-                            log.debug(
-                                "Parallel lines (B first, d0 small) are close: %s", (potential_interaction))
-                        else:
-                            log.debug(
-                                "Parallel lines (B first, d0 small) are far: %s", (potential_interaction))
-                        continue
-                    if ftuv.magnitude(b1 - a0) < cutoff:
-                        hits.append(potential_interaction)
-                        log.debug(
-                            "Parallel lines (B first, d0 big) are close: %s", (potential_interaction))
-                    else:
-                        log.debug(
-                            "Parallel lines (B first, d0 big) are far: %s", (potential_interaction))
-                    continue
-                # Is segment B after A?
-                elif d0 >= np.asscalar(magnitudes[i]) <= d1:
-                    if np.absolute(d0) < np.absolute(d1):
-                        if ftuv.magnitude(b0 - a1) < cutoff:
-                            hits.append(potential_interaction)
-                            log.debug(
-                                "Parallel lines (A first, d0 small) are close: %s", (potential_interaction))
-                        else:
-                            log.debug(
-                                "Parallel lines (A first, d0 small) are far: %s", (potential_interaction))
-                        continue
-                    if ftuv.magnitude(b1 - a1) < cutoff:
-                        hits.append(potential_interaction)
-                        log.debug(
-                            "Parallel lines (A first, d0 big) are close: %s", (potential_interaction))
-                    else:
-                        log.debug(
-                            "Parallel lines (A first, d0 big) are far: %s", (potential_interaction))
-                    continue
-                if ftuv.magnitude(((d0 * a_normed) + a0) - b0) < cutoff:
-                    hits.append(potential_interaction)
-                    log.debug("Parallel lines (ELSE) are close: %s",
-                              (potential_interaction))
-                else:
-                    log.debug("Parallel lines (ELSE) are far: %s",
-                              potential_interaction)
                 continue
-            # Lines criss-cross: Calculate the dereminent
-
-            # np.linalg.det([vec_a0b0, b_normed, cross])
-            det0 = ftuv.det3x3(np.array([vec_a0b0, b_normed, cross]))
-            # np.linalg.det([vec_a0b0, a_normed, cross])
-            det1 = ftuv.det3x3(np.array([vec_a0b0, a_normed, cross]))
-
-            t0 = det0 / denom
-            t1 = det1 / denom
-
-            pA = a0 + (a_normed * t0)
-            pB = b0 + (b_normed * t1)
-
-            # Clamp results to line segments if needed
-            pA_ = pA
-            pB_ = pB
-
-            if t0 < 0:
-                pA_ = a0
-            elif t0 > magnitudes[i]:
-                pA_ = a1
-
-            if t1 < 0:
-                pB_ = b0
-            elif t1 > magnitudes[j]:
-                pB_ = b1
-
-            dA = ftuv.magnitude(pA - pA_)
-            dB = ftuv.magnitude(pB - pB_)
-            if dB > dA:
-                dot = np.dot(pB_ - a0, a_normed)
-
-                if dot < 0:
-                    pA_ = a0
-                elif dot > magnitudes[i]:
-                    pA_ = a1
-                else:
-                    pA_ = a0 + a_normed * dot
-            elif dB < dA:
-                dot = np.dot(pA_ - b0, b_normed)
-
-                if dot < 0:
-                    pB_ = b0
-                elif dot > magnitudes[j]:
-                    pB_ = b1
-                else:
-                    pB_ = b0 + b_normed * dot
-
-            pA = pA_
-            pB = pB_
-
-            d = ftuv.magnitude(pA - pB)
-            log.debug("d {}, cutoff {} for {}".format(
-                d, cutoff, potential_interaction))
-            if d < cutoff:
-
-                hits.append(potential_interaction)
-        return hits
+            pairs.append((i, j, node1, node2))
+        if not pairs:
+            return []
+        i, j, _, _ = zip(*pairs)
+        i = 2 * np.array(i)
+        j = 2 * np.array(j)
+        _, _, distances = ftuv.segment_distances(self._coordinates[i],
+                                                 self._coordinates[i + 1],
+                                                 self._coordinates[j],
+                                                 self._coordinates[j + 1])
+        return [(node1, node2) for (_, _, node1, node2), dist in zip(pairs, distances)
+                if dist < cutoff]
 
     def rmsd_to(self, other):
         # This import is here to avoid circular imports.
@@ -1,8 +1,10 @@
 from __future__ import division
 from builtins import object
+from past.builtins import basestring
 
 import forgi.threedee.model.coarse_grain as ftmc
 import forgi.utilities.debug as fud
+import forgi.utilities.stuff as fus
 
 import forgi.threedee.utilities.vector as ftuv
 import forgi.threedee.utilities.graph_pdb as ftug
@@ -10,7 +12,9 @@
 import itertools as it
 import logging
 import math
+import multiprocessing
 import numpy as np
+import scipy.sparse
 from collections import defaultdict
 
 
@@ -107,12 +111,13 @@ def _get_interactions(self, cg):
         :return: A set of 2-tuples containing elements that pair.
         """
         ignore = set()
-        for n1, n2 in it.combinations(cg.defines.keys(), r=2):
+        elements = list(cg.defines.keys())
+        min_bp_dists, _ = cg.min_max_bp_distance_matrix(elements)
+        for (i1, n1), (i2, n2) in it.combinations(enumerate(elements), r=2):
             if cg.connected(n1, n2):
                 ignore.add((n1, n2))
                 continue
-            bp_dist = cg.min_max_bp_distance(n1, n2)[0]
-            if bp_dist < self._bp_distance:
+            if min_bp_dists[i1, i2] < self._bp_distance:
                 ignore.add((n1, n2))
 
         interactions = set(
@@ -131,13 +136,13 @@ def evaluate(self, cg):
         :return: A dictionary like this: `{"tp": tp, "tn": tn, "fp": fp, "fn": fn}`
         '''
         interactions = self._get_interactions(cg)
-        nodes = set(cg.defines.keys())
+        nodes = list(cg.defines.keys())
+        min_bp_dists, _ = cg.min_max_bp_distance_matrix(nodes)
         allIA = set()
-        for n1, n2 in it.combinations(nodes, r=2):
+        for (i1, n1), (i2, n2) in it.combinations(enumerate(nodes), r=2):
             if cg.connected(n1, n2):
                 continue
-            bp_dist = cg.min_max_bp_distance(n1, n2)[0]
-            if bp_dist < self._bp_distance:
+            if min_bp_dists[i1, i2] < self._bp_distance:
                 continue
             allIA.add(tuple(sorted((n1, n2))))
 
@@ -290,16 +295,136 @@ def rmsd_qc_wrap(coords1, coords2, is_centered=False):
 def basepair_distance(cg1, cg2):
     # QUESTION Move to forgi.graph? or forgi.utilities
     # Note: An implementation in c (with python bindings) is available in the Vienna RNA package
-    dist = 0
     if str(cg1.seq) != str(cg2.seq):  # Compare as strings, to ignore missing and mofified residues
         raise Incompareable(
             "We do not support a basepair distance between rnas with different sequences.")
-    for stem in cg1.stem_iterator():
-        for bp in cg1.stem_bp_iterator(stem):
-            if cg2.pairing_partner(bp[0]) != bp[1]:
-                dist += 1
-    for stem in cg2.stem_iterator():
-        for bp in cg2.stem_bp_iterator(stem):
-            if cg1.pairing_partner(bp[0]) != bp[1]:
-                dist += 1
-    return dist
+    pt1 = np.array(cg1.to_pair_table())
+    pt2 = np.array(cg2.to_pair_table())
+    positions = np.arange(len(pt1))
+    differ = pt1 != pt2
+    # Every base pair is counted once, at its 5' nucleotide
+    return int(np.sum(differ & (pt1 > positions)) + np.sum(differ & (pt2 > positions)))
+
+
+def pair_table_array(structures):
+    """
+    The pair tables of many secondary structures of the same RNA as a 2D array.
+
+    :param structures: A list of BulgeGraphs (or CoarseGrainRNAs) with the
+                       same sequence or a list of dotbracket strings of the
+                       same length.
+    :returns: An integer array of shape (len(structures), seq_length+1).
+              Row k is the pair table of structures[k],
+              with the sequence length at index 0.
+    """
+    if all(isinstance(structure, basestring) for structure in structures):
+        lengths = set(len(structure.replace("&", "")) for structure in structures)
+        if len(lengths) > 1:
+            raise Incompareable("All structures need to have the same length. "
+                                "Found {}".format(sorted(lengths)))
+        return fus.dotbrackets_to_pairtable_array(structures)
+    pts = []
+    seq = None
+    for structure in structures:
+        if hasattr(structure, "to_pair_table"):
+            if seq is None:
+                seq = str(structure.seq)
+            elif str(structure.seq) != seq:
+                raise Incompareable("We do not support a basepair distance between "
+                                    "rnas with different sequences.")
+            pt = structure.to_pair_table()
+        else:
+            pt = fus.dotbracket_to_pairtable(structure)
+        if pts and len(pt) != len(pts[0]):
+            raise Incompareable("All structures need to have the same length. "
+                                "Found {} and {}".format(pts[0][0], pt[0]))
+        pts.append(pt)
+    return np.array(pts, dtype=int).reshape((len(pts), -1))
+
+
+def basepair_distance_matrix(structures, chunk_size=None, jobs=1):
+    """
+    The basepair distances between all pairs of structures, e.g. of an
+    ensemble of suboptimal structures.
+
+    The structures are converted to a sparse matrix holding one column per distinct
+    base pair, so the number of shared base pairs of all structures is a
+    matrix product. It is computed in chunks of rows, to bound the memory.
+
+    :param structures: A list of BulgeGraphs, dotbracket strings or an
+                       array returned by pair_table_array.
+    :param chunk_size: The number of rows computed at once. By default,
+                       chunks hold roughly 2**22 entries (of the result and
+                       of the dense rows of the base pair matrix).
+    :param jobs: The number of processes used for the chunks. Only worth it
+                 for thousands of structures. If None, use all cpus.
+    :returns: A symmetric integer array of shape
+              (len(structures), len(structures))
+    """
+    if isinstance(structures, np.ndarray):
+        pts = structures
+    else:
+        pts = pair_table_array(structures)
+    num_structures = len(pts)
+    indicators, num_pairs = _basepair_indicators(pts)
+    if chunk_size is None:
+        chunk_size = max(1, 2**22 // max(num_structures, indicators.shape[1], 1))
+    chunks = [(start, min(start + chunk_size, num_structures))
+              for start in range(0, num_structures, chunk_size)]
+    distances = np.empty((num_structures, num_structures), dtype=int)
+    if jobs == 1 or len(chunks) < 2:
+        for start, end in chunks:
+            distances[start:end] = _distance_rows(indicators, num_pairs, start, end)
+        return distances
+    pool = multiprocessing.Pool(jobs, initializer=_init_distance_worker,
+                                initargs=(indicators, num_pairs))
+    try:
+        for (start, end), rows in zip(chunks, pool.imap(_distance_rows_in_pool, chunks)):
+            distances[start:end] = rows
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    return distances
+
+
+def _basepair_indicators(pts):
+    """
+    :returns: A tuple (indicators, num_pairs). indicators is a sparse matrix
+              with one row per structure and one column per distinct base pair,
+              num_pairs the number of base pairs per structure.
+    """
+    length = pts.shape[1]
+    # Column 0 of the pair tables holds the sequence length, not a partner.
+    structure, nucleotide = np.nonzero(pts[:, 1:] > np.arange(1, length))
+    nucleotide += 1
+    pair_ids = nucleotide * length + pts[structure, nucleotide]
+    unique_pairs, columns = np.unique(pair_ids, return_inverse=True)
+    # float32 is exact for counts below 2**24.
+    indicators = scipy.sparse.csr_matrix(
+        (np.ones(len(structure), dtype=np.float32), (structure, columns)),
+        shape=(len(pts), len(unique_pairs)))
+    num_pairs = np.bincount(structure, minlength=len(pts))
+    return indicators, num_pairs
+
+
+def _distance_rows(indicators, num_pairs, start, end):
+    # A sparse times a dense matrix is much faster than the product
+    # of two sparse matrices.
+    shared = indicators.dot(indicators[start:end].toarray().T).T
+    return num_pairs[start:end, np.newaxis] + num_pairs - 2 * np.rint(shared).astype(int)
+
+
+_worker_indicators = None
+
+
+def _init_distance_worker(indicators, num_pairs):
+    """
+    Used by basepair_distance_matrix. Sends the matrix to every worker once.
+    """
+    global _worker_indicators
+    _worker_indicators = (indicators, num_pairs)
+
+
+def _distance_rows_in_pool(chunk):
+    return _distance_rows(_worker_indicators[0], _worker_indicators[1], *chunk)
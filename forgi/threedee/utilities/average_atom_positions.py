@@ -0,0 +1,240 @@
+"""
+Numeric tables of the average atom positions in the coordinate systems
+of coarse grained elements, used for the virtual atoms.
+
+The average positions for loops are stored in
+threedee/data/average_atom_positions.npz (see save_table), with one row
+per atom and the rows of an element type, its dimensions and connection
+type next to each other. The file is memory-mapped on first use.
+If it is not installed, the table is created from
+threedee/data/average_atom_positions.json instead.
+"""
+from __future__ import print_function
+from __future__ import division
+from builtins import object
+
+import json
+import logging
+import os.path as op
+import pkgutil
+import struct
+import zipfile
+
+import numpy as np
+
+import forgi.threedee
+import forgi.threedee.utilities.average_stem_vres_atom_positions as ftus
+
+log = logging.getLogger(__name__)
+
+#: The order of the columns of AverageAtomTable.elements
+ELEMENT_COLUMNS = ("element_type", "dimension0", "dimension1", "connection_type")
+
+
+class AverageAtomTable(object):
+    """
+    The average atom positions of loops as arrays.
+
+    An element is described by the integer key (ord(element_type),
+    dimension0, dimension1, connection_type), e.g. (ord("h"), 9, -1, 0)
+    for a hairpin of length 9.
+    """
+
+    def __init__(self, elements, offsets, positions, atoms, atom_names, coords):
+        """
+        :param elements: An Ex4 array of element keys (see ELEMENT_COLUMNS)
+        :param offsets: An array of length E+1. The rows of element k are
+                        offsets[k]:offsets[k+1]
+        :param positions: For every row, the position of the nucleotide
+                          in the element (starting with 0).
+        :param atoms: For every row, the index of the atom in atom_names
+        :param atom_names: The atom identifiers, e.g. "C1'" or "A.N1"
+        :param coords: An Nx3 array of positions
+        """
+        self.elements = elements
+        self.offsets = offsets
+        self.positions = positions
+        self.atoms = atoms
+        self.atom_names = [str(name) for name in atom_names]
+        self.coords = coords
+        self._index = {tuple(key): k for k, key in enumerate(elements.tolist())}
+
+    @classmethod
+    def from_dict(cls, avg_atom_poss):
+        """
+        Create the table from the dictionary stored in
+        average_atom_positions.json.
+
+        :param avg_atom_poss: A dictionary with keys like "h 9 -1 0 7 C4'"
+                              (element type, dimensions, connection type,
+                              position in the element and atom identifier)
+                              and positions as values.
+        """
+        atom_names = sorted(set(key.split(" ")[-1] for key in avg_atom_poss))
+        atom_index = {name: k for k, name in enumerate(atom_names)}
+        rows = []
+        for key, coords in avg_atom_poss.items():
+            elem_type, dim0, dim1, conn_type, pos, atom = key.split(" ")
+            rows.append((ord(elem_type), int(dim0), int(dim1), int(conn_type),
+                         int(pos), atom_index[atom]) + tuple(coords))
+        rows = np.array(sorted(rows), dtype=float).reshape(-1, 9)
+        keys = rows[:, :4].astype(int)
+        is_new = np.ones(len(keys), dtype=bool)
+        is_new[1:] = np.any(keys[1:] != keys[:-1], axis=1)
+        starts = np.flatnonzero(is_new)
+        return cls(keys[starts], np.append(starts, len(keys)),
+                   rows[:, 4].astype(int), rows[:, 5].astype(int),
+                   atom_names, rows[:, 6:])
+
+    @classmethod
+    def from_npz(cls, filename):
+        """
+        Load a table written by save_table. The arrays are memory-mapped.
+        """
+        arrays = _mmap_npz(filename)
+        return cls(arrays["elements"], arrays["offsets"], arrays["positions"],
+                   arrays["atoms"], arrays["atom_names"], arrays["coords"])
+
+    def save(self, filename):
+        """
+        Store the table as uncompressed npz file (so it can be memory-mapped).
+        """
+        np.savez(filename, elements=self.elements, offsets=self.offsets,
+                 positions=self.positions, atoms=self.atoms,
+                 atom_names=np.array(self.atom_names), coords=self.coords)
+
+    def element_atoms(self, elem_type, dimensions, connection_type):
+        """
+        The average atom positions of all nucleotides of an element.
+
+        :param elem_type: The element type, e.g. "h"
+        :param dimensions: The result of cg.get_node_dimensions(elem)
+        :param connection_type: The connection type (0 for hairpins,
+                                5' and 3' unpaired regions)
+        :returns: A tuple of arrays (positions, atoms, coords).
+                  positions are the positions of the nucleotides in the
+                  element, atoms the indices into self.atom_names and
+                  coords (Kx3) the average positions in the coordinate
+                  system of the element.
+        """
+        key = (ord(elem_type), dimensions[0], dimensions[1], connection_type)
+        try:
+            k = self._index[key]
+        except KeyError:
+            return (np.zeros(0, dtype=int), np.zeros(0, dtype=int),
+                    np.zeros((0, 3)))
+        rows = slice(self.offsets[k], self.offsets[k + 1])
+        return self.positions[rows], self.atoms[rows], self.coords[rows]
+
+    def __getitem__(self, identifier):
+        """
+        The average position for an identifier of average_atom_positions.json,
+        e.g. "h 9 -1 0 7 C4'"
+        """
+        elem_type, dim0, dim1, conn_type, pos, atom = identifier.split(" ")
+        positions, atoms, coords = self.element_atoms(
+            elem_type, (int(dim0), int(dim1)), int(conn_type))
+        try:
+            atom = self.atom_names.index(atom)
+        except ValueError:
+            raise KeyError(identifier)
+        match = np.flatnonzero((positions == int(pos)) & (atoms == atom))
+        if not len(match):
+            raise KeyError(identifier)
+        return coords[match[0]]
+
+
+def _mmap_npz(filename):
+    """
+    Memory-map the arrays of an uncompressed npz file.
+
+    np.load ignores mmap_mode for npz files, so the offsets of the arrays
+    in the zip archive are read here. Compressed archives are loaded into
+    memory instead.
+    """
+    arrays = {}
+    with zipfile.ZipFile(filename) as archive:
+        infos = archive.infolist()
+    with open(filename, "rb") as f:
+        for info in infos:
+            name = op.splitext(info.filename)[0]
+            if info.compress_type != zipfile.ZIP_STORED:
+                log.info("%s is compressed. Not memory-mapping it", filename)
+                with np.load(filename) as npz:
+                    return dict(npz)
+            # The local file header has its own lengths of name and extra field
+            f.seek(info.header_offset)
+            header = f.read(30)
+            name_length, extra_length = struct.unpack("<HH", header[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if not np.prod(shape):
+                arrays[name] = np.zeros(shape, dtype=dtype)
+                continue
+            arrays[name] = np.memmap(filename, dtype=dtype, mode="r",
+                                     offset=f.tell(), shape=shape,
+                                     order="F" if fortran_order else "C")
+    return arrays
+
+
+# Module-level var used for caching.
+_loop_table = None
+
+
+def loop_table():
+    """
+    The table of average atom positions of loops, loaded on first use.
+    """
+    global _loop_table
+    if _loop_table is None:
+        filename = forgi.threedee.data_file(
+            op.join("data", "average_atom_positions.npz"))
+        if op.exists(filename):
+            log.info("Memory-mapping average atom positions from %s", filename)
+            _loop_table = AverageAtomTable.from_npz(filename)
+        else:
+            log.info("%s not found. Loading average atom positions from json",
+                     filename)
+            data = pkgutil.get_data(
+                'forgi', 'threedee/data/average_atom_positions.json')
+            _loop_table = AverageAtomTable.from_dict(
+                json.loads(data.decode("ascii")))
+    return _loop_table
+
+
+def save_table(avg_atom_poss, filename):
+    """
+    Store the average atom positions of loops (a dictionary as stored
+    in average_atom_positions.json) as table for loop_table().
+    """
+    AverageAtomTable.from_dict(avg_atom_poss).save(filename)
+
+
+_stem_atom_coords = {}
+
+
+def stem_atom_positions(side, residue, atom_names):
+    """
+    The average atom positions of a stem nucleotide, in the coordinate
+    system of its virtual residue.
+
+    :param side: 0 or 1, the strand of the stem
+    :param residue: One of "A", "C", "G", "U"
+    :param atom_names: A sequence of atom names
+    :returns: A Kx3 array, with one row per atom name.
+              This array must not be modified.
+    """
+    key = (side, residue, tuple(atom_names))
+    try:
+        return _stem_atom_coords[key]
+    except KeyError:
+        pass
+    coords = np.array([ftus.avg_stem_vres_atom_coords[side][residue][aname.replace("*", "'")]
+                       for aname in atom_names], dtype=float).reshape(-1, 3)
+    coords.flags.writeable = False
+    _stem_atom_coords[key] = coords
+    return coords
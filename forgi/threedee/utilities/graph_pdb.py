@@ -13,7 +13,6 @@
 import random
 import sys
 import math
-import json
 import operator
 from pprint import pprint
 import logging
@@ -30,7 +29,7 @@
 
 from logging_exceptions import log_to_exception
 
-import forgi.threedee.utilities.average_stem_vres_atom_positions as ftus
+import forgi.threedee.utilities.average_atom_positions as ftua
 import forgi.utilities.debug as fud
 import forgi.threedee.utilities.my_math as ftum
 import forgi.threedee.utilities.pdb as ftup
@@ -1140,6 +1139,9 @@ def _add_loop_virtual_residues(cg, element):
         log.info(
             "No virtual residues added for %s, because no pdb chain present", element)
         return
+    # Build a new dict instead of modifying cg.vposs[element] in place,
+    # because clones of a CoarseGrainRNA share it (See CoarseGrainRNA.clone)
+    vposs = {}
     for i, resid in enumerate(cg.define_residue_num_iterator(element, seq_ids=True)):
         try:
             global_coords = cg.chains[resid.chain][resid.resid]["C1'"].coord
@@ -1157,7 +1159,8 @@ def _add_loop_virtual_residues(cg, element):
         origin, basis = element_coord_system(cg, element)
         element_coords = ftuv.change_basis(
             global_coords - origin, basis, ftuv.standard_basis)
-        cg.vposs[element][i] = element_coords
+        vposs[i] = element_coords
+    cg.vposs[element] = vposs
 
 
 def _add_stem_virtual_residues(bg, stem):
@@ -1171,16 +1174,195 @@ def _add_stem_virtual_residues(bg, stem):
         bg.bases[stem] = stem_basis
         bg.stem_invs[stem] = stem_inv
 
+    # New dicts instead of in-place modifications, because clones of
+    # a CoarseGrainRNA share them (See CoarseGrainRNA.clone)
+    vposs, vvecs, v3dposs, vbases, vinvs = {}, {}, {}, {}, {}
     for i in range(bg.stem_length(stem)):
         vpos = virtual_res_3d_pos(bg, stem, i, stem_inv=stem_inv)
         vbasis = virtual_res_basis(bg, stem, i, vec=vpos[1])
         vinv = nl.inv(vbasis.transpose())
 
-        bg.vposs[stem][i] = vpos[0]
-        bg.vvecs[stem][i] = vpos[1]
-        bg.v3dposs[stem][i] = vpos
-        bg.vbases[stem][i] = vbasis
-        bg.vinvs[stem][i] = vinv
+        vposs[i] = vpos[0]
+        vvecs[i] = vpos[1]
+        v3dposs[i] = vpos
+        vbases[i] = vbasis
+        vinvs[i] = vinv
+    bg.vposs[stem] = vposs
+    bg.vvecs[stem] = vvecs
+    bg.v3dposs[stem] = v3dposs
+    bg.vbases[stem] = vbases
+    bg.vinvs[stem] = vinvs
+
+
+def _orthonormal_bases(vecs1, vecs2):
+    """
+    The vectorized version of ftuv.create_orthonormal_basis(vec1, vec2)
+    for Nx3 arrays of (orthogonal) vectors.
+
+    :returns: An Nx3x3 array
+    """
+    vecs1 = vecs1 / np.sqrt(np.einsum("ij,ij->i", vecs1, vecs1))[:, np.newaxis]
+    vecs2 = vecs2 / np.sqrt(np.einsum("ij,ij->i", vecs2, vecs2))[:, np.newaxis]
+    vecs3 = np.cross(vecs1, vecs2)
+    vecs3 /= np.sqrt(np.einsum("ij,ij->i", vecs3, vecs3))[:, np.newaxis]
+    return np.stack([vecs1, vecs2, vecs3], axis=1)
+
+
+def _check_orthogonal(vecs1, vecs2):
+    """
+    The assertion of ftuv.create_orthonormal_basis for Nx3 arrays of vectors.
+
+    :raises: ValueError, if ftuv.create_orthonormal_basis would fail
+             with an AssertionError for any pair of vectors.
+    """
+    if not ftuv.USE_ASSERTS:
+        return
+    dots = np.einsum("ij,ij->i", vecs1, vecs2)
+    dots /= np.sqrt(np.einsum("ij,ij->i", vecs1, vecs1) *
+                    np.einsum("ij,ij->i", vecs2, vecs2))
+    angles = np.arccos(np.clip(dots, -1., 1.))
+    # Only angles close to the rounding border need the exact test.
+    for i in np.flatnonzero(~(np.abs(angles - math.pi / 2) < 2.5e-10)):
+        if round(ftuv.vec_angle(vecs2[i], vecs1[i]), 9) != round(math.pi / 2, 9):
+            raise ValueError("Vectors {} and {} are not orthogonal".format(
+                vecs1[i], vecs2[i]))
+
+
+def stem_virtual_residue_arrays(coords, twists, stem_lengths, stem_invs=None):
+    '''
+    The virtual residues of all base pairs of several stems at once.
+
+    This is the vectorized version of virtual_res_3d_pos_core and
+    virtual_res_basis_core, with the same results (up to rounding errors).
+
+    :param coords: An Sx2x3 array with the start and end of S stems
+    :param twists: An Sx2x3 array with the twists of the S stems
+    :param stem_lengths: An array with the S stem lengths
+    :param stem_invs: The inverses of the transposed stem bases (Sx3x3).
+                      If None, they are calculated from coords and twists.
+    :raises: ValueError, if the coordinates or twists of a stem
+             are not set or invalid.
+    :return: A tuple of arrays (pos, vec, vec_l, vec_r, basis, inv), with one
+             row per base pair, sorted by stem and position in the stem.
+             pos, vec, vec_l and vec_r (Nx3) are the results of
+             virtual_res_3d_pos_core. basis (Nx3x3) is the result of
+             virtual_res_basis_core and inv the inverse of its transpose.
+    '''
+    coords = np.asarray(coords, dtype=float)
+    twists = np.asarray(twists, dtype=float)
+    stem_lengths = np.asarray(stem_lengths, dtype=int)
+    if not (np.all(np.isfinite(coords)) and np.all(np.isfinite(twists))):
+        raise ValueError("Coordinates or twists are not set")
+    stem_vecs = coords[:, 1] - coords[:, 0]
+    if (np.any(np.all(stem_vecs == 0, axis=1)) or
+            np.any(np.all(twists[:, 0] == 0, axis=1))):
+        raise ValueError("Stems and twists must not have length 0")
+    if stem_invs is None:
+        _check_orthogonal(stem_vecs, twists[:, 0])
+        stem_invs = nl.inv(np.transpose(_orthonormal_bases(stem_vecs, twists[:, 0]),
+                                        (0, 2, 1)))
+
+    # The total rotation of each helix
+    t2 = np.einsum("sij,sj->si", stem_invs, twists[:, 1])
+    angs = np.arctan2(t2[:, 2], t2[:, 1])
+    angs = np.where(angs < 0, 2 * math.pi + angs, angs)  # ftum.atan3
+    # calculated from an ideal length 30 helix
+    average_ang_per_nt = 0.636738030735
+    expected_angs = (stem_lengths - 1) * average_ang_per_nt
+    # expected_devs between 0 and 360 degrees
+    num_turns = np.maximum(0, np.ceil((expected_angs - 2 * math.pi) / (2 * math.pi)))
+    expected_devs = expected_angs - num_turns * 2 * math.pi
+    lower = angs < expected_devs
+    forward = np.where(lower, 2 * math.pi + angs - expected_devs, angs - expected_devs)
+    backward = np.where(lower, expected_devs - angs, 2 * math.pi + expected_devs - angs)
+    angs = np.where(forward < backward, expected_angs + forward, expected_angs - backward)
+    single = stem_lengths == 1
+    divisor = np.where(single, 1, stem_lengths - 1).astype(float)
+    ang_per_nt = np.where(single, 0., angs / divisor)
+
+    # One row per base pair
+    stem_index = np.repeat(np.arange(len(stem_lengths)), stem_lengths)
+    starts = np.cumsum(stem_lengths) - stem_lengths
+    i = (np.arange(len(stem_index)) - starts[stem_index]).astype(float)
+    fraction = np.where(single[stem_index], 0., i / divisor[stem_index])
+    pos = coords[stem_index, 0] + fraction[:, np.newaxis] * stem_vecs[stem_index]
+    ang = (ang_per_nt[stem_index] * i)[:, np.newaxis]
+
+    # the basis vectors for the helix along which the
+    # virtual residues will residue
+    u = twists[:, 0]
+    v = np.cross(stem_vecs, u)
+    v /= np.sqrt(np.einsum("ij,ij->i", v, v))[:, np.newaxis]
+    u = u[stem_index]
+    v = v[stem_index]
+    ang_offset = 0.9
+    # equation for a circle in 3-space
+    vec = u * np.cos(ang) + v * np.sin(ang)
+    vec_l = u * np.cos(ang + ang_offset) + v * np.sin(ang + ang_offset)
+    vec_r = u * np.cos(ang - ang_offset) + v * np.sin(ang - ang_offset)
+
+    _check_orthogonal(stem_vecs[stem_index], vec)
+    basis = _orthonormal_bases(stem_vecs[stem_index], vec)
+    inv = nl.inv(np.transpose(basis, (0, 2, 1)))
+    return pos, vec, vec_l, vec_r, basis, inv
+
+
+def add_stems_virtual_residues(bg, stems):
+    '''
+    Create all of the virtual residues and the associated
+    bases and inverses for the given stems at once.
+
+    The results are the same as calling add_virtual_residues for every
+    stem, but all base pairs are calculated with array operations
+    (see stem_virtual_residue_arrays).
+
+    :param bg: The CoarseGrainRNA bulge graph containing the stems
+    :param stems: A list of stem names
+    :raises: ValueError, if the coordinates or twists of a stem
+             are not set or invalid. In this case, bg is not modified.
+    '''
+    if not stems:
+        return
+    coords = bg.coords[stems].reshape(-1, 2, 3)
+    twists = bg.twists[stems].reshape(-1, 2, 3)
+    stem_lengths = [bg.stem_length(stem) for stem in stems]
+    stem_vecs = coords[:, 1] - coords[:, 0]
+
+    # Reuse the inverses of stem bases, if the stem did not change.
+    stem_invs = np.empty((len(stems), 3, 3))
+    new_stems = []
+    for k, stem in enumerate(stems):
+        if (stem in bg.bases and np.allclose(stem_vecs[k], bg.bases[stem][0])
+                and np.allclose(twists[k, 0], bg.bases[stem][1])):
+            stem_invs[k] = bg.stem_invs[stem]
+        else:
+            new_stems.append(k)
+    if new_stems:
+        if not (np.all(np.isfinite(stem_vecs[new_stems])) and
+                np.all(np.isfinite(twists[new_stems, 0]))):
+            raise ValueError("Coordinates or twists are not set")
+        _check_orthogonal(stem_vecs[new_stems], twists[new_stems, 0])
+        new_bases = _orthonormal_bases(stem_vecs[new_stems], twists[new_stems, 0])
+        stem_invs[new_stems] = nl.inv(np.transpose(new_bases, (0, 2, 1)))
+
+    pos, vec, vec_l, vec_r, basis, inv = stem_virtual_residue_arrays(
+        coords, twists, stem_lengths, stem_invs)
+
+    for k, stem_basis in zip(new_stems, new_bases if new_stems else []):
+        bg.bases[stems[k]] = stem_basis
+        bg.stem_invs[stems[k]] = stem_invs[k]
+    # New dicts instead of in-place modifications, because clones of
+    # a CoarseGrainRNA share them (See CoarseGrainRNA.clone)
+    start = 0
+    for stem, stem_len in zip(stems, stem_lengths):
+        rows = range(start, start + stem_len)
+        bg.vposs[stem] = {i: pos[row] for i, row in enumerate(rows)}
+        bg.vvecs[stem] = {i: vec[row] for i, row in enumerate(rows)}
+        bg.v3dposs[stem] = {i: (pos[row], vec[row], vec_l[row], vec_r[row])
+                            for i, row in enumerate(rows)}
+        bg.vbases[stem] = {i: basis[row] for i, row in enumerate(rows)}
+        bg.vinvs[stem] = {i: inv[row] for i, row in enumerate(rows)}
+        start += stem_len
 
 
 def stem_vres_reference_atoms(bg, s, i):
@@ -1653,10 +1835,6 @@ def virtual_atoms(cg, given_atom_names=None, sidechain=True):
     return VirtualAtomsLookup(cg, given_atom_names, sidechain)
 
 
-# Module-level var used for caching.
-_average_atom_positions = None
-
-
 class VirtualAtomsLookup(object):
     """
     An object with a dict-like interface that calculates the virtual atom positions on demand.
@@ -1681,14 +1859,7 @@ def __getitem__(self, position):
         :param position: The position of the residue in the RNA (starting with 1)
         """
         # Find out the stem for which we have to calculate virtual atom positions
-        for key, value in self.cg.defines.items():
-            if len(value) < 2:
-                continue  # For multiloops of length 0, value is []
-            elif position >= value[0] and position <= value[1]:
-                return self._getitem_for_element(key, position)
-            elif len(value) == 4 and position >= value[2] and position <= value[3]:
-                return self._getitem_for_element(key, position)
-        assert False, "No return for pos {}".format(position)
+        return self._getitem_for_element(self.cg.get_elem(position), position)
     #@profile
 
     def keys(self):
@@ -1709,17 +1880,10 @@ def _getitem_for_element(self, d, pos):
         :param d:   The coarse grained element (e.g. "s1")
         :param pos: The position of the residue. It has to be in the element d!
         """
-        global _average_atom_positions
         if d[0] == "s":
             # Use virtual residues for stems.
             return self._getitem_for_stem(d, pos)
-        if _average_atom_positions is None:
-            log.info("LOADING AV_ATOM_POS")
-            import pkgutil
-            data = pkgutil.get_data(
-                'forgi', 'threedee/data/average_atom_positions.json')
-            _average_atom_positions = json.loads(data.decode("ascii"))
-        log.debug("Using loaded av_atom_pos")
+        table = ftua.loop_table()
 
         e_coords = dict()
         try:
@@ -1753,20 +1917,24 @@ def _getitem_for_element(self, d, pos):
                     atom_names = ftup.nonsidechain_atoms
             else:
                 atom_names = self.given_atom_names
+            positions, atoms, coords = table.element_atoms(
+                d[0], self.cg.get_node_dimensions(d), conn_type)
+            average_coords = {table.atom_names[atom]: coords[k]
+                              for k, atom in enumerate(atoms) if positions[k] == i}
+            atom_keys = []
+            atom_coords = []
             for aname in atom_names:
-                identifier = "%s %s %d %d %s" % (d[0],
-                                                 " ".join(
-                                                     map(str, self.cg.get_node_dimensions(d))),
-                                                 conn_type, i, aname)
-
+                try:
+                    atom_coords.append(average_coords[aname])
+                except KeyError:
+                    continue
                 if "." in aname:
                     _, _, aname = aname.partition(".")
-                try:
-                    e_coords[aname] = origin + ftuv.change_basis(
-                        np.array(_average_atom_positions[identifier]), ftuv.standard_basis, basis)
-                except KeyError as ke:
-                    #warnings.warn("KeyError in virtual_atoms. No coordinates found for: {}".format(ke))
-                    pass
+                atom_keys.append(aname)
+            if atom_coords:
+                atom_coords = origin + ftuv.change_basis_vectorized(
+                    np.array(atom_coords), ftuv.standard_basis, basis)
+            e_coords.update(zip(atom_keys, atom_coords))
             return e_coords
 
     def _getitem_for_stem(self, d, pos):
@@ -1788,17 +1956,7 @@ def _getitem_for_stem(self, d, pos):
                 atom_names = ftup.nonsidechain_atoms
         else:
             atom_names = self.given_atom_names
-        atom_keys = []
-        atom_coords = []
-        for aname in atom_names:
-            if aname[-1] == "*":
-                aname_dash = aname[:-1] + "'"
-            else:
-                aname_dash = aname
-            spos = ftus.avg_stem_vres_atom_coords[side][residue][aname_dash]
-            # TODO: Maybe we can vectorize this and calculate pos from spos for all atoms of the residue at once.
-            atom_keys.append(aname)
-            atom_coords.append(spos)
+        atom_coords = ftua.stem_atom_positions(side, residue, atom_names)
         try:
             # virtual_res_basis(self.cg, d, pos_in_stem)
             vres_basis = self.cg.vbases[d][pos_in_stem]
@@ -1812,9 +1970,146 @@ def _getitem_for_stem(self, d, pos):
             vres_pos = self.cg.vposs[d][pos_in_stem]
 
         atom_coords = ftuv.change_basis_vectorized(
-            np.array(atom_coords), ftuv.standard_basis, vres_basis) + vres_pos
+            atom_coords, ftuv.standard_basis, vres_basis) + vres_pos
+
+        return {aname: coord for aname, coord in zip(atom_names, atom_coords)}
+
+
+#: The names of all virtual atoms. The atom indices returned by
+#: virtual_atom_array are indices into this list.
+virtual_atom_names = list(col.OrderedDict.fromkeys(
+    ftup.nonsidechain_atoms + [aname for residue in "ACGU"
+                               for aname in ftup.side_chain_atoms[residue]]))
+
+
+def _residue_atom_names(residue, sidechain):
+    """
+    The names of the virtual atoms of a residue, without duplicates,
+    in the same order as the keys of VirtualAtomsLookup[pos].
+
+    :param residue: One of "A", "C", "G", "U"
+    :returns: A list of tuples (name, identifier). The identifier is used
+              for the average atom positions of loops.
+    """
+    atom_names = [(aname, aname) for aname in ftup.nonsidechain_atoms]
+    if sidechain:
+        atom_names += [(aname, residue + "." + aname)
+                       for aname in ftup.side_chain_atoms[residue]]
+    return list(col.OrderedDict(atom_names).items())
+
+
+def _virtual_atom_template(cg, sidechain):
+    """
+    The part of the virtual atom calculation that only depends on the
+    sequence and the secondary structure: The positions of all virtual atoms
+    in the coordinate systems of the stem virtual residues or loop elements.
+
+    :returns: A tuple (residues, atoms, local_coords, frame_index, frames).
+              The first four are arrays with one entry per atom. frames
+              is a list of tuples (element, position in stem or None).
+              The coordinate system of atom n is frames[frame_index[n]].
+    """
+    name_index = {aname: k for k, aname in enumerate(virtual_atom_names)}
+    residues = []
+    atoms = []
+    local_coords = []
+    frame_index = []
+    frames = []
+    frame_lookup = {}
+    for d in cg.defines:
+        if d[0] == "s":
+            for pos in cg.define_residue_num_iterator(d):
+                pos_in_stem, side = cg.stem_resn_to_stem_vres_side(d, pos)
+                if (d, pos_in_stem) not in frame_lookup:
+                    frame_lookup[d, pos_in_stem] = len(frames)
+                    frames.append((d, pos_in_stem))
+                atom_names = [aname for aname, _ in
+                              _residue_atom_names(cg.seq[pos], sidechain)]
+                residues.extend([pos] * len(atom_names))
+                atoms.extend(name_index[aname] for aname in atom_names)
+                local_coords.extend(ftua.stem_atom_positions(
+                    side, cg.seq[pos], atom_names))
+                frame_index.extend([frame_lookup[d, pos_in_stem]] * len(atom_names))
+            continue
+        if not cg.defines[d]:
+            continue
+        if d[0] == 'i' or d[0] == 'm':
+            conn_type = cg.connection_type(d, cg.connections(d))
+        else:
+            conn_type = 0
+        table = ftua.loop_table()
+        positions, table_atoms, coords = table.element_atoms(
+            d[0], cg.get_node_dimensions(d), conn_type)
+        rows = {(i, table.atom_names[atom]): k for k, (i, atom)
+                in enumerate(zip(positions.tolist(), table_atoms.tolist()))}
+        frames.append((d, None))
+        for i, pos in enumerate(cg.define_residue_num_iterator(d)):
+            for aname, identifier in _residue_atom_names(cg.seq[pos], sidechain):
+                try:
+                    local_coords.append(coords[rows[i, identifier]])
+                except KeyError:
+                    continue
+                residues.append(pos)
+                atoms.append(name_index[aname])
+                frame_index.append(len(frames) - 1)
+    residues = np.array(residues, dtype=int)
+    # Sorted by residue, with the atoms of a residue in the same order as
+    # in VirtualAtomsLookup
+    order = np.argsort(residues, kind="mergesort")
+    template = (residues[order], np.array(atoms, dtype=int)[order],
+                np.array(local_coords, dtype=float).reshape(-1, 3)[order],
+                np.array(frame_index, dtype=int)[order])
+    for array in template:
+        array.flags.writeable = False
+    return template + (frames,)
+
+
+def virtual_atom_array(cg, sidechain=True):
+    """
+    The positions of the virtual atoms of all residues as one array.
 
-        return {aname: coord for aname, coord in zip(atom_keys, atom_coords)}
+    Gives the same positions as VirtualAtomsLookup, but all atoms of
+    an element are transformed to global coordinates at once.
+    Use cg.virtual_atom_array, which caches the result.
+
+    :param cg: The coarse grain structure.
+    :param sidechain: Whether or not to include the side chain atoms.
+    :returns: A tuple (coords, residues, atoms) of arrays.
+              coords (N_atoms x 3) are the atom positions,
+              residues the residue numbers (starting with 1) and atoms the
+              indices of the atom names in virtual_atom_names.
+              The atoms are sorted by residue number.
+    """
+    residues, atoms, local_coords, frame_index, frames = cg._traversal_product(
+        ("virtual_atom_template", sidechain),
+        lambda: _virtual_atom_template(cg, sidechain))
+    if any(d not in cg.vbases for d, i in frames if i is not None):
+        cg.add_all_virtual_residues()
+    origins = np.empty((len(frames), 3))
+    bases = np.empty((len(frames), 3, 3))
+    valid = np.ones(len(frames), dtype=bool)
+    for k, (d, i) in enumerate(frames):
+        if i is not None:
+            origins[k] = cg.vposs[d][i]
+            bases[k] = cg.vbases[d][i]
+            continue
+        try:
+            origins[k], bases[k] = element_coord_system(cg, d)
+        except ValueError:
+            # 0-length hairpin.
+            if d[0] == "h" and np.array_equal(cg.coords[d][0], cg.coords[d][1]):
+                warnings.warn(
+                    "Returning empty set of virtual atoms for 0-length hairpin")
+                valid[k] = False
+            else:
+                raise
+    if not np.all(valid):
+        mask = valid[frame_index]
+        residues, atoms = residues[mask], atoms[mask]
+        local_coords, frame_index = local_coords[mask], frame_index[mask]
+    coords = np.einsum("nji,nj->ni", bases[frame_index], local_coords)
+    coords += origins[frame_index]
+    return coords, residues, atoms
 
 
 def vres_to_global_coordinates(vres_pos, vres_basis, positions):
@@ -912,7 +912,9 @@ def elements_closer_than(s1_p0, s1_p1, s2_p0, s2_p1, distance):
             tN = e + b
             tD = c
 
-    if (tN < 0.0):           # tc < 0 => the t=0 edge is visible
+    # tc < 0 => the t=0 edge is visible.
+    # If S2 is a point, tc = 0 as well.
+    if (tN < 0.0 or tD < SMALL_NUM):
         tN = 0.0
         # recompute sc for this edge
         if (-d < 0.0):
@@ -996,7 +998,9 @@ def line_segment_distance(s1_p0, s1_p1, s2_p0, s2_p1):
             tN = e + b
             tD = c
 
-    if (tN < 0.0):           # tc < 0 => the t=0 edge is visible
+    # tc < 0 => the t=0 edge is visible.
+    # If S2 is a point, tc = 0 as well.
+    if (tN < 0.0 or tD < SMALL_NUM):
         tN = 0.0
         # recompute sc for this edge
         if (-d < 0.0):
@@ -1027,6 +1031,114 @@ def line_segment_distance(s1_p0, s1_p1, s2_p0, s2_p1):
     return (s1_p0 + sc * u, s2_p0 + tc * v)
 
 
+def segment_distances(s1_p0, s1_p1, s2_p0, s2_p1):
+    '''
+    The vectorized version of line_segment_distance for N pairs of segments.
+
+    The same algorithm (including the special case of parallel segments) is
+    applied to all pairs at once, with numpy arrays instead of branches.
+
+    :param s1_p0: An Nx3 array with the starts of the first segments
+    :param s1_p1: An Nx3 array with the ends of the first segments
+
+    :param s2_p0: An Nx3 array with the starts of the second segments
+    :param s2_p1: An Nx3 array with the ends of the second segments
+
+    :return: A tuple (i1, i2, distances). i1 and i2 are Nx3 arrays containing
+             the points on the first segments closest to the points on the
+             second segments. distances is an array of length N.
+    '''
+    s1_p0 = np.asarray(s1_p0, dtype=float)
+    s2_p0 = np.asarray(s2_p0, dtype=float)
+    u = np.asarray(s1_p1, dtype=float) - s1_p0
+    v = np.asarray(s2_p1, dtype=float) - s2_p0
+    w = s1_p0 - s2_p0
+
+    a = np.einsum("ij,ij->i", u, u)        # always >= 0
+    b = np.einsum("ij,ij->i", u, v)
+    c = np.einsum("ij,ij->i", v, v)        # always >= 0
+    d = np.einsum("ij,ij->i", u, w)
+    e = np.einsum("ij,ij->i", v, w)
+
+    D = a * c - b * b       # always >= 0
+
+    SMALL_NUM = 0.000001
+
+    # compute the line parameters of the two closest points
+    # For almost parallel lines, use the point P0 on segment S1
+    parallel = D < SMALL_NUM
+    sN = np.where(parallel, 0., b * e - c * d)
+    sD = np.where(parallel, 1., D)
+    tN = np.where(parallel, e, a * e - b * d)
+    tD = np.where(parallel, c, D)
+    # sc < 0 => the s=0 edge is visible
+    s_low = ~parallel & (sN < 0.)
+    # sc > 1 => the s=1 edge is visible
+    s_high = ~parallel & ~s_low & (sN > sD)
+    sN[s_low] = 0.
+    sN[s_high] = sD[s_high]
+    tN[s_low] = e[s_low]
+    tN[s_high] = e[s_high] + b[s_high]
+    tD[s_low | s_high] = c[s_low | s_high]
+
+    # tc < 0 => the t=0 edge is visible. If S2 is a point, tc = 0 as well.
+    t_low = (tN < 0.) | (tD < SMALL_NUM)
+    # tc > 1 => the t=1 edge is visible
+    t_high = ~t_low & (tN > tD)
+    tN[t_low] = 0.
+    tN[t_high] = tD[t_high]
+    # recompute sc for these edges
+    s_new = np.where(t_low, -d, -d + b)
+    t_edge = t_low | t_high
+    sN = np.where(t_edge & (s_new < 0.), 0., sN)
+    sN = np.where(t_edge & (s_new > a), sD, sN)
+    inside = t_edge & ~(s_new < 0.) & ~(s_new > a)
+    sN[inside] = s_new[inside]
+    sD[inside] = a[inside]
+
+    # finally do the division to get sc and tc
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sc = np.where(np.abs(sN) < SMALL_NUM, 0., sN / sD)
+        tc = np.where(np.abs(tN) < SMALL_NUM, 0., tN / tD)
+
+    i1 = s1_p0 + sc[:, np.newaxis] * u
+    i2 = s2_p0 + tc[:, np.newaxis] * v
+    diff = i1 - i2
+    return i1, i2, np.sqrt(np.einsum("ij,ij->i", diff, diff))
+
+
+def segment_distance_matrix(s1_p0, s1_p1, s2_p0, s2_p1, chunk_size=2**16):
+    '''
+    The distances between all pairs of N first and M second segments,
+    calculated with segment_distances.
+
+    To limit the memory used, at most chunk_size pairs are calculated at once.
+
+    :param s1_p0, s1_p1: Nx3 arrays with the starts and ends of the first segments
+    :param s2_p0, s2_p1: Mx3 arrays with the starts and ends of the second segments
+    :param chunk_size: The maximal number of pairs per call to segment_distances
+    :return: An NxM array of distances
+    '''
+    s1_p0 = np.asarray(s1_p0, dtype=float)
+    s1_p1 = np.asarray(s1_p1, dtype=float)
+    s2_p0 = np.asarray(s2_p0, dtype=float)
+    s2_p1 = np.asarray(s2_p1, dtype=float)
+    n, m = len(s1_p0), len(s2_p0)
+    distances = np.empty((n, m))
+    if m == 0:
+        return distances
+    rows = max(1, chunk_size // m)
+    for start in range(0, n, rows):
+        end = min(n, start + rows)
+        num_rows = end - start
+        _, _, dists = segment_distances(np.repeat(s1_p0[start:end], m, axis=0),
+                                        np.repeat(s1_p1[start:end], m, axis=0),
+                                        np.tile(s2_p0, (num_rows, 1)),
+                                        np.tile(s2_p1, (num_rows, 1)))
+        distances[start:end] = dists.reshape(num_rows, m)
+    return distances
+
+
 def closest_point_on_seg(seg_a, seg_b, circ_pos):
     '''
     Closest point between a line segment and a point.
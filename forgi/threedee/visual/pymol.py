@@ -336,14 +336,16 @@ def add_cg(self, cg, labels, color_modifier=1.0):
             self.add_encompassing_cylinders(rna_plotter, cg, 7.)
 
         if self.max_stem_distances > 0:
-            for (s1, s2) in it.permutations(cg.stem_iterator(), r=2):
-                (i1, i2) = cuv.line_segment_distance(cg.coords[s1][0],
-                                                     cg.coords[s1][1],
-                                                     cg.coords[s2][0],
-                                                     cg.coords[s2][1])
-                if cuv.magnitude(i2 - i1) < self.max_stem_distances:
-                    #self.add_segment(i1, i2, 'cyan', 0.3, s1 + " " + s2, key=key)
-                    rna_plotter.add_segment(i1, i2, 'cyan', 0.3, key=key)
+            stem_pairs = list(it.permutations(cg.stem_iterator(), r=2))
+            if stem_pairs:
+                coords1 = cg.coords[[s1 for s1, s2 in stem_pairs]]
+                coords2 = cg.coords[[s2 for s1, s2 in stem_pairs]]
+                points1, points2, dists = cuv.segment_distances(
+                    coords1[::2], coords1[1::2], coords2[::2], coords2[1::2])
+                for i1, i2, dist in zip(points1, points2, dists):
+                    if dist < self.max_stem_distances:
+                        #self.add_segment(i1, i2, 'cyan', 0.3, s1 + " " + s2, key=key)
+                        rna_plotter.add_segment(i1, i2, 'cyan', 0.3, key=key)
 
         if self.virtual_atoms or self.sidechain_atoms:
             cg.add_all_virtual_residues()
@@ -7,6 +7,8 @@
 import contextlib
 import warnings
 import textwrap
+import functools
+import multiprocessing
 
 import numpy as np
 
@@ -17,6 +19,7 @@
 
 import forgi.graph.bulge_graph as fgb
 import forgi.threedee.model.coarse_grain as ftmc
+import forgi.threedee.model.cg_binary as ftmcb
 
 log = logging.getLogger(__name__)
 
@@ -64,6 +67,10 @@ def get_rna_input_parser(helptext, nargs=1, rna_type="any", enable_logging=True,
                              "or kept (if this option is present).\n"
                              "In  the case of input in forgi-format,\n"
                              "the RNA from the file is not modified.")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Load the RNA files in parallel, using this\n"
+                             "number of processes. This only has an effect,\n"
+                             "if more than one file is given.")
     if rna_type != "only_cg":
         pdb_input_group = parser.add_argument_group("Options for loading of PDB files",
                                                     description="These options only take effect, "
@@ -93,7 +100,7 @@ def get_rna_input_parser(helptext, nargs=1, rna_type="any", enable_logging=True,
 
 
 def cgs_from_args(args, rna_type="any", enable_logging=True,
-                  return_filenames=False, skip_errors=False):
+                  return_filenames=False, skip_errors=False, lazy=False):
     """
     Given an Namespace from argparse, return a list of CoarseGrainRNA objects
     (or BulgeGraph objects).
@@ -113,6 +120,13 @@ def cgs_from_args(args, rna_type="any", enable_logging=True,
                     filename will thus be found twice in the list of filenames.
     :param skip_errors: Boolean. Log GraphConstructionErrors and continue with
                     the next filename instead of letting the error propagate.
+    :param lazy: Return a generator instead of a list. The RNAs are only
+                    loaded while iterating over it and fasta/dotbracket files
+                    are parsed one record at a time.
+                    If return_filenames is True, the generator yields
+                    tuples `rna, filename`.
+                    With skip_errors, an error in a fasta file only skips
+                    the remaining records of this file.
 
     Usage::
 
@@ -125,40 +139,126 @@ def cgs_from_args(args, rna_type="any", enable_logging=True,
         logging.basicConfig(
             format="%(levelname)s:%(name)s.%(funcName)s[%(lineno)d]: %(message)s")
         logging_exceptions.config_from_args(args)
+    rnas_and_filenames = _iter_rnas_from_args(args, rna_type, skip_errors, lazy)
+    if lazy:
+        if return_filenames:
+            return rnas_and_filenames
+        return (cg for cg, _ in rnas_and_filenames)
     cg_rnas = []
     filenames = []
+    for cg, filename in rnas_and_filenames:
+        cg_rnas.append(cg)
+        filenames.append(filename)
+    if return_filenames:
+        return cg_rnas, filenames
+    else:
+        return cg_rnas
+
+
+def _iter_rnas_from_args(args, rna_type, skip_errors, lazy):
+    """
+    Used by cgs_from_args. Yields tuples `rna, filename`
+    """
+    if rna_type == "only_cg":
+        args.chains = None
+        args.pseudoknots = None
+        args.pdb_secondary_structure = None
+        args.pdb_annotation_tool = None
+        args.pdb_allow_www_query = False
+    if args.chains:
+        load_chains = args.chains.split(",")
+    else:
+        load_chains = None
+    load_rna_kwargs = dict(rna_type=rna_type,
+                           pdb_chain=load_chains,
+                           pdb_remove_pk=not args.pseudoknots, pdb_dotbracket=args.pdb_secondary_structure,
+                           dissolve_length_one_stems=not args.keep_length_one_stems,
+                           pdb_annotation_tool=args.pdb_annotation_tool,
+                           pdb_allow_www_query=args.pdb_allow_www_query)
+    jobs = getattr(args, "jobs", 1)
+    if jobs is not None and jobs > 1:
+        for cg, rna in load_rnas_parallel(args.rna, jobs, return_filenames=True,
+                                          skip_errors=skip_errors,
+                                          **load_rna_kwargs):
+            yield cg, rna
+        return
     for rna in args.rna:
         log.debug("Load RNA %s", rna)
-        if rna_type == "only_cg":
-            args.chains = None
-            args.pseudoknots = None
-            args.pdb_secondary_structure = None
-            args.pdb_annotation_tool = None
-            args.pdb_allow_www_query = False
-        if args.chains:
-            load_chains = args.chains.split(",")
-        else:
-            load_chains = None
         try:
-            cg_or_cgs = load_rna(rna, rna_type=rna_type, allow_many=True,
-                                 pdb_chain=load_chains,
-                                 pdb_remove_pk=not args.pseudoknots, pdb_dotbracket=args.pdb_secondary_structure,
-                                 dissolve_length_one_stems=not args.keep_length_one_stems,
-                                 pdb_annotation_tool=args.pdb_annotation_tool,
-                                 pdb_allow_www_query=args.pdb_allow_www_query)
+            cg_or_cgs = load_rna(rna, allow_many=True, lazy=lazy,
+                                 **load_rna_kwargs)
+            for cg in cg_or_cgs:
+                yield cg, rna
         except GraphConstructionError:
             if not skip_errors:
                 log.error("An error occurred while loading the file %s", rna)
                 raise
             else:
                 log.exception("The PDB %s was skipped due to the following error", rna)
-        else:
-            cg_rnas.extend(cg_or_cgs)
-            filenames.extend([rna] * len(cg_or_cgs))
-    if return_filenames:
-        return cg_rnas, filenames
-    else:
-        return cg_rnas
+
+
+def load_rnas_parallel(filenames, jobs=None, return_filenames=False,
+                       skip_errors=False, **kwargs):
+    """
+    Load RNAs from many files, using a pool of worker processes.
+
+    This is a generator. The RNAs are yielded in the order of filenames,
+    as soon as the corresponding file has been loaded.
+
+    :param filenames: A list or iterable of filenames (or dotbracket strings),
+                      as accepted by load_rna
+    :param jobs: The number of processes. If this is None, use all cpus.
+    :param return_filenames: Yield tuples `rna, filename` instead of RNAs.
+    :param skip_errors: Boolean. Log GraphConstructionErrors and continue with
+                    the next filename instead of letting the error propagate.
+    :param kwargs: Passed on to load_rna (allow_many is always True)
+
+    Usage::
+
+        for cg in load_rnas_parallel(["1GID.pdb", "1Y26.pdb"], 2, rna_type="3d"):
+            print(cg.name)
+    """
+    filenames = list(filenames)
+    worker = functools.partial(_load_rna_in_pool, skip_errors=skip_errors,
+                               load_rna_kwargs=kwargs)
+    pool = multiprocessing.Pool(jobs)
+    try:
+        results = pool.imap(worker, filenames)
+        for filename in filenames:
+            rnas, error = next(results)
+            if error is not None:
+                log.error("The file %s was skipped due to the following "
+                          "error: %s", filename, error)
+                continue
+            for rna in rnas:
+                if return_filenames:
+                    yield rna, filename
+                else:
+                    yield rna
+        pool.close()
+    except GraphConstructionError:
+        log.error("An error occurred while loading the files %s", filenames)
+        raise
+    finally:
+        # Only has an effect, if not all results were consumed
+        pool.terminate()
+        pool.join()
+
+
+def _load_rna_in_pool(filename, skip_errors, load_rna_kwargs):
+    """
+    Used by load_rnas_parallel. Executed in the worker processes.
+
+    :returns: A tuple `rnas, error`
+    """
+    log.debug("Load RNA %s", filename)
+    try:
+        return load_rna(filename, allow_many=True, **load_rna_kwargs), None
+    except GraphConstructionError as e:
+        if not skip_errors:
+            raise
+        log.exception("Error while loading %s", filename)
+        return [], e
 
 
 def sniff_filetype(file):
@@ -203,7 +303,7 @@ def sniff_filetype(file):
 def load_rna(filename, rna_type="any", allow_many=True, pdb_chain=None,
              pdb_remove_pk=True, pdb_dotbracket="",
              dissolve_length_one_stems=True,
-             pdb_annotation_tool=None, pdb_allow_www_query=False):
+             pdb_annotation_tool=None, pdb_allow_www_query=False, lazy=False):
     """
     :param rna_type: One of "any", and "3d" and "pdb"
 
@@ -226,6 +326,10 @@ def load_rna(filename, rna_type="any", allow_many=True, pdb_chain=None,
     :param pdb_annotation_tool: Use DSSR, MC-Annotate or forgi heuristic for
                     basepair-detection in PDB/MMCIF files (None for auto-detect).
                     Ignored for other file-types.
+    :param lazy: Only used if allow_many is True. Return an iterable instead
+                 of a list. For fasta/dotbracket files, the records are
+                 then read and converted to RNAs one at a time, while
+                 iterating.
 
     :retuns: A list of RNAs or a single RNA
     """
@@ -244,16 +348,22 @@ def load_rna(filename, rna_type="any", allow_many=True, pdb_chain=None,
                 return [bg]
             else:
                 return bg
-    with open(filename) as rnafile:
-        filetype = sniff_filetype(rnafile)
+    if ftmcb.is_cg_binary(filename):
+        filetype = "forgi_binary"
+    else:
+        with open(filename) as rnafile:
+            filetype = sniff_filetype(rnafile)
     if rna_type == "pdb" and filetype not in ["pdb", "cif"]:
         raise WrongFileFormat(
             "Only PDB files (*.pdb/.cif) are accepted, but file {} has type {}.".format(filename, filetype))
-    if rna_type == "only_cg" and filetype != "forgi":
+    if rna_type == "only_cg" and filetype not in ["forgi", "forgi_binary"]:
         raise WrongFileFormat(
             "Only forgi cg files are accepted, but file {} has type {}.".format(filename, filetype))
-    if filetype == "forgi":
-        cg = ftmc.CoarseGrainRNA.from_bg_file(filename)
+    if filetype in ["forgi", "forgi_binary"]:
+        if filetype == "forgi":
+            cg = ftmc.CoarseGrainRNA.from_bg_file(filename)
+        else:
+            cg = ftmc.CoarseGrainRNA.from_binary_file(filename)
         if rna_type in ["3d", "only_cg"] and not cg.coords.is_filled: # pylint: disable=E1101
             raise WrongFileFormat(
                 "File {} does not contain all 3D coordinates!".format(filename))
@@ -307,39 +417,56 @@ def load_rna(filename, rna_type="any", allow_many=True, pdb_chain=None,
         if rna_type == "3d":
             raise WrongFileFormat(
                 "Fasta(like) file {} is not supported. We need 3D coordinates!".format(filename))
-        try:
-            bgs = ftmc.CoarseGrainRNA.from_fasta(
-                filename, dissolve_length_one_stems=dissolve_length_one_stems)
-        except Exception as e:
-            with log_to_exception(log, e):
-                log.critical("Could not parse file %r.", filename)
-                if filetype == "other":
-                    log.critical(
-                        "We assumed file %r to be some fasta-variant or dotbracket file, but an error occurred during parsing.", filename)
-            raise
+        bgs = _iter_fasta_rnas(filename, filetype, dissolve_length_one_stems)
         if allow_many:
-            return bgs
+            if lazy:
+                return bgs
+            return list(bgs)
         else:
-            if len(bgs) > 1:
+            bg = next(bgs)
+            for _ in bgs:
                 raise WrongFileFormat(
                     "More than one RNA found in fasta/ dotbracket file {}.".format(filename))
-            return bgs[0]
+            return bg
+
+
+def _iter_fasta_rnas(filename, filetype, dissolve_length_one_stems):
+    """
+    Used by load_rna. Iterate over the RNAs in a fasta(like) file
+    and log, what we assumed about the file, if parsing fails.
+    """
+    try:
+        for bg in ftmc.CoarseGrainRNA.iter_fasta(
+                filename, dissolve_length_one_stems=dissolve_length_one_stems):
+            yield bg
+    except Exception as e:
+        with log_to_exception(log, e):
+            log.critical("Could not parse file %r.", filename)
+            if filetype == "other":
+                log.critical(
+                    "We assumed file %r to be some fasta-variant or dotbracket file, but an error occurred during parsing.", filename)
+        raise
 
 
 @contextlib.contextmanager
-def open_for_out(filename=None, force=False):
+def open_for_out(filename=None, force=False, mode='w'):
     "From http://stackoverflow.com/a/17603000/5069869"
     if filename and filename != '-':
         if not force and os.path.isfile(filename):
             raise IOError(
                 "Cannot create file {}. File exists.".format(filename))
-        fh = open(filename, 'w')
+        fh = open(filename, mode)
+        close = True
     else:
         fh = sys.stdout
+        if "b" in mode:
+            # On python 3, bytes have to be written to the underlying buffer.
+            fh = getattr(sys.stdout, "buffer", sys.stdout)
+        close = False
     try:
         yield fh
     finally:
-        if fh is not sys.stdout:
+        if close:
             fh.close()
 
 
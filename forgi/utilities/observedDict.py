@@ -25,6 +25,7 @@ def __setitem__(self, key, value):
 
     def __delitem__(self, key):
         super(observedDict, self).__delitem__(key)
+        self.on_change(key)
 
     def clear(self):
         for key in self.keys():
@@ -44,9 +45,14 @@ def setdefault(self, key, value=None):
     def pop(self, k, x=None):
         if k in self:
             self.on_change(k)
-        return super(observedDict, self).pop(self, k, x)
+        return super(observedDict, self).pop(k, x)
 
     def popitem(self):
-        key, value = super(observedDict, self).popitem(self)
+        key, value = super(observedDict, self).popitem()
         self.on_change(key)
         return key, value
+
+    def __reduce__(self):
+        # The default pickle protocol for dict subclasses would call
+        # __setitem__ before on_change is restored.
+        return (self.__class__, (dict(self), self.on_change))
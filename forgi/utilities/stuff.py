@@ -10,6 +10,9 @@
 import subprocess
 
 import logging
+
+import numpy as np
+
 log = logging.getLogger(__name__)
 
 import forgi
@@ -147,26 +150,38 @@ def delete_from_stack(stack, j):
 def pairtable_to_dotbracket(pt):
     """
     Converts arbitrary pair table array (ViennaRNA format) to structure in dot bracket format.
+
+    Pseudoknots are assigned the next bracket type, if the pair cannot be
+    nested in an already used bracket type.
     """
+    pt = np.asarray(pt, dtype=int)
+    length = pt[0]
+    partners = pt[1:length + 1]
+    positions = np.arange(1, length + 1)
+    paired = np.flatnonzero(partners)
+    counts = np.bincount(partners[paired], minlength=length + 1)
+    if np.any(counts > 1):
+        raise ValueError('Invalid pairtable contains duplicate entries')
+    if np.any(partners[paired] > length) or np.any(pt[partners[paired]] != positions[paired]):
+        raise ValueError('Invalid pairtable: Pairs are not symmetric')
+
+    res = np.full(length, ord("."), dtype=np.uint8)
+    left = np.frombuffer(bracket_left.encode("ascii"), dtype=np.uint8)
+    right = np.frombuffer(bracket_right.encode("ascii"), dtype=np.uint8)
     stack = col.defaultdict(list)
-    seen = set()
-    res = ""
-    for i in range(1, pt[0] + 1):
-        if pt[i] != 0 and pt[i] in seen:
-            raise ValueError('Invalid pairtable contains duplicate entries')
-
-        seen.add(pt[i])
-
-        if pt[i] == 0:
-            res += '.'
-        else:
+    bracket_of = {}
+    for i, j in zip(positions[paired].tolist(), partners[paired].tolist()):
+        if j > i:
             # '(' check if we can stack it...
-            if pt[i] > i:
-                res += bracket_left[insert_into_stack(stack, i, pt[i])]
-            else:                                    # ')'
-                res += bracket_right[delete_from_stack(stack, i)]
-
-    return res
+            k = insert_into_stack(stack, i, j)
+            bracket_of[j] = k
+            res[i - 1] = left[k]
+        else:
+            # ')' The closing bracket is always on top of its stack.
+            k = bracket_of.pop(i)
+            stack[k].pop()
+            res[i - 1] = right[k]
+    return res.tobytes().decode("ascii")
 
 
 def inverse_brackets(bracket):
@@ -180,41 +195,57 @@ def dotbracket_to_pairtable(struct):
     """
     Converts arbitrary structure in dot bracket format to pair table (ViennaRNA format).
 
-
+    Backbone breaks ('&') are ignored.
     """
     if len(struct) == 0:
         raise ValueError("Cannot convert empty structure to pairtable")
-    pt = [0] * ((len(struct) + 1) - struct.count("&"))
-    pt[0] = len(struct) - struct.count("&")
+    return dotbrackets_to_pairtable_array([struct])[0].tolist()
 
-    stack = col.defaultdict(list)
-    inverse_bracket_left = inverse_brackets(bracket_left)
-    inverse_bracket_right = inverse_brackets(bracket_right)
 
-    i = 0
-    for a in struct:
-        if a == '&':
-            continue
-        i += 1
-        # print i,a, pt
-        log.debug("Parsing bracket %r", a)
-        if a == ".":
-            pt[i] = 0
-        else:
-            if a in inverse_bracket_left:
-                stack[inverse_bracket_left[a]].append(i)
-            else:
-                assert a in inverse_bracket_right
-                if len(stack[inverse_bracket_right[a]]) == 0:
-                    raise ValueError('Too many closing brackets!')
-                j = stack[inverse_bracket_right[a]].pop()
-                pt[i] = j
-                pt[j] = i
+def dotbrackets_to_pairtable_array(structs):
+    """
+    Convert many dotbracket strings of the same length to pair tables at once.
 
-    if len(stack[inverse_bracket_left[a]]) != 0:
-        raise ValueError('Too many opening brackets!')
+    Backbone breaks ('&') are ignored.
 
-    return pt
+    :param structs: A list of dotbracket strings, with the same number of
+                    nucleotides.
+    :returns: An integer numpy array of shape (len(structs), length+1).
+              Every row is a pair table (with the length at index 0).
+    """
+    structs = [struct.replace("&", "") for struct in structs]
+    length = len(structs[0]) if structs else 0
+    if any(len(struct) != length for struct in structs):
+        raise ValueError("All dotbracket strings need to have the same length.")
+    joined = "".join(structs)
+    present = set(joined)
+    unknown = present - set(bracket_left + bracket_right + ".")
+    if unknown:
+        raise ValueError("Invalid character(s) {} in dotbracket string".format(
+            ", ".join(repr(c) for c in sorted(unknown))))
+    chars = np.frombuffer(joined.encode("ascii"),
+                          dtype=np.uint8).reshape((len(structs), length))
+    pts = np.zeros((len(structs), length + 1), dtype=int)
+    pts[:, 0] = length
+    for left, right in zip(bracket_left, bracket_right):
+        if left not in present and right not in present:
+            continue
+        is_left = chars == ord(left)
+        is_right = chars == ord(right)
+        depth = np.cumsum(is_left.astype(int) - is_right, axis=1)
+        if np.any(depth < 0):
+            raise ValueError('Too many closing brackets!')
+        if np.any(depth[:, -1] != 0):
+            raise ValueError('Too many opening brackets!')
+        # An opening bracket pairs with the next closing bracket on the same
+        # level. Sorted by (structure, level, position), they alternate.
+        open_row, open_pos = np.nonzero(is_left)
+        close_row, close_pos = np.nonzero(is_right)
+        opens = np.lexsort((open_pos, depth[open_row, open_pos], open_row))
+        closes = np.lexsort((close_pos, depth[close_row, close_pos] + 1, close_row))
+        pts[open_row[opens], open_pos[opens] + 1] = close_pos[closes] + 1
+        pts[close_row[closes], close_pos[closes] + 1] = open_pos[opens] + 1
+    return pts
 
 
 def pairtable_to_tuples(pt):
@@ -226,17 +257,8 @@ def pairtable_to_tuples(pt):
     :param pt: A pairtable
     :return: A list paired tuples
     '''
-    pt = iter(pt)
-
-    # get rid of the first element which contains the length
-    # of the sequence. We'll figure it out after the traversal
-    next(pt)
-
-    tuples = []
-    for i, p in enumerate(pt):
-        tuples += [(i + 1, p)]
-
-    return tuples
+    partners = np.asarray(pt, dtype=int)[1:].tolist()
+    return list(zip(range(1, len(partners) + 1), partners))
 
 
 def tuples_to_pairtable(pair_tuples, seq_length=None):
@@ -282,6 +304,28 @@ def pairtable_to_elements(pt, level, i, j):
      of this element.
     '''
     elements = []
+    # Nested elements are handled with an explicit stack instead of
+    # recursion, so that long stems and deep nesting do not exceed the
+    # recursion limit. The stack contains ("call", (level, i, j))
+    # for unprocessed regions and ("emit", element) for finished elements,
+    # to keep the order of the elements of the recursive formulation.
+    todo = [("call", (level, i, j))]
+    while todo:
+        kind, item = todo.pop()
+        if kind == "emit":
+            elements.append(item)
+        else:
+            todo.extend(reversed(_elements_in_region(pt, *item)))
+    return elements
+
+
+def _elements_in_region(pt, level, i, j):
+    """
+    One step of pairtable_to_elements.
+
+    :returns: A list of ("emit", element) and ("call", (level, i, j)) tuples,
+              where the latter need to be processed further.
+    """
     u5 = [i - 1]
     u3 = [j + 1]
 
@@ -291,10 +335,10 @@ def pairtable_to_elements(pt, level, i, j):
     # iterate over the unpaired regions on either side
     # this is either 5' and 3' unpaired if level == 0
     # or an interior loop or a multiloop
-    while (pt[i] == 0):
+    while (i <= j and pt[i] == 0):
         u5.append(i)
         i += 1
-    while (pt[j] == 0):
+    while (j >= i and pt[j] == 0):
         u3.append(j)
         j -= 1
 
@@ -302,36 +346,26 @@ def pairtable_to_elements(pt, level, i, j):
         # hairpin loop or one large unpaired molecule
         u5.append(i)
         if (level == 0):
-            return [['e', level, sorted(u5)]]
+            return [("emit", ['e', level, sorted(u5)])]
         else:
-            # check to see if we have chain breaks due
-            # to multiple strands in the input
-            external = False
-            left = []
-            right = []
-            for k in range(0, len(u5)):
-                if (external):
-                    right.append(u5[k])
-                else:
-                    left.append(u5[k])
-
-            return [['h', level, sorted(u5)]]
+            return [("emit", ['h', level, sorted(u5)])]
 
     if (pt[i] != j):
         # multiloop
+        result = []
         m = u5
         k = i
 
         # the nucleotide before and the starting nucleotide
         m.append(k)
         while (k <= j):
-            # recurse into a stem
-            elements += pairtable_to_elements(pt, level, k, pt[k])
+            # process the stem later
+            result.append(("call", (level, k, pt[k])))
 
             # add the nucleotides between stems
             m.append(pt[k])
             k = pt[k] + 1
-            while (pt[k] == 0 and k <= j):
+            while (k <= j and pt[k] == 0):
                 m.append(k)
                 k += 1
 
@@ -342,23 +376,23 @@ def pairtable_to_elements(pt, level, i, j):
 
         if (len(m) > 0):
             if (level == 0):
-                elements.append(['e', level, sorted(m)])
+                result.append(("emit", ['e', level, sorted(m)]))
             else:
-                elements.append(['m', level, sorted(m)])
+                result.append(("emit", ['m', level, sorted(m)]))
 
-        return elements
+        return result
 
-    if (pt[i] == j):
-        # interior loop
-        u5.append(i)
-        u3.append(j)
+    result = []
+    # interior loop
+    u5.append(i)
+    u3.append(j)
 
-        combined = u5 + u3
-        if len(combined) > 4:
-            if (level == 0):
-                elements.append(['e', level, sorted(u5 + u3)])
-            else:
-                elements.append(['i', level, sorted(u5 + u3)])
+    combined = u5 + u3
+    if len(combined) > 4:
+        if (level == 0):
+            result.append(("emit", ['e', level, sorted(combined)]))
+        else:
+            result.append(("emit", ['i', level, sorted(combined)]))
 
     s = []
     # go through the stem
@@ -372,11 +406,9 @@ def pairtable_to_elements(pt, level, i, j):
 
         level += 1
 
-    u5 = [i - 1]
-    u3 = [j + 1]
-    elements.append(['s', level, sorted(s)])
-
-    return elements + pairtable_to_elements(pt, level, i, j)
+    result.append(("emit", ['s', level, sorted(s)]))
+    result.append(("call", (level, i, j)))
+    return result
 
 
 def bpseq_to_tuples_and_seq(bpseq_str):
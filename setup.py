@@ -98,7 +98,7 @@ def build_extension(self, ext):
                 'forgi.threedee.classification._training',
                 'forgi._k2n_standalone', 'forgi.threedee.visual',
                 'forgi.visual', 'forgi.projection'],
-      "package_data":{'forgi.threedee': ['data/*.pdb', 'data/stats/temp.stats', 'data/average_atom_positions.json', 'data/aminor_geometries.csv', 'data/aminor_params.json']},
+      "package_data":{'forgi.threedee': ['data/*.pdb', 'data/stats/temp.stats', 'data/average_atom_positions.json', 'data/average_atom_positions.npz', 'data/aminor_geometries.csv', 'data/aminor_params.json']},
       "data_files":[("", ["CREDITS", "LICENSE"])],
       "scripts":['examples/rnaConvert.py',
                'examples/describe_cg.py',
@@ -0,0 +1,116 @@
+from __future__ import absolute_import
+from __future__ import print_function
+
+import random
+import unittest
+
+import forgi._k2n_standalone.knots as fakk
+from forgi._k2n_standalone.rna2d import Pairs
+
+
+def random_knotted_pairs(num_regions, seed):
+    """
+    Base pairs of randomly placed (mostly conflicting) paired regions.
+    """
+    rng = random.Random(seed)
+    length = num_regions * 16 + 8
+    free = [True] * (length + 1)
+    pairs = []
+    while num_regions:
+        stem = rng.randint(1, 4)
+        i = rng.randint(1, length - 2 * stem - 3)
+        j = rng.randint(i + 2 * stem + 3, length)
+        positions = list(range(i, i + stem)) + list(range(j - stem + 1, j + 1))
+        if not all(free[p] for p in positions):
+            continue
+        for p in positions:
+            free[p] = False
+        pairs.extend((i + k, j - k) for k in range(stem))
+        num_regions -= 1
+    return Pairs(sorted(pairs))
+
+
+class ConflictMatrixTest(unittest.TestCase):
+    def setUp(self):
+        self.pairs = Pairs([(1, 10), (2, 9), (5, 15), (6, 14), (20, 30),
+                            (25, 35), (40, 50), (41, 49)])
+        self.cm = fakk.ConflictMatrix(self.pairs)
+
+    def test_conflicts(self):
+        self.assertEqual(self.cm.Ids, [0, 1, 2, 3, 4])
+        self.assertEqual(self.cm.conflictsOf(0), [1])
+        self.assertEqual(self.cm.conflictsOf(4), [])
+        self.assertEqual(self.cm.conflicting(), [0, 1, 2, 3])
+        self.assertEqual(self.cm.nonConflicting(), [4])
+        self.assertEqual(self.cm.conflictCliques(), [[0, 1], [2, 3]])
+
+    def test_matrix(self):
+        self.assertIs(self.cm.Matrix[0][1], True)
+        self.assertIs(self.cm.Matrix[0][2], False)
+        self.assertEqual(self.cm.Matrix.RowOrder, [0, 1, 2, 3, 4])
+
+    def test_without_region(self):
+        cm = self.cm.withoutRegion(1)
+        self.assertEqual(cm.Ids, [0, 2, 3, 4])
+        self.assertEqual(cm.conflicting(), [2, 3])
+        self.assertEqual(cm.conflictsOf(2), [3])
+
+    def test_overlapping_regions(self):
+        prs = fakk.PairedRegions([fakk.PairedRegion(1, 10, 2, Id=0),
+                                  fakk.PairedRegion(2, 20, 1, Id=1)])
+        with self.assertRaises(ValueError):
+            fakk.ConflictMatrix(prs)
+
+    def test_same_as_pairwise(self):
+        prs = fakk.PairedRegionsFromPairs(random_knotted_pairs(30, seed=1))
+        cm = fakk.ConflictMatrix(prs)
+        for pr1 in prs:
+            for pr2 in prs:
+                self.assertEqual(cm.Conflicts[pr1.Id, pr2.Id],
+                                 pr1.conflicting(pr2))
+
+
+class PseudoknotRemovalTest(unittest.TestCase):
+    def test_eg(self):
+        pairs = Pairs([(1, 10), (2, 9), (5, 15), (6, 14), (20, 30)])
+        nested, removed = fakk.eg(pairs, return_removed=True)
+        # Equal gain, the region closest to the 3' end is removed.
+        self.assertEqual(nested, [(1, 10), (2, 9), (20, 30)])
+        self.assertEqual(removed, [(5, 15), (6, 14)])
+
+    def test_ec(self):
+        pairs = Pairs([(1, 10), (5, 15), (6, 14), (12, 20), (13, 19)])
+        nested, removed = fakk.ec(pairs, return_removed=True)
+        # The region 5-15 conflicts with both other regions
+        self.assertEqual(nested, [(1, 10), (12, 20), (13, 19)])
+        self.assertEqual(removed, [(5, 15), (6, 14)])
+
+    def test_add_back(self):
+        prs = fakk.PairedRegionsFromPairs(Pairs([(1, 10), (5, 15), (20, 30)]))
+        kept = fakk.PairedRegions([prs[0]])
+        removed = {1: prs[1], 2: prs[2]}
+        new_prs, new_removed = fakk.add_back_non_conflicting(kept, removed)
+        self.assertEqual(new_prs.sortedIds(), [0, 2])
+        self.assertEqual(list(new_removed), [1])
+
+    def test_elimination_is_nested(self):
+        for seed in range(20):
+            pairs = random_knotted_pairs(25, seed)
+            for method in [fakk.eg, fakk.ec]:
+                nested, removed = method(pairs, return_removed=True)
+                self.assertFalse(nested.hasPseudoknots())
+                self.assertEqual(sorted(nested + removed), sorted(pairs))
+
+    def test_opt_single_property_same_as_all_solutions(self):
+        for seed in range(30):
+            pairs = random_knotted_pairs(8, seed)
+            expected = fakk._opt_single_property_from_all(pairs, True, 'max',
+                                                          fakk.num_bps)
+            nested, removed = fakk.opt_single_property(pairs, True)
+            self.assertEqual(nested, expected[0])
+            self.assertEqual(removed, expected[1])
+
+    def test_opt_single_property_without_pseudoknots(self):
+        pairs = Pairs([(1, 10), (2, 9)])
+        self.assertEqual(fakk.opt_single_property(pairs), pairs)
+        self.assertEqual(fakk.opt_single_property(pairs, True), (pairs, []))
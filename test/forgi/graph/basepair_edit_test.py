@@ -0,0 +1,192 @@
+from __future__ import absolute_import
+from __future__ import print_function
+
+import unittest
+
+from hypothesis import given, settings
+from hypothesis.strategies import booleans, composite, integers, lists, tuples, floats
+
+import forgi.graph.bulge_graph as fgb
+import forgi.utilities.stuff as fus
+
+
+def _element_keys(bg):
+    """
+    A dict {elem: key}, where the key identifies the element by its position.
+    """
+    keys = {}
+    for elem, define in bg.defines.items():
+        keys[elem] = (elem[0], tuple(define) if define else tuple(bg.define_a(elem)))
+    return keys
+
+
+def _canonical(bg):
+    """
+    The elements of a BulgeGraph, independent of their names.
+    """
+    keys = _element_keys(bg)
+    edges = set()
+    for elem in bg.defines:
+        for other in bg.edges[elem]:
+            edges.add(frozenset([keys[elem], keys[other]]))
+    return sorted(keys.values()), edges
+
+
+def _random_pairtable(length, pairs, nested):
+    """
+    A pair table with the base pairs encoded by pairs of floats.
+    Base pairs are skipped, if a nucleotide is already paired or
+    (if nested is True) if they would create a pseudoknot.
+    """
+    pt = [length] + [0] * length
+    for a, b in pairs:
+        i, j = sorted([1 + int(a * length), 1 + int(b * length)])
+        if i == j or pt[i] or pt[j]:
+            continue
+        if nested and any(pt[k] and not i < pt[k] < j for k in range(i + 1, j)):
+            continue
+        pt[i] = j
+        pt[j] = i
+    return pt
+
+
+positions = tuples(floats(0, 1, exclude_max=True), floats(0, 1, exclude_max=True))
+
+
+@composite
+def structure_and_edits(draw):
+    """
+    A nested or pseudoknotted secondary structure and a list of base pair
+    changes, encoded as pairs of floats, which are mapped to valid
+    positions during the test.
+    """
+    length = draw(integers(min_value=2, max_value=40))
+    pt = _random_pairtable(length, draw(lists(positions, max_size=20)),
+                           draw(booleans()))
+    edits = draw(lists(positions, max_size=20))
+    return fus.pairtable_to_dotbracket(pt), edits
+
+
+class BasepairEditTest(unittest.TestCase):
+    def assert_same_as_rebuilt(self, bg):
+        rebuilt = fgb.BulgeGraph.from_dotbracket(bg.to_dotbracket_string())
+        self.assertEqual(_canonical(bg), _canonical(rebuilt))
+        self.assertEqual(set(bg.edges), set(bg.defines))
+        self.assertEqual(bg.to_pair_table(), rebuilt.to_pair_table())
+        # The names may differ, but the traversals of the graph may not.
+        rebuilt_names = dict((key, elem) for elem, key in _element_keys(rebuilt).items())
+        names = dict((elem, rebuilt_names[key]) for elem, key in _element_keys(bg).items())
+        self.assertEqual(tuple(tuple(names[elem] for elem in triple)
+                               for triple in bg.build_order),
+                         rebuilt.build_order)
+        self.assertEqual(set(names[elem] for elem in bg.get_mst()), rebuilt.get_mst())
+        self.assertEqual(set(tuple(names[elem] for elem in loop)
+                             for loop in bg.find_mlonly_multiloops()),
+                         set(rebuilt.find_mlonly_multiloops()))
+
+    @settings(max_examples=300, deadline=None)
+    @given(structure_and_edits())
+    def test_edits_same_as_rebuild(self, data):
+        dotbracket, edits = data
+        length = len(dotbracket)
+        bg = fgb.BulgeGraph.from_dotbracket(dotbracket)
+        for a, b in edits:
+            pt = bg.to_pair_table()
+            paired = [i for i in range(1, length + 1) if pt[i] > i]
+            unpaired = [i for i in range(1, length + 1) if pt[i] == 0]
+            if paired and (a < 0.3 or len(unpaired) < 2):
+                i = paired[int(b * len(paired))]
+                bg.remove_basepair(i, pt[i])
+            else:
+                i = unpaired[int(a * len(unpaired))]
+                unpaired.remove(i)
+                j = unpaired[int(b * len(unpaired))]
+                bg.add_basepair(j, i)
+            self.assert_same_as_rebuilt(bg)
+
+    def test_pseudoknot_edits(self):
+        bg = fgb.BulgeGraph.from_dotbracket(".((((...[))))[(]].).")
+        bg.remove_basepair(3, 12)
+        bg.remove_basepair(4, 11)
+        self.assert_same_as_rebuilt(bg)
+        bg.add_basepair(7, 12)
+        self.assertEqual(fus.pairtable_to_dotbracket(bg.to_pair_table()),
+                         ".(..(.[.{).])([)}.].")
+        self.assert_same_as_rebuilt(bg)
+
+    def test_add_basepair_keeps_names(self):
+        bg = fgb.BulgeGraph.from_dotbracket("((...))...((.....))")
+        defines = dict(bg.defines)
+        bg.add_basepair(13, 17)
+        self.assertEqual(bg.to_dotbracket_string(), "((...))...(((...)))")
+        # The stem is extended, all other elements are unchanged.
+        self.assertEqual(bg.defines["s1"], [11, 13, 17, 19])
+        for elem in ["s0", "h0", "m0"]:
+            self.assertEqual(bg.defines[elem], defines[elem])
+        self.assertEqual(bg.defines["h1"], [14, 16])
+        self.assert_same_as_rebuilt(bg)
+
+    def test_add_basepair_in_hairpin(self):
+        bg = fgb.BulgeGraph.from_dotbracket("((.........))")
+        bg.add_basepair(5, 9)
+        self.assertEqual(bg.to_dotbracket_string(), "((..(...)..))")
+        self.assertEqual(bg.defines["s0"], [1, 2, 12, 13])
+        self.assertEqual(bg.defines["h0"], [6, 8])
+        self.assertEqual(bg.edges["i0"], set(["s0", "s1"]))
+        self.assert_same_as_rebuilt(bg)
+
+    def test_remove_basepair(self):
+        bg = fgb.BulgeGraph.from_dotbracket("(((..(((...)))..)))")
+        bg.remove_basepair(2, 18)
+        self.assertEqual(bg.to_dotbracket_string(), "(.(..(((...)))..).)")
+        self.assert_same_as_rebuilt(bg)
+        bg.remove_basepair(1, 19)
+        bg.remove_basepair(3, 17)
+        self.assertEqual(bg.to_dotbracket_string(), ".....(((...))).....")
+        self.assert_same_as_rebuilt(bg)
+
+    def test_invalid_basepairs(self):
+        bg = fgb.BulgeGraph.from_dotbracket("((...))..")
+        with self.assertRaises(ValueError):
+            bg.add_basepair(1, 9)
+        with self.assertRaises(ValueError):
+            bg.add_basepair(8, 8)
+        with self.assertRaises(ValueError):
+            bg.add_basepair(8, 10)
+        with self.assertRaises(ValueError):
+            bg.remove_basepair(1, 6)
+        self.assertEqual(bg.to_dotbracket_string(), "((...))..")
+
+    def test_pseudoknot(self):
+        bg = fgb.BulgeGraph.from_dotbracket("((..[[..))..]]")
+        bg.remove_basepair(5, 14)
+        bg.add_basepair(11, 3)
+        self.assertEqual(fus.pairtable_to_dotbracket(bg.to_pair_table()),
+                         "(([..{..))].}.")
+        self.assert_same_as_rebuilt(bg)
+
+    def test_cofold(self):
+        bg = fgb.BulgeGraph.from_dotbracket("((...&...))")
+        bg.add_basepair(3, 8)
+        self.assertEqual(bg.to_dotbracket_string(), "(((..&..)))")
+        rebuilt = fgb.BulgeGraph.from_dotbracket("(((..&..)))")
+        self.assertEqual(_canonical(bg), _canonical(rebuilt))
+
+    def test_caches_are_reset(self):
+        bg = fgb.BulgeGraph.from_dotbracket("((...))...((...))")
+        self.assertEqual(bg.ss_distance("s0", "s1"), 4)
+        self.assertEqual(len(bg.build_order), 1)
+        bg.add_basepair(8, 10)
+        self.assertEqual(bg.get_node_from_residue_num(8), "s2")
+        self.assertEqual(bg.ss_distance("s0", "s1"), 3)
+        self.assertEqual(len(bg.build_order), 2)
+
+    def test_remove_first_stem(self):
+        bg = fgb.BulgeGraph.from_dotbracket("(...)..((...))..((...))")
+        bg.remove_basepair(1, 5)
+        self.assertNotIn("s0", bg.defines)
+        self.assertEqual(bg.defines["s1"], [8, 9, 13, 14])
+        # The traversal starts at the first stem
+        self.assertEqual(len(bg.build_order), 1)
+        self.assertEqual(bg.build_order[0][0], "s1")
+        self.assert_same_as_rebuilt(bg)
@@ -12,6 +12,14 @@
 import sys
 import os
 import logging
+import copy
+import pickle
+try:
+    from io import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+import numpy as np
 
 import forgi.graph.bulge_graph as fgb
 import forgi.utilities.debug as fud
@@ -497,6 +505,70 @@ def test_from_fasta1(self):
         bg, = fgb.BulgeGraph.from_fasta_text(a)
         self.assertEqual(bg.seq, 'GGGGGG')
 
+    def test_iter_fasta(self):
+        a = (">a\n"
+             "ACGCCA\n"
+             "((..))\n"
+             ">b\n"
+             "CCCCCC\n"
+             "((()))\n")
+        bgs = fgb.BulgeGraph.iter_fasta(StringIO(a))
+        bg = next(bgs)
+        self.assertEqual(bg.name, 'a')
+        self.assertEqual(bg.to_dotbracket_string(), '((..))')
+        bg = next(bgs)
+        self.assertEqual(bg.name, 'b')
+        self.assertEqual(bg.seq, 'CCCCCC')
+        with self.assertRaises(StopIteration):
+            next(bgs)
+
+    def test_iter_fasta_from_file(self):
+        with open('test/forgi/threedee/data/3V2F.fa', 'r') as f:
+            bg1, = fgb.BulgeGraph.from_fasta_text(f.read())
+        bg2, = fgb.BulgeGraph.iter_fasta('test/forgi/threedee/data/3V2F.fa')
+        self.assertEqual(bg1.defines, bg2.defines)
+        self.assertEqual(bg1.seq, bg2.seq)
+
+    def test_iter_fasta_name_filter(self):
+        # The invalid structure of b is never parsed.
+        a = (">a\n"
+             "ACGCCA\n"
+             "((..))\n"
+             ">b\n"
+             "CCCCCC\n"
+             "((((((\n"
+             ">c\n"
+             "AAAAAA\n"
+             "(....)\n")
+        bgs = list(fgb.BulgeGraph.iter_fasta(StringIO(a), name_filter=["a", "c"]))
+        self.assertEqual([bg.name for bg in bgs], ["a", "c"])
+        bgs = list(fgb.BulgeGraph.iter_fasta(StringIO(a),
+                                             name_filter=lambda x: x == "c"))
+        self.assertEqual([bg.name for bg in bgs], ["c"])
+        with self.assertRaises(ValueError):
+            list(fgb.BulgeGraph.iter_fasta(StringIO(a)))
+
+    def test_iter_fasta_missing_structure(self):
+        a = (">a\n"
+             "ACGCCA\n"
+             ">b\n"
+             "CCCCCC\n"
+             "((()))\n")
+        with self.assertRaises(GraphConstructionError):
+            list(fgb.BulgeGraph.iter_fasta(StringIO(a)))
+
+    def test_iter_fasta_unknown_nucleotides(self):
+        # N is a sequence character (unknown nucleotide), not a bracket.
+        a = (">a\n"
+             "NNCGNN\n"
+             "((..))\n")
+        bg, = fgb.BulgeGraph.iter_fasta(StringIO(a))
+        self.assertEqual(bg.seq, "NNCGNN")
+        self.assertEqual(bg.to_dotbracket_string(), "((..))")
+        bg, = fgb.BulgeGraph.from_fasta('test/forgi/data/pk.fa')
+        self.assertEqual(bg.seq, "N" * 21)
+        self.assertEqual(bg.to_dotbracket_string(), "(([[[))]]]...([[[)]]]")
+
     def test_from_fasta_pseudoknot(self):
         a = """
 >3NKB_B
@@ -1035,6 +1107,16 @@ def test_from_bg_string(self):
 
         self.assertEquals(bg.seq_length, 71)
 
+    def test_from_bg_string_ignores_3d_lines(self):
+        bg_string = ("name test\nlength 6\nseq GGAACC\n"
+                     "define s0 1 2 5 6\ndefine h0 3 4\nconnect s0 h0\n"
+                     "coord s0 0 0 0 1 1 1\nunknown line\n")
+        bg = fgb.BulgeGraph.from_bg_string(bg_string)
+        self.assertEqual(bg.name, "test")
+        self.assertEqual(bg.to_dotbracket_string(), "((..))")
+        self.assertEqual(bg.edges["h0"], set(["s0"]))
+        self.assertFalse(hasattr(bg, "coords"))
+
     def test_from_ct_file(self):
         # ct-file modified from http://x3dna.org/highlights/dssr-derived-secondary-structure-in-ct-format
         ct_stri = """
@@ -1440,12 +1522,39 @@ def test_traverse_graph(self):
         for (f, c, t) in build_order:
             if f in all_stems:
                 all_stems.remove(f)
+
             if t in all_stems:
                 all_stems.remove(t)
 
         self.assertTrue(('s0', 'i4', 's1') in build_order)
         self.assertEqual(len(all_stems), 0)
 
+    def test_traversal_products_cached(self):
+        bg = fgb.BulgeGraph.from_dotbracket('((..((..))..((..))..))')
+        self.assertIs(bg.build_order, bg.build_order)
+        self.assertIs(bg.mst, bg.mst)
+        self.assertEqual(list(bg.build_order), bg.traverse_graph())
+        self.assertEqual(bg.get_mst(), set(bg.mst))
+        self.assertEqual(bg.buildorder_of("s0"), 0)
+        self.assertIsNone(bg.buildorder_of("h0"))
+        self.assertEqual(set(bg.ang_types), set(["m0", "m1"]))
+        # The returned lists are copies
+        bg.traverse_graph().append(None)
+        bg.get_mst().add("x0")
+        self.assertEqual(len(bg.build_order), 2)
+        self.assertNotIn("x0", bg.mst)
+        # Read-only
+        with self.assertRaises(AttributeError):
+            bg.build_order = None
+        with self.assertRaises(AttributeError):
+            bg.mst = set()
+        with self.assertRaises(TypeError):
+            bg.ang_types["m0"] = 1
+        # Reset when the structure changes
+        bg.add_basepair(4, 19)
+        self.assertEqual(len(bg.build_order), 3)
+        self.assertEqual(bg.buildorder_of("i0"), 0)
+
     def test_get_node_from_residue_num(self):
         bg = fgb.BulgeGraph.from_dotbracket(
             '(((((((()))(((((((((((((((&(())))))))))))))))))))))')
@@ -1453,6 +1562,44 @@ def test_get_node_from_residue_num(self):
             for d in define:
                 self.assertEqual(bg.get_node_from_residue_num(d), elem)
 
+    def test_get_node_from_residue_num_out_of_range(self):
+        bg = fgb.BulgeGraph.from_dotbracket('..((..))..')
+        with self.assertRaises(LookupError):
+            bg.get_node_from_residue_num(0)
+        with self.assertRaises(LookupError):
+            bg.get_node_from_residue_num(11)
+
+    def test_elements_of(self):
+        bg = fgb.BulgeGraph.from_dotbracket('..((..)).((...))..')
+        positions = np.arange(1, bg.seq_length + 1)
+        elems = bg.elements_of(positions)
+        self.assertEqual(list(elems), [bg.get_node_from_residue_num(i)
+                                       for i in positions])
+        self.assertEqual(bg.elements_of([[3, 4], [18, 1]]).tolist(),
+                         [["s0", "s0"], ["t0", "f0"]])
+        self.assertEqual(len(bg.elements_of([])), 0)
+        with self.assertRaises(LookupError):
+            bg.elements_of([1, 19])
+
+    def test_element_lookup_invalidated_on_define_change(self):
+        bg = fgb.BulgeGraph.from_dotbracket('..((..))..')
+        self.assertEqual(bg.get_elem(2), "f0")
+        bg.defines["f0"] = [1, 1]
+        bg.defines["x0"] = [2, 2]
+        self.assertEqual(bg.get_elem(2), "x0")
+        del bg.defines["x0"]
+        with self.assertRaises(LookupError):
+            bg.get_elem(2)
+
+    def test_element_lookup_after_copy(self):
+        bg = fgb.BulgeGraph.from_dotbracket('..((..))..')
+        for bg2 in [copy.deepcopy(bg), pickle.loads(pickle.dumps(bg))]:
+            self.assertEqual(bg2.defines, bg.defines)
+            bg2.defines["f0"] = [1, 1]
+            bg2.defines["x0"] = [2, 2]
+            self.assertEqual(bg2.get_elem(2), "x0")
+            self.assertEqual(bg.get_elem(2), "f0")
+
     def test_define_range_iterator(self):
         bg = fgb.BulgeGraph.from_dotbracket(
             '(((((((()))(((((((((((((((&(())))))))))))))))))))))')
@@ -1668,6 +1815,59 @@ def test_ss_distance(self):
         self.assertEqual(bg.ss_distance('s1',1), 2)
         self.assertEqual(bg.ss_distance(fgb.RESID(chain='A', resid=(' ',8,' ')),1), 3)
 
+    def test_ss_distance_matrix(self):
+        db = '((..))((..))..'
+        bg = fgb.BulgeGraph.from_dotbracket(db)
+        elements = ["s0", "m0", "s1", "t0"]
+        dists = bg.ss_distance_matrix(elements)
+        for (i1, e1), (i2, e2) in it.product(enumerate(elements), repeat=2):
+            self.assertEqual(dists[i1, i2], bg.ss_distance(e1, e2))
+        self.assertEqual(dists[1, 3], 3)
+        self.assertEqual(bg.ss_distance_matrix().shape,
+                         (len(bg.defines), len(bg.defines)))
+
+    def test_ss_distance_cached_graph_reset(self):
+        bg = fgb.BulgeGraph.from_dotbracket('(((...)))..')
+        # 2 is not at a corner of s0
+        self.assertEqual(bg.ss_distance(2, 11), 4)
+        self.assertIsNotNone(bg._sparse_graph)
+        bg.defines["t0"] = [10, 10]
+        self.assertIsNone(bg._sparse_graph)
+
+    def test_to_sparse_graph(self):
+        bg = fgb.BulgeGraph.from_dotbracket('((.((..&.))..))')
+        graph = bg.to_sparse_graph()
+        self.assertEqual(graph.shape, (14, 14))
+        self.assertEqual((graph != graph.T).nnz, 0)
+        nx_graph = bg.to_networkx()
+        self.assertEqual(set((i + 1, j + 1) for i, j in zip(*graph.nonzero())),
+                         set(nx_graph.edges()) | set((j, i) for i, j in nx_graph.edges()))
+        # 0-length hairpins: The base pair is also a backbone link.
+        bg = fgb.BulgeGraph.from_dotbracket('(())')
+        self.assertEqual(bg.to_sparse_graph().toarray().tolist(),
+                         [[0, 1, 0, 1], [1, 0, 1, 0], [0, 1, 0, 1], [1, 0, 1, 0]])
+        # The returned matrix is a copy
+        graph = bg.to_sparse_graph()
+        graph[0, 2] = 1
+        self.assertEqual(bg.to_sparse_graph()[0, 2], 0)
+
+    def test_topology_queries_memoized(self):
+        bg = fgb.BulgeGraph.from_dotbracket('((..((..))..((..))))')
+        self.assertEqual(bg.define_a("m0"), [2, 5])
+        self.assertEqual(bg.connections("m1"), ["s1", "s2"])
+        # The returned lists are copies.
+        bg.define_a("m0")[0] = 100
+        bg.connections("m1").pop()
+        self.assertEqual(bg.define_a("m0"), [2, 5])
+        self.assertEqual(bg.connections("m1"), ["s1", "s2"])
+        self.assertEqual(bg.define_a("m2"), [18, 19])
+        self.assertEqual(bg.get_sides("s2", "m2"), (0, 1))
+        # Changing the defines invalidates the memo.
+        version = bg._structure_version
+        bg.defines["m0"] = [3, 3]
+        self.assertGreater(bg._structure_version, version)
+        self.assertEqual(bg.define_a("m0"), [2, 4])
+
     def test_get_position_in_element(self):
         db = '(((((...))....)))'
         #     12345678901234567
@@ -1800,6 +2000,33 @@ def test_cg_min_max_bp_distance(self):
         self.assertEqual(mi, 18)
         self.assertEqual(mx, 24)
 
+    def test_min_max_bp_distance_same_as_nucleotide_graph(self):
+        import networkx as nx
+        for db in ['..((..[[..))..]]..((.))', '(((..((.&.))..)))', '(()).(...)']:
+            bg = fgb.BulgeGraph.from_dotbracket(db)
+            nuc_dists = dict(nx.all_pairs_shortest_path_length(bg.to_networkx()))
+            for e1, e2 in it.product(bg.defines, repeat=2):
+                dists = [nuc_dists[f1][f2] for f1, f2 in
+                         it.product(bg.defines[e1], bg.defines[e2])]
+                if not dists:  # Zero-length elements
+                    dists = [sys.maxsize, 0]
+                self.assertEqual(bg.min_max_bp_distance(e1, e2),
+                                 (min(dists), max(dists)))
+
+    def test_min_max_bp_distance_matrix(self):
+        db = '..(((..(((..(((..((((((...)))..)))..)))(((...))).(((...(((((((((...))).(((...)))...))).))).)))....))))))..'
+        bg = fgb.BulgeGraph.from_dotbracket(db)
+        elements = ["s1", "s10", "s4", "s7", "m0"]
+        mins, maxs = bg.min_max_bp_distance_matrix(elements)
+        self.assertEqual(mins.shape, (5, 5))
+        for (i1, e1), (i2, e2) in it.product(enumerate(elements), repeat=2):
+            self.assertEqual((mins[i1, i2], maxs[i1, i2]),
+                             bg.min_max_bp_distance(e1, e2))
+        self.assertEqual(mins[0, 1], 19)
+        self.assertEqual(maxs[2, 3], 24)
+        mins, maxs = bg.min_max_bp_distance_matrix()
+        self.assertEqual(mins.shape, (len(bg.defines), len(bg.defines)))
+
     def test_global_pos_to_stem_pos(self):
         db = '...((((((((...))))))))...'
         bg = fgb.BulgeGraph.from_dotbracket(db)
@@ -2143,6 +2370,34 @@ def test_describe_multiloop_pseudoknot_no_angle_type_5(self):
             self.assertNotEqual(
                 abs(bg.get_angle_type(m, allow_broken=True)), 5)
 
+    def test_zero_length_segments_between_the_same_stems(self):
+        # s0 and s1 are connected by m0 at (1, 2) and m1 at (2, 3)
+        bg = fgb.BulgeGraph.from_dotbracket("([).({].)}")
+        self.assertEqual(bg.define_a("m0"), [1, 2])
+        self.assertEqual(bg.define_a("m1"), [2, 3])
+        self.assertEqual(bg.get_next_ml_segment("m1"), "m0")
+        self.assertEqual(bg.get_next_ml_segment("m0"), "m5")
+        self.assertEqual(bg.find_mlonly_multiloops(),
+                         [("m0", "m5", "m3", "m2", "m6", "m4", "m1")])
+
+    def test_junction_index_reset(self):
+        bg = fgb.BulgeGraph.from_dotbracket("((..((..))..((..))..))..((..))")
+        mls = bg.find_mlonly_multiloops()
+        self.assertEqual(mls, [("m0", "m1", "m2"), ("m3",)])
+        self.assertEqual(bg.shortest_mlonly_multiloop("m1"), ("m0", "m1", "m2"))
+        self.assertEqual(bg.get_next_ml_segment("m1"), "m2")
+        # The returned values are copies
+        mls.pop()
+        bg.describe_multiloop(["m0", "m1", "m2"]).add("pseudoknot")
+        self.assertEqual(len(bg.find_mlonly_multiloops()), 2)
+        self.assertEqual(bg.describe_multiloop(["m0", "m1", "m2"]),
+                         set(["regular_multiloop"]))
+        # The multiloop becomes an interior loop
+        bg.remove_basepair(13, 18)
+        bg.remove_basepair(14, 17)
+        self.assertEqual(bg.find_mlonly_multiloops(), [("m3",)])
+        self.assertIsNone(bg.shortest_mlonly_multiloop("m0"))
+
 
 class WalkBackboneTests(unittest.TestCase):
     def setUp(self):
@@ -4,6 +4,7 @@
 import forgi.graph.bulge_graph as fgb
 import forgi.graph._cofold as fgc
 from forgi.graph._graph_construction import remove_vertex
+from forgi.utilities.exceptions import GraphConstructionError
 log = logging.getLogger(__name__)
 
 
@@ -49,3 +50,44 @@ def test_split_inside_stem(self):
         self.assertEqual(bg.defines["s1"], [3, 3, 9, 9])
         self.assertEqual(bg.defines["s2"], [4, 4, 8, 8])
         self.assertEqual(bg.defines["m0"], [])
+
+    def test_strands_connected(self):
+        bg = fgb.BulgeGraph.from_dotbracket("((..((...))..))")
+        self.assertTrue(fgc._strands_connected(bg, []))
+        self.assertTrue(fgc._strands_connected(bg, [3, 8]))
+        # The second strand contains only unpaired nucleotides
+        self.assertFalse(fgc._strands_connected(bg, [2, 4]))
+        bg = fgb.BulgeGraph.from_dotbracket("(...)(...)")
+        self.assertFalse(fgc._strands_connected(bg, [5]))
+
+    def test_element_index_names(self):
+        bg = fgb.BulgeGraph.from_dotbracket("((..))..((..))..((..))")
+        index = fgc._ElementIndex(bg)
+        index.remove_node("m0")
+        self.assertEqual(index.new_name("m"), "m0")
+        self.assertEqual(index.new_name("m"), "m2")
+        self.assertEqual(index.new_name("t"), "t0")
+        self.assertEqual(index.new_name("f"), "f0")
+        self.assertEqual(index.new_name("x"), "x0")
+        self.assertEqual(index.element_at(15), "m1")
+        with self.assertRaises(LookupError):
+            index.element_at(7)
+        self.assertEqual(index.element_at(2), "s0")
+
+
+class CofoldSplittingTest(unittest.TestCase):
+    def test_many_strands(self):
+        db = "((((&..))..((&.))..((&..)))&...((&(..)))).."
+        bg = fgb.BulgeGraph.from_dotbracket(db)
+        self.assertEqual(bg.seq.backbone_breaks_after, [4, 12, 19, 24, 29])
+        self.assertTrue(fgc._is_connected(bg))
+        for splitpoint in bg.seq.backbone_breaks_after:
+            self.assertNotEqual(bg.get_elem(splitpoint),
+                                bg.get_elem(splitpoint + 1))
+        self.assertEqual(bg.to_dotbracket_string(), db)
+
+    def test_disconnected_strands(self):
+        with self.assertRaises(GraphConstructionError):
+            fgb.BulgeGraph.from_dotbracket("((..))&....")
+        with self.assertRaises(GraphConstructionError):
+            fgb.BulgeGraph.from_dotbracket("((..((&..))..))&((..))")
@@ -54,3 +54,59 @@ def test_get_sides_plus(self):
 
         p1 = c._get_sides_plus('s1', 'm0')
         self.assertEquals(p1[0], 0)
+
+
+class ConstructionSpecialCases(unittest.TestCase):
+    def test_construction_unpaired(self):
+        tuples = fus.pairtable_to_tuples(fus.dotbracket_to_pairtable("...."))
+        c = _BulgeGraphConstruction(tuples)
+        self.assertEqual(c.defines, {"f0": [1, 4]})
+        self.assertEqual(c.edges, {"f0": set()})
+
+    def test_construction_zero_length_hairpin(self):
+        # The zero-length hairpin of s0 is numbered, but not part of the graph
+        db = "(()).(...)"
+        tuples = fus.pairtable_to_tuples(fus.dotbracket_to_pairtable(db))
+        c = _BulgeGraphConstruction(tuples)
+        self.assertEqual(c.defines, {"s0": [1, 2, 3, 4], "s1": [6, 6, 10, 10],
+                                     "m0": [5, 5], "h1": [7, 9]})
+        self.assertEqual(c.edges, {"s0": {"m0"}, "s1": {"m0", "h1"},
+                                   "m0": {"s0", "s1"}, "h1": {"s1"}})
+
+    def test_construction_one_sided_interior_loop(self):
+        db = "((..((...))))"
+        tuples = fus.pairtable_to_tuples(fus.dotbracket_to_pairtable(db))
+        c = _BulgeGraphConstruction(tuples)
+        self.assertEqual(c.defines, {"s0": [1, 2, 12, 13], "i0": [3, 4],
+                                     "s1": [5, 6, 10, 11], "h0": [7, 9]})
+        self.assertEqual(c.edges["i0"], {"s0", "s1"})
+
+    def test_construction_pseudoknot(self):
+        db = "(([[..))..]]"
+        tuples = fus.pairtable_to_tuples(fus.dotbracket_to_pairtable(db))
+        c = _BulgeGraphConstruction(tuples)
+        self.assertEqual(c.defines, {"s0": [1, 2, 7, 8], "s1": [3, 4, 11, 12],
+                                     "m0": [], "m1": [5, 6], "m2": [9, 10]})
+        self.assertEqual(c.edges, {"s0": {"m0", "m1", "m2"},
+                                   "s1": {"m0", "m1", "m2"},
+                                   "m0": {"s0", "s1"}, "m1": {"s0", "s1"},
+                                   "m2": {"s0", "s1"}})
+
+    def test_construction_large_multiloop(self):
+        db = "((" + "((.((...)).))" * 5000 + "))"
+        tuples = fus.pairtable_to_tuples(fus.dotbracket_to_pairtable(db))
+        c = _BulgeGraphConstruction(tuples)
+        self.assertEqual(len([d for d in c.defines if d[0] == "s"]), 10001)
+        self.assertEqual(len([d for d in c.defines if d[0] == "i"]), 5000)
+        self.assertEqual(len([d for d in c.defines if d[0] == "m"]), 5001)
+        self.assertEqual(c.defines["s0"], [1, 2, 65003, 65004])
+        self.assertEqual(c.edges["s0"], {"m0", "m5000"})
+
+    def test_construction_deeply_nested(self):
+        db = "((." * 3000 + "..." + ".))" * 3000
+        tuples = fus.pairtable_to_tuples(fus.dotbracket_to_pairtable(db))
+        c = _BulgeGraphConstruction(tuples)
+        self.assertEqual(len([d for d in c.defines if d[0] == "s"]), 3000)
+        self.assertEqual(len([d for d in c.defines if d[0] == "i"]), 2999)
+        self.assertEqual(c.defines["i0"], [3, 3, 18001, 18001])
+        self.assertEqual(c.defines["h0"], [9000, 9004])
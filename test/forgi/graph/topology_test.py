@@ -0,0 +1,69 @@
+from __future__ import absolute_import
+from __future__ import print_function
+
+import unittest
+import pickle
+
+import numpy as np
+
+import forgi.graph.bulge_graph as fgb
+from forgi.graph.topology import GraphTopology
+
+
+class GraphTopologyTest(unittest.TestCase):
+    def setUp(self):
+        self.bg = fgb.BulgeGraph.from_dotbracket(
+            "((..((..))..((..))..))..((..))", "GGAAGGAACCAAGGAACCAACCAAGGAACC")
+
+    def test_from_bg_defines_and_edges(self):
+        top = GraphTopology.from_bg(self.bg)
+        self.assertEqual(set(top.names), set(self.bg.defines))
+        for elem in self.bg.defines:
+            self.assertEqual(top.define(elem), self.bg.defines[elem])
+            self.assertEqual(top.neighbors(elem), self.bg.edges[elem])
+        self.assertEqual(top.stem_names(),
+                         sorted(s for s in self.bg.defines if s[0] == "s"))
+
+    def test_zero_length_elements(self):
+        bg = fgb.BulgeGraph.from_dotbracket("((()))(())")
+        top = GraphTopology.from_bg(bg)
+        self.assertEqual(top.define("m0"), [])
+        self.assertEqual(top.neighbors("m0"), bg.edges["m0"])
+
+    def test_to_bg_roundtrip(self):
+        bg2 = GraphTopology.from_bg(self.bg).to_bg()
+        self.assertEqual(bg2.to_dotbracket_string(), self.bg.to_dotbracket_string())
+        self.assertEqual(bg2.seq, self.bg.seq)
+        self.assertEqual(dict(bg2.defines), dict(self.bg.defines))
+        self.assertEqual(dict(bg2.edges), dict(self.bg.edges))
+
+    def test_to_bg_keeps_name_and_infos(self):
+        self.bg.name = "test_rna"
+        self.bg.add_info("totalEnergy", "-12.3")
+        top = GraphTopology.from_bg(self.bg)
+        self.assertEqual(top.infos, (("totalEnergy", ("-12.3",)),))
+        bg2 = top.to_bg()
+        self.assertEqual(bg2.name, "test_rna")
+        self.assertEqual(dict(bg2.infos), {"totalEnergy": ["-12.3"]})
+        bg2.add_info("totalEnergy", "1.0")
+        self.assertEqual(top.to_bg().infos["totalEnergy"], ["-12.3"])
+
+    def test_immutable(self):
+        top = GraphTopology.from_bg(self.bg)
+        with self.assertRaises(AttributeError):
+            top.name = "foo"
+        with self.assertRaises(ValueError):
+            top.elements[0]["define"][0] = 3
+        with self.assertRaises(ValueError):
+            top.indices[0] = 3
+
+    def test_eq_and_pickle(self):
+        top = GraphTopology.from_bg(self.bg)
+        self.assertEqual(top, GraphTopology.from_bg(self.bg))
+        self.assertEqual(pickle.loads(pickle.dumps(top)), top)
+        other = fgb.BulgeGraph.from_dotbracket("((..))")
+        self.assertNotEqual(top, GraphTopology.from_bg(other))
+        self.bg.add_info("key", "value")
+        with_infos = GraphTopology.from_bg(self.bg)
+        self.assertNotEqual(top, with_infos)
+        self.assertEqual(pickle.loads(pickle.dumps(with_infos)), with_infos)
@@ -92,6 +92,23 @@ def test_to_file(self):
         self.assertFalse(os.path.isfile(os.path.join(out_dir, "hallo005.fa")))
         shutil.rmtree(out_dir)
 
+    def test_to_binary_and_back(self):
+        out_dir = tempfile.mkdtemp()
+        sp.check_call([sys.executable, "examples/rnaConvert.py",
+                       "-T", "forgi_binary", "test/forgi/threedee/data/1GID_A.cg",
+                       "--filename", out_dir],
+                      universal_newlines=True, env=subprocess_env)
+        binary_file = os.path.join(out_dir, "1GID_A.cgb")
+        self.assertTrue(os.path.isfile(binary_file))
+        cg_out = sp.check_output([sys.executable, "examples/rnaConvert.py",
+                                  "-T", "forgi", binary_file],
+                                 universal_newlines=True, env=subprocess_env)
+        cg = ftmc.CoarseGrainRNA.from_bg_string(cg_out)
+        cg2 = ftmc.CoarseGrainRNA.from_bg_file("test/forgi/threedee/data/1GID_A.cg")
+        self.assertEqual(cg.coords, cg2.coords)
+        self.assertEqual(cg.defines, cg2.defines)
+        shutil.rmtree(out_dir)
+
     def test_to_neato(self):
         neato = sp.check_output([sys.executable, "examples/rnaConvert.py",
                                  "-T", "neato", "test/forgi/data/2hoj.fa", ],
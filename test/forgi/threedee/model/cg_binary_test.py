@@ -0,0 +1,71 @@
+from __future__ import absolute_import
+from __future__ import print_function
+
+import os.path
+import unittest
+
+import numpy as np
+import numpy.testing as nptest
+
+import forgi.threedee.model.coarse_grain as ftmc
+import forgi.threedee.model.cg_binary as ftmcb
+import forgi.graph.residue as fgr
+from forgi.utilities.exceptions import CgConstructionError
+from forgi.utilities.stuff import make_temp_directory
+
+
+def _lines_without_longrange(cg):
+    # longrange lines are written in the iteration order of sets.
+    return [line for line in cg.to_cg_string().splitlines()
+            if not line.startswith("longrange")]
+
+
+class CgBinaryTest(unittest.TestCase):
+    def roundtrip(self, cg, mmap_mode="r"):
+        with make_temp_directory() as d:
+            filename = os.path.join(d, "test.cgb")
+            cg.to_binary_file(filename)
+            self.assertTrue(ftmcb.is_cg_binary(filename))
+            return ftmc.CoarseGrainRNA.from_binary_file(filename, mmap_mode)
+
+    def assert_same_cg(self, cg, cg2):
+        self.assertEqual(_lines_without_longrange(cg), _lines_without_longrange(cg2))
+        self.assertEqual({k: v for k, v in cg.longrange.items() if v},
+                         {k: v for k, v in cg2.longrange.items() if v})
+        self.assertEqual(cg.coords, cg2.coords)
+        self.assertEqual(cg.twists, cg2.twists)
+
+    def test_roundtrip(self):
+        for filename in ["1GID_A.cg", "1GID_A_sampled.cg", "1HMH_A.cg", "1S72_0.cg"]:
+            cg = ftmc.CoarseGrainRNA.from_bg_file(
+                os.path.join("test/forgi/threedee/data", filename))
+            self.assert_same_cg(cg, self.roundtrip(cg))
+            self.assert_same_cg(cg, self.roundtrip(cg, mmap_mode=None))
+
+    def test_roundtrip_optional_fields(self):
+        cg = ftmc.CoarseGrainRNA.from_bg_file("test/forgi/threedee/data/1GID_A.cg")
+        cg.infos["some"].append("info text")
+        cg.project_from = np.array([1., 2., 3.])
+        cg.interacting_residues.append(fgr.RESID("A", (" ", 110, " ")))
+        cg.vposs["h0"] = {0: np.array([1., 2., 3.]), 1: np.array([4., 5., 6.])}
+        cg2 = self.roundtrip(cg)
+        self.assert_same_cg(cg, cg2)
+        self.assertEqual(cg2.infos["some"], ["info text"])
+        nptest.assert_array_equal(cg2.project_from, [1, 2, 3])
+        nptest.assert_array_equal(cg2.vposs["h0"][1], [4, 5, 6])
+
+    def test_read_sections_memmap(self):
+        cg = ftmc.CoarseGrainRNA.from_bg_file("test/forgi/threedee/data/1GID_A.cg")
+        with make_temp_directory() as d:
+            filename = os.path.join(d, "test.cgb")
+            cg.to_binary_file(filename)
+            sections = ftmcb.read_sections(filename)
+            self.assertIsInstance(sections["coords"].base, np.memmap)
+            self.assertEqual(sections["coords"].shape, (len(cg.defines), 2, 3))
+            del sections
+
+    def test_text_file_is_not_binary(self):
+        filename = "test/forgi/threedee/data/1GID_A.cg"
+        self.assertFalse(ftmcb.is_cg_binary(filename))
+        with self.assertRaises(CgConstructionError):
+            ftmc.CoarseGrainRNA.from_binary_file(filename)
@@ -447,6 +447,96 @@ def test_to_and_from_cgstring_vres(self):
         self.assertLess(ftuv.vec_distance(
             cg.vposs["i0"][2], cg2.vposs["i0"][2]), 10**-8)
 
+    def test_clone_shares_topology(self):
+        cg = ftmc.CoarseGrainRNA.from_bg_file(
+            'test/forgi/threedee/data/1y26.cg')
+        cg.add_all_virtual_residues()
+        clone = cg.clone()
+        self.assertEqual(clone.defines, cg.defines)
+        self.assertIsNot(clone.defines, cg.defines)
+        self.assertEqual(clone.edges, cg.edges)
+        self.assertIs(clone.seq, cg.seq)
+        self.assertIs(clone._topology_memo(), cg._topology_memo())
+        self.assertEqual(clone.coords, cg.coords)
+        self.assertEqual(clone.twists, cg.twists)
+        self.assertIs(clone.vposs["s0"], cg.vposs["s0"])
+        self.assertEqual(clone.to_cg_string(), cg.to_cg_string())
+        self.assertIsNot(copy.deepcopy(cg).defines, cg.defines)
+        self.assertIsNot(cg.clone(share_topology=False).defines, cg.defines)
+
+    def test_clone_structure_change(self):
+        cg = ftmc.CoarseGrainRNA.from_bg_file(
+            'test/forgi/threedee/data/1y26.cg')
+        loops = cg.find_mlonly_multiloops()
+        clone = cg.clone()
+        memo = cg._topology_memo()
+        # Changes of the clone's defines only reset the clone's caches
+        clone.defines["s0"] = list(clone.defines["s0"])
+        clone.edges["s0"].add("x0")
+        self.assertIs(cg._topology_memo(), memo)
+        self.assertIsNot(clone._topology_memo(), memo)
+        self.assertNotIn("x0", cg.edges["s0"])
+        self.assertEqual(cg.find_mlonly_multiloops(), loops)
+        # and vice versa
+        clone = cg.clone()
+        cg.defines["s0"] = list(cg.defines["s0"])
+        self.assertIs(clone._topology_memo(), memo)
+
+    def test_clone_copies_coordinates(self):
+        cg = ftmc.CoarseGrainRNA.from_bg_file(
+            'test/forgi/threedee/data/1y26.cg')
+        cg.add_all_virtual_residues()
+        original_coords = cg.coords["s0"]
+        original_vpos = cg.vposs["s0"][0]
+        original_vatom = cg.virtual_atoms(1)["C1'"]
+        clone = cg.clone()
+        clone.coords["s0"] = (original_coords[0] + 5, original_coords[1] + 5)
+        clone.add_all_virtual_residues()
+        nptest.assert_array_equal(cg.coords["s0"], original_coords)
+        nptest.assert_array_equal(cg.vposs["s0"][0], original_vpos)
+        nptest.assert_array_equal(cg.virtual_atoms(1)["C1'"], original_vatom)
+        self.assertFalse(np.allclose(clone.virtual_atoms(1)["C1'"], original_vatom))
+        clone.rotate(90, unit="degrees")
+        nptest.assert_array_equal(cg.coords["s0"], original_coords)
+        clone.longrange["s0"].add("h1")
+        self.assertNotIn("h1", cg.longrange["s0"])
+
+    def test_clone_rotate_chains(self):
+        cg, = ftmc.CoarseGrainRNA.from_pdb('test/forgi/threedee/data/1y26.pdb')
+        clone = cg.clone()
+        chain_id = list(cg.chains)[0]
+        atom = next(cg.chains[chain_id].get_atoms())
+        original = atom.coord.copy()
+        clone.rotate(90, unit="degrees")
+        nptest.assert_array_equal(atom.coord, original)
+        clone_atom = next(clone.chains[chain_id].get_atoms())
+        self.assertFalse(np.allclose(clone_atom.coord, original))
+
+    def test_remove_basepair_keeps_unchanged_coordinates(self):
+        cg = ftmc.CoarseGrainRNA.from_bg_file(
+            'test/forgi/threedee/data/1y26.cg')
+        cg.add_all_virtual_residues()
+        coords = cg.coords["s3"]
+        vpos = cg.vposs["s3"][0]
+        changed = cg.remove_basepair(10, 40)
+        # The stem s1 is dissolved and the interior loop i0 becomes
+        # part of the multiloop segments m0 and m2
+        self.assertEqual(changed, set(["s1", "i0", "m0", "m2"]))
+        self.assertNotIn("s1", cg.coords)
+        self.assertEqual(cg.defines["s3"], [42, 47, 55, 60])
+        nptest.assert_array_equal(cg.coords["s3"], coords)
+        nptest.assert_array_equal(cg.vposs["s3"][0], vpos)
+        self.assertEqual(cg.longrange["s3"], set(["s2"]))
+        self.assertEqual(set(cg.sampled), set(["s0", "s2", "s3"]))
+        self.assertFalse(cg.coords.is_filled)
+        for elem in cg.defines:
+            self.assertEqual(np.isnan(cg.coords[elem]).any(), elem in ["m0", "m2"])
+        cg.add_basepair(10, 40)
+        self.assertEqual(cg.defines["s1"], [10, 10, 40, 40])
+        nptest.assert_array_equal(cg.coords["s3"], coords)
+        self.assertTrue(np.isnan(cg.coords["i0"]).all())
+        self.assertTrue(np.isnan(cg.twists["s1"]).all())
+
     def test_get_bulge_angle_stats_core(self):
         cg = ftmc.CoarseGrainRNA.from_bg_file(
             'test/forgi/threedee/data/1y26.cg')
@@ -779,6 +869,33 @@ def test_virtuel_atom_caching_is_reset(self):
         self.assertTrue(np.any(np.not_equal(va_old, va_new)),
                         msg="A stale virtual atom position was used.")
 
+    def stem_only_cg(self):
+        cg = ftmc.CoarseGrainRNA.from_dotbracket('((((&))))', seq='GCAU&AUGC')
+        cg.coords["s0"] = np.array([0., 0., 0.]), np.array([0., 0., 10.])
+        cg.twists["s0"] = np.array([1., 0., 0.]), np.array([0., 1., 0.])
+        return cg
+
+    def test_virtual_atom_array_same_as_virtual_atoms(self):
+        cg = self.stem_only_cg()
+        for sidechain in [True, False]:
+            coords, residues, atoms = cg.virtual_atom_array(sidechain)
+            self.assertEqual(len(coords), len(residues))
+            self.assertEqual(len(coords), len(atoms))
+            for pos in range(1, cg.seq_length + 1):
+                va = ftug.virtual_atoms(cg, sidechain=sidechain)[pos]
+                names = [ftug.virtual_atom_names[a] for a in atoms[residues == pos]]
+                self.assertEqual(names, list(va.keys()))
+                nptest.assert_allclose(coords[residues == pos],
+                                       list(va.values()), atol=1e-9)
+
+    def test_virtual_atom_array_caching_is_reset(self):
+        cg = self.stem_only_cg()
+        coords, _, _ = cg.virtual_atom_array()
+        self.assertIs(cg.virtual_atom_array()[0], coords)
+        cg.coords["s0"] = np.array([0., 0., 1.]), np.array([0., 0., 11.])
+        new_coords, _, _ = cg.virtual_atom_array()
+        nptest.assert_allclose(new_coords, coords + [0, 0, 1], atol=1e-9)
+
 
 class RotationTranslationTest(unittest.TestCase):
     def setUp(self):
@@ -0,0 +1,73 @@
+from __future__ import absolute_import
+from __future__ import print_function
+
+import unittest
+import pickle
+
+import numpy as np
+import numpy.testing as nptest
+
+import forgi.threedee.model.coarse_grain as ftmc
+from forgi.graph.topology import GraphTopology
+from forgi.threedee.model.compact import CompactCoarseGrainRNA
+
+
+class CompactCoarseGrainRNATest(unittest.TestCase):
+    def setUp(self):
+        self.cg = ftmc.CoarseGrainRNA.from_bg_file("test/forgi/threedee/data/1GID_A.cg")
+
+    def test_roundtrip(self):
+        compact = CompactCoarseGrainRNA.from_cg(self.cg)
+        cg2 = compact.to_cg()
+        self.assertEqual(cg2.coords, self.cg.coords)
+        self.assertEqual(cg2.twists, self.cg.twists)
+        self.assertEqual(dict(cg2.defines), dict(self.cg.defines))
+        self.assertEqual(cg2.seq, self.cg.seq)
+        nptest.assert_almost_equal(cg2.coords["s0"], self.cg.coords["s0"])
+
+    def test_roundtrip_infos_and_sampled(self):
+        self.cg.add_info("totalEnergy", "-12.3")
+        compact = CompactCoarseGrainRNA.from_cg(self.cg)
+        cg2 = compact.to_cg()
+        self.assertEqual(dict(cg2.infos), {"totalEnergy": ["-12.3"]})
+        self.assertEqual(cg2.sampled, self.cg.sampled)
+        self.assertEqual(cg2.sampled["s0"], ["untitled", 1, 1, 115, 115])
+
+    def test_shared_topology_per_structure_infos(self):
+        top = GraphTopology.from_bg(self.cg)
+        self.cg.add_info("totalEnergy", "1.0")
+        compact = CompactCoarseGrainRNA.from_cg(self.cg, top)
+        self.assertEqual(dict(compact.to_cg().infos), {"totalEnergy": ["1.0"]})
+        # Without infos of its own, the infos of the topology are used.
+        self.cg.infos.clear()
+        self.cg.add_info("template", "yes")
+        top = GraphTopology.from_bg(self.cg)
+        compact = CompactCoarseGrainRNA(top, compact.coords, compact.twists)
+        self.assertEqual(dict(compact.to_cg().infos), {"template": ["yes"]})
+
+    def test_shared_topology(self):
+        top = GraphTopology.from_bg(self.cg)
+        c1 = CompactCoarseGrainRNA.from_cg(self.cg, top)
+        self.cg.coords.rotate(np.array([[0, 1, 0], [-1, 0, 0], [0, 0, 1]]))
+        c2 = CompactCoarseGrainRNA.from_cg(self.cg, top)
+        self.assertIs(c1.topology, c2.topology)
+        self.assertFalse(np.allclose(c1.coords, c2.coords))
+        self.assertEqual(c2.to_cg().coords, self.cg.coords)
+
+    def test_wrong_topology(self):
+        other = ftmc.CoarseGrainRNA.from_bg_file("test/forgi/threedee/data/1y26.cg")
+        with self.assertRaises(ValueError):
+            CompactCoarseGrainRNA.from_cg(self.cg, GraphTopology.from_bg(other))
+
+    def test_no_instance_dict(self):
+        compact = CompactCoarseGrainRNA.from_cg(self.cg)
+        with self.assertRaises(AttributeError):
+            compact.foo = 1
+
+    def test_pickle(self):
+        compact = CompactCoarseGrainRNA.from_cg(self.cg)
+        compact2 = pickle.loads(pickle.dumps(compact))
+        nptest.assert_array_equal(compact2.coords, compact.coords)
+        self.assertEqual(compact2.topology, compact.topology)
+        self.assertEqual(compact2.sampled, compact.sampled)
+        self.assertEqual(compact2.infos, compact.infos)
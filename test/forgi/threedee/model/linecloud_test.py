@@ -10,7 +10,9 @@
 import unittest
 from math import sin, cos
 import copy
+import pickle
 import forgi.threedee.model.coarse_grain as ftmc
+import forgi.threedee.utilities.vector as ftuv
 import itertools as it
 import logging
 log = logging.getLogger(__name__)
@@ -115,6 +117,19 @@ def test_get_element_raises_key_error(self):
         with self.assertRaises(KeyError):
             self.cs2[None]
 
+    def test_replace_keys(self):
+        old = self.cs2[["s3", "i0", "s1"]]
+        self.cs2.replace_keys(["m2", "h0", "m0"], ["m3"])
+        self.assertEqual(set(self.cs2), set(
+            ['h1', 's3', 'i0', 's0', 'm1', 's2', 's1', 'm3']))
+        self.assertEqual(self.cs2.get_array().shape, (16, 3))
+        nptest.assert_array_equal(self.cs2[["s3", "i0", "s1"]], old)
+        self.assertTrue(np.isnan(self.cs2["m3"]).all())
+        self.cs2.replace_keys([], ["m4", "m5"])
+        self.assertEqual(self.cs2.get_array().shape, (20, 3))
+        self.assertTrue(np.isnan(self.cs2[["m4", "m5"]]).all())
+        nptest.assert_array_equal(self.cs2[["s3", "i0", "s1"]], old)
+
 
 class CoordinateStorageEqualityTests(unittest.TestCase):
     def test_eq_with_nans(self):
@@ -194,6 +209,17 @@ def test_eq_for_cgs(self):
 
 
 class LineSegmentStorageTests(unittest.TestCase):
+    def test_pickle(self):
+        cg = ftmc.CoarseGrainRNA.from_bg_file(
+            "test/forgi/threedee/data/1GID_A.cg")
+        cg.coords.center()
+        coords = pickle.loads(pickle.dumps(cg.coords))
+        self.assertEqual(coords, cg.coords)
+        self.assertTrue(coords.is_centered)
+        coords["s0"] = [0, 0, 0.], [0, 0, 1.]
+        self.assertFalse(coords.is_centered)
+        self.assertTrue(cg.coords.is_centered)
+
     def test_elements_closer_than_on_same_line(self):
         cs = LineSegmentStorage(["s0", "s1"])
         cs["s0"] = [0, 0, 0.], [0, 0, 1.]
@@ -300,6 +326,38 @@ def test_elements_closer_than_like_old_confusion_matrix(self):
         self.assertEqual(old, new,
                          msg="ONLY old: {}\n, ONLY new {},\n {} both".format(old - new, new - old, len(old & new)))
 
+    def test_elements_closer_than_many_elements(self):
+        names = ["s{}".format(i) for i in range(200)]
+        cs = LineSegmentStorage(names)
+        rng = np.random.RandomState(1)
+        starts = rng.uniform(-50, 50, (200, 3))
+        ends = starts + rng.normal(0, 10, (200, 3))
+        cs.set_array(names, np.stack([starts, ends], axis=1).reshape(-1, 3))
+        for cutoff in [5., 25.]:
+            expected = []
+            for i, j in it.combinations(range(200), 2):
+                p1, p2 = ftuv.line_segment_distance(
+                    starts[i], ends[i], starts[j], ends[j])
+                if ftuv.vec_distance(p1, p2) < cutoff:
+                    expected.append(tuple(sorted((names[i], names[j]))))
+            hits = cs.elements_closer_than(cutoff)
+            self.assertEqual(sorted(hits), sorted(expected))
+            self.assertLess(len(hits), 200 * 199 / 2)
+
+    def test_elements_closer_than_nan(self):
+        cs = LineSegmentStorage(["s0", "s1", "s2"])
+        cs["s0"] = [0, 0, 0.], [0, 0, 1.]
+        cs["s1"] = [0, 1, 0.], [0, 1, 1.]
+        self.assertEqual(cs.elements_closer_than(2), [("s0", "s1")])
+        self.assertEqual(LineSegmentStorage(["s0"]).elements_closer_than(2), [])
+
+    def test_elements_closer_than_zero_length(self):
+        cs = LineSegmentStorage(["h0", "s0"])
+        cs["s0"] = [0, 0, 0.], [0, 0, 10.]
+        cs["h0"] = [3, 0, 5.], [3, 0, 5.]
+        self.assertEqual(cs.elements_closer_than(4), [("h0", "s0")])
+        self.assertEqual(cs.elements_closer_than(2), [])
+
     def test_rmsd_to_self(self):
         cs1 = LineSegmentStorage(["s0", "s1", "s2"])
         for r in range(RANDOM_REPETITIONS):
@@ -177,6 +177,33 @@ def test_basepair_distance(self):
         self.assertEqual(ftme.basepair_distance(self.cg1, self.cg3), 8)
         self.assertEqual(ftme.basepair_distance(self.cg1, self.cg4), 1)
 
+    def test_basepair_distance_matrix(self):
+        cgs = [self.cg1, self.cg2, self.cg3, self.cg4]
+        expected = np.array([[ftme.basepair_distance(cg1, cg2) for cg2 in cgs]
+                             for cg1 in cgs])
+        np.testing.assert_array_equal(ftme.basepair_distance_matrix(cgs), expected)
+        dotbrackets = [cg.to_dotbracket_string() for cg in cgs]
+        np.testing.assert_array_equal(ftme.basepair_distance_matrix(dotbrackets), expected)
+        np.testing.assert_array_equal(
+            ftme.basepair_distance_matrix(dotbrackets, chunk_size=3, jobs=2), expected)
+        pts = ftme.pair_table_array(dotbrackets)
+        self.assertEqual(pts.shape, (4, 15))
+        np.testing.assert_array_equal(
+            ftme.basepair_distance_matrix(pts, chunk_size=1), expected)
+
+    def test_basepair_indicators(self):
+        pts = ftme.pair_table_array(["((..))..", "(....)..", "........"])
+        indicators, num_pairs = ftme._basepair_indicators(pts)
+        np.testing.assert_array_equal(num_pairs, [2, 1, 0])
+        np.testing.assert_array_equal(indicators.toarray(), [[1, 1], [1, 0], [0, 0]])
+
+    def test_basepair_distance_matrix_incompareable(self):
+        with self.assertRaises(ftme.Incompareable):
+            ftme.basepair_distance_matrix(["((..))", "((...))"])
+        cg = ftmc.CoarseGrainRNA.from_dotbracket("(((...(.)..)))", seq="A" * 14)
+        with self.assertRaises(ftme.Incompareable):
+            ftme.basepair_distance_matrix([self.cg1, cg])
+
 ##############################################################################
 # The old confusion_matrix code by pkerpedjiev. Used as reference in tests
 ##############################################################################
@@ -1,8 +1,15 @@
 import unittest
 import pkgutil
 import json
+import os
 
+import numpy as np
+import numpy.testing as nptest
+
+import forgi.threedee.utilities.average_atom_positions as ftua
+import forgi.threedee.utilities.average_stem_vres_atom_positions as ftus
 import forgi.utilities.debug as fud
+from forgi.utilities.stuff import make_temp_directory
 
 
 class AverageAtomPositionsTest(unittest.TestCase):
@@ -16,3 +23,51 @@ def test_key1(self):
         avg_atom_poss = json.loads(data.decode('ascii'))
 
         self.assertTrue(key in avg_atom_poss.keys())
+
+
+class AverageAtomTableTest(unittest.TestCase):
+    def setUp(self):
+        self.avg_atom_poss = {
+            "h 3 -1 0 0 C1'": [1., 2., 3.],
+            "h 3 -1 0 2 A.N1": [4., 5., 6.],
+            "h 3 -1 0 0 P": [7., 8., 9.],
+            "i 1 2 -3 1 C1'": [-1., -2., -3.],
+            "m 2 1000 5 0 O4'": [0., 0., 1.],
+        }
+
+    def assert_table_equals_dict(self, table):
+        for key, coords in self.avg_atom_poss.items():
+            nptest.assert_array_equal(table[key], coords)
+        with self.assertRaises(KeyError):
+            table["h 3 -1 0 1 C1'"]
+        with self.assertRaises(KeyError):
+            table["h 4 -1 0 0 C1'"]
+
+    def test_from_dict(self):
+        table = ftua.AverageAtomTable.from_dict(self.avg_atom_poss)
+        self.assert_table_equals_dict(table)
+
+    def test_element_atoms(self):
+        table = ftua.AverageAtomTable.from_dict(self.avg_atom_poss)
+        positions, atoms, coords = table.element_atoms("h", (3, -1), 0)
+        self.assertEqual(coords.shape, (3, 3))
+        self.assertEqual(sorted(zip(positions, [table.atom_names[a] for a in atoms])),
+                         [(0, "C1'"), (0, "P"), (2, "A.N1")])
+        positions, atoms, coords = table.element_atoms("h", (5, -1), 0)
+        self.assertEqual(coords.shape, (0, 3))
+
+    def test_save_and_load_mmap(self):
+        with make_temp_directory() as tmpdir:
+            filename = os.path.join(tmpdir, "average_atom_positions.npz")
+            ftua.save_table(self.avg_atom_poss, filename)
+            table = ftua.AverageAtomTable.from_npz(filename)
+            self.assertIsInstance(table.coords, np.memmap)
+            self.assert_table_equals_dict(table)
+            del table
+
+    def test_stem_atom_positions(self):
+        atom_names = ["C1'", "P", "N9"]
+        coords = ftua.stem_atom_positions(1, "G", atom_names)
+        for aname, pos in zip(atom_names, coords):
+            nptest.assert_array_equal(
+                pos, ftus.avg_stem_vres_atom_coords[1]["G"][aname])
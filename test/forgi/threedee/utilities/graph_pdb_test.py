@@ -228,6 +228,36 @@ def test_virtual_residue_atom_exact_match(self):
         nptest.assert_allclose(vres['N2'], np.array(
             [6.91170703,  2.35440312, -1.92080436]))
 
+    def test_add_stems_virtual_residues_same_as_add_virtual_residues(self):
+        cg = ftmc.CoarseGrainRNA.from_bg_file(
+            'test/forgi/threedee/data/1GID_A.cg')
+        ref = ftmc.CoarseGrainRNA.from_bg_file(
+            'test/forgi/threedee/data/1GID_A.cg')
+        stems = list(cg.stem_iterator())
+        ftug.add_stems_virtual_residues(cg, stems)
+        for stem in stems:
+            ftug.add_virtual_residues(ref, stem)
+            self.assertEqual(sorted(cg.v3dposs[stem]), sorted(ref.v3dposs[stem]))
+            for i in ref.v3dposs[stem]:
+                nptest.assert_allclose(cg.v3dposs[stem][i], ref.v3dposs[stem][i],
+                                       atol=1e-9, rtol=0)
+                nptest.assert_allclose(cg.vposs[stem][i], ref.vposs[stem][i],
+                                       atol=1e-9, rtol=0)
+                nptest.assert_allclose(cg.vvecs[stem][i], ref.vvecs[stem][i],
+                                       atol=1e-9, rtol=0)
+                nptest.assert_allclose(cg.vbases[stem][i], ref.vbases[stem][i],
+                                       atol=1e-9, rtol=0)
+                nptest.assert_allclose(cg.vinvs[stem][i], ref.vinvs[stem][i],
+                                       atol=1e-9, rtol=0)
+
+    def test_add_stems_virtual_residues_missing_twists(self):
+        cg = ftmc.CoarseGrainRNA.from_bg_file(
+            'test/forgi/threedee/data/1GID_A.cg')
+        cg.twists["s1"] = [np.nan, np.nan, np.nan], [np.nan, np.nan, np.nan]
+        with self.assertRaises(ValueError):
+            ftug.add_stems_virtual_residues(cg, list(cg.stem_iterator()))
+        self.assertNotIn("s0", cg.v3dposs)
+
 
 class TestOrientation(unittest.TestCase):
     def setUp(self):
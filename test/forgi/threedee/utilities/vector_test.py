@@ -55,6 +55,61 @@ def test_line_segment_distance_real_world(self):
         self.assertLess(ftuv.vec_distance(
             *ftuv.line_segment_distance(a0, a1, b0, b1)), 25)
 
+    def test_line_segment_distance_point(self):
+        a0 = np.array([0., 0., 0.])
+        a1 = np.array([0., 0., 10.])
+        p = np.array([3., 0., 5.])
+        i1, i2 = ftuv.line_segment_distance(a0, a1, p, p)
+        nptest.assert_almost_equal(i1, [0, 0, 5])
+        nptest.assert_almost_equal(i2, p)
+        i1, i2 = ftuv.line_segment_distance(p, p, a0, a1)
+        nptest.assert_almost_equal(i1, p)
+        nptest.assert_almost_equal(i2, [0, 0, 5])
+
+
+class TestSegmentDistances(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(1)
+        self.a0 = rng.normal(0, 10, (100, 3))
+        self.a1 = self.a0 + rng.normal(0, 10, (100, 3))
+        self.b0 = rng.normal(0, 10, (100, 3))
+        self.b1 = self.b0 + rng.normal(0, 10, (100, 3))
+        # Parallel segments, points and identical segments
+        self.b1[:10] = self.b0[:10] + (self.a1[:10] - self.a0[:10]) * 0.5
+        self.b1[10:20] = self.b0[10:20]
+        self.a1[20:30] = self.a0[20:30]
+        self.b0[30:40] = self.a0[30:40]
+        self.b1[30:40] = self.a1[30:40]
+
+    def test_segment_distances_like_line_segment_distance(self):
+        i1, i2, dists = ftuv.segment_distances(
+            self.a0, self.a1, self.b0, self.b1)
+        for j in range(100):
+            p1, p2 = ftuv.line_segment_distance(
+                self.a0[j], self.a1[j], self.b0[j], self.b1[j])
+            nptest.assert_almost_equal(i1[j], p1)
+            nptest.assert_almost_equal(i2[j], p2)
+            self.assertAlmostEqual(dists[j], ftuv.vec_distance(p1, p2))
+
+    def test_segment_distances_parallel(self):
+        _, _, dists = ftuv.segment_distances([[0, 0, 1.], [0, 0, 1.]],
+                                             [[0, 0, 10.], [0, 0, 10.]],
+                                             [[0, 0, 11.], [0, 1, 3.]],
+                                             [[0, 0, 20.], [0, 1, 4.]])
+        nptest.assert_almost_equal(dists, [1., 1.])
+
+    def test_segment_distance_matrix(self):
+        expected = np.array([[ftuv.vec_distance(*ftuv.line_segment_distance(
+            self.a0[i], self.a1[i], self.b0[j], self.b1[j]))
+            for j in range(30)] for i in range(20)])
+        for chunk_size in [1, 7, 30, 1000]:
+            dists = ftuv.segment_distance_matrix(self.a0[:20], self.a1[:20],
+                                                 self.b0[:30], self.b1[:30],
+                                                 chunk_size=chunk_size)
+            nptest.assert_almost_equal(dists, expected)
+        self.assertEqual(ftuv.segment_distance_matrix(
+            self.a0, self.a1, self.b0[:0], self.b1[:0]).shape, (100, 0))
+
 
 class TestLineSegmentCollinearity(unittest.TestCase):
 
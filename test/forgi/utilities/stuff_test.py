@@ -65,6 +65,35 @@ def test_dotbracket_to_pairtable3(self):
         with self.assertRaises(ValueError):
             pt = fus.dotbracket_to_pairtable(db)
 
+    def test_dotbrackets_to_pairtable_array(self):
+        dbs = ["((..))..", "(.)&(...)", "([)]....", "........"]
+        pts = fus.dotbrackets_to_pairtable_array(dbs)
+        self.assertEqual(pts.shape, (4, 9))
+        for db, pt in zip(dbs, pts):
+            self.assertEqual(pt.tolist(), fus.dotbracket_to_pairtable(db))
+        self.assertEqual(pts[2].tolist(), [8, 3, 4, 1, 2, 0, 0, 0, 0])
+
+    def test_dotbrackets_to_pairtable_array_errors(self):
+        with self.assertRaises(ValueError):
+            fus.dotbrackets_to_pairtable_array(["((..))", "(....)."])
+        with self.assertRaises(ValueError):
+            fus.dotbrackets_to_pairtable_array(["((..))", "((..)("])
+        with self.assertRaises(ValueError):
+            fus.dotbrackets_to_pairtable_array(["((..))", "(..)))"])
+        with self.assertRaises(ValueError):
+            fus.dotbrackets_to_pairtable_array(["((..))", "((..)!"])
+
+    def test_long_structures(self):
+        # Deep nesting must not hit the recursion limit.
+        n = 200000
+        db = "(" * n + "..." + ")" * n + "." + "(.)" * n
+        pt = fus.dotbracket_to_pairtable(db)
+        self.assertEqual(pt[1], 2 * n + 3)
+        self.assertEqual(fus.pairtable_to_dotbracket(pt), db)
+        elements = fus.pairtable_to_elements(pt, 0, 1, pt[0])
+        self.assertEqual(elements[0][:2], ['s', n])
+        self.assertEqual(len(elements), 2 * n + 3)
+
     def test_pairtable_to_tuples(self):
         """
         Convert a pairtable to base pair tuples.
@@ -6,9 +6,13 @@
 except ImportError:
     from StringIO import StringIO
 
+import os.path
+
 import forgi.utilities.commandline_utils as fuc
 import forgi.threedee.model.coarse_grain as ftmc
 import forgi.graph.bulge_graph as fgb
+from forgi.utilities.exceptions import GraphConstructionError
+from forgi.utilities.stuff import make_temp_directory
 
 
 class TestCommanldineUtils(unittest.TestCase):
@@ -80,6 +84,70 @@ def test_load_fasta_cleaning_sec_stru(self):
                            False, dissolve_length_one_stems=True)
         self.assertLess(len(bg2.defines), len(bg.defines))
 
+    def test_load_fasta_lazy(self):
+        bgs = fuc.load_rna("test/forgi/data/pk.fa", "bg", True, lazy=True)
+        self.assertFalse(isinstance(bgs, list))
+        bg, = bgs
+        bg2, = fuc.load_rna("test/forgi/data/pk.fa", "bg", True)
+        self.assertEqual(bg.defines, bg2.defines)
+
+    def test_cgs_from_args_lazy(self):
+        parser = fuc.get_rna_input_parser("Test", "+", enable_logging=False)
+        args = parser.parse_args(["test/forgi/data/pk.fa", "((..))"])
+        rnas = fuc.cgs_from_args(args, enable_logging=False, lazy=True,
+                                 return_filenames=True)
+        self.assertEqual([fn for rna, fn in rnas],
+                         ["test/forgi/data/pk.fa", "((..))"])
+
+    def test_load_rnas_parallel_keeps_order(self):
+        filenames = ["test/forgi/threedee/data/1GID_A.cg", "((..))",
+                     "test/forgi/data/pk.fa", "(((...)))"]
+        rnas = list(fuc.load_rnas_parallel(filenames, 2, return_filenames=True,
+                                           rna_type="any"))
+        self.assertEqual([fn for rna, fn in rnas], filenames)
+        self.assertEqual([rna.name for rna, fn in rnas],
+                         ["1GID_A", "untitled", "PK", "untitled"])
+        self.assertEqual(rnas[3][0].to_dotbracket_string(), "(((...)))")
+
+    def test_load_rnas_parallel_generator(self):
+        filenames = ["((..))", "(((...)))"]
+        rnas = list(fuc.load_rnas_parallel((fn for fn in filenames), 2))
+        self.assertEqual([rna.to_dotbracket_string() for rna in rnas], filenames)
+
+    def test_load_rnas_parallel_errors(self):
+        filenames = ["((..))&((..))", "(((...)))"]
+        with self.assertRaises(GraphConstructionError):
+            list(fuc.load_rnas_parallel(filenames, 2))
+        rnas = list(fuc.load_rnas_parallel(filenames, 2, skip_errors=True))
+        self.assertEqual(len(rnas), 1)
+        self.assertEqual(rnas[0].to_dotbracket_string(), "(((...)))")
+
+    def test_cgs_from_args_jobs(self):
+        parser = fuc.get_rna_input_parser("Test", "+", enable_logging=False)
+        args = parser.parse_args(["--jobs", "2", "test/forgi/data/pk.fa",
+                                  "((..))", "((..))&((..))"])
+        rnas, filenames = fuc.cgs_from_args(args, enable_logging=False,
+                                            return_filenames=True,
+                                            skip_errors=True)
+        self.assertEqual(filenames, ["test/forgi/data/pk.fa", "((..))"])
+        self.assertEqual(len(rnas), 2)
+
+    def test_jobs_with_single_file(self):
+        parser = fuc.get_rna_input_parser("Test", 1, enable_logging=False)
+        args = parser.parse_args(["--jobs", "2", "((..))"])
+        rnas = fuc.cgs_from_args(args, enable_logging=False)
+        self.assertEqual([rna.to_dotbracket_string() for rna in rnas], ["((..))"])
+
+    def test_load_rna_binary_cg(self):
+        cg = ftmc.CoarseGrainRNA.from_bg_file("test/forgi/threedee/data/1GID_A.cg")
+        with make_temp_directory() as d:
+            filename = os.path.join(d, "1GID_A.cgb")
+            cg.to_binary_file(filename)
+            cg2 = fuc.load_rna(filename, "only_cg", False)
+        self.assertEqual(cg2.name, "1GID_A")
+        self.assertEqual(cg2.defines, cg.defines)
+        self.assertEqual(cg2.coords, cg.coords)
+
     def test_sniff_malformed_file(self):
         file = StringIO("\n>fasta header\nAAAGGGCCC\n.........")
         self.assertEqual(fuc.sniff_filetype(file), "fasta")